@@ -22,6 +22,15 @@ except ImportError:
             "Could not import Base from models.py or database.py. Check import paths."
         )
 
+# マイグレーションの手書きSQLやアプリが作成する、モデルに対応しないテーブル
+# (FTS5 の検索インデックス、永続化用の変更ログ) は autogenerate の比較対象から外す
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and reflected and compare_to is None:
+        if name.startswith("_changelog") or "_fts" in name:
+            return False
+    return True
+
+
 # Alembic Configオブジェクト
 config = context.config
 
@@ -73,6 +82,7 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
         compare_type=True,  # 型の比較を有効化
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -94,6 +104,7 @@ def run_migrations_online() -> None:
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,  # 型の比較を有効化
+            include_object=include_object,
             # include_schemas=True # マルチスキーマの場合に必要
         )
 
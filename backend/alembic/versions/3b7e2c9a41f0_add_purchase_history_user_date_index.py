@@ -0,0 +1,33 @@
+"""Add purchase_history (user_id, purchase_date DESC, id) index
+
+Revision ID: 3b7e2c9a41f0
+Revises: d85a63f38454
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e2c9a41f0'
+down_revision: Union[str, None] = 'd85a63f38454'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_purchase_history_user_id_purchase_date',
+        'purchase_history',
+        ['user_id', sa.text('purchase_date DESC'), 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_purchase_history_user_id_purchase_date', table_name='purchase_history')
@@ -0,0 +1,56 @@
+"""Add FTS5 trigram search index for products and users
+
+Revision ID: 8f1d4a6b2c35
+Revises: 3b7e2c9a41f0
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f1d4a6b2c35'
+down_revision: Union[str, None] = '3b7e2c9a41f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# FTS テーブル名 -> (元テーブル, 検索する列)
+FTS_TABLES = {
+    'products_fts': ('products', 'name'),
+    'users_fts': ('users', 'name'),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for fts_table, (source_table, column) in FTS_TABLES.items():
+        op.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+            f"{column}, content='{source_table}', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column} ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+        )
+        # 既存データをインデックスに登録する
+        op.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for fts_table in FTS_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {fts_table}_ai")
+        op.execute(f"DROP TRIGGER IF EXISTS {fts_table}_ad")
+        op.execute(f"DROP TRIGGER IF EXISTS {fts_table}_au")
+        op.execute(f"DROP TABLE IF EXISTS {fts_table}")
@@ -0,0 +1,39 @@
+"""Add suggestion_cache table
+
+Revision ID: c41e9f07d2a8
+Revises: 8f1d4a6b2c35
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e9f07d2a8'
+down_revision: Union[str, None] = '8f1d4a6b2c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'suggestion_cache',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('cache_key', sa.String(length=64), nullable=False),
+        sa.Column('provider', sa.String(), nullable=True),
+        sa.Column('model', sa.String(), nullable=True),
+        sa.Column('season', sa.String(), nullable=True),
+        sa.Column('suggestions_text', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('suggestion_cache')
@@ -0,0 +1,240 @@
+"""
+SQLite の行単位の変更履歴 (changeset) を扱うモジュール。
+
+各テーブルに INSERT/UPDATE/DELETE トリガーを張り、変更された行を _changelog テーブルへ
+JSON で記録する。ORM経由でもCore の insert() 経由でも同じように記録されるので、
+database.py はここから未送信の変更を読み出して小さなセグメントとしてストレージへ送る。
+起動時は、ダウンロードしたスナップショットにセグメントを順に適用 (replay) して最新状態に戻す。
+
+関数はすべて同期 (sqlite3) なので、非同期コードからは asyncio.to_thread 経由で呼び出す。
+"""
+import json
+import sqlite3
+from typing import Any
+
+CHANGELOG_TABLE = "_changelog"
+TRIGGER_PREFIX = "_changelog_"
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [row["name"] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")]
+
+
+def _tracked_tables(conn: sqlite3.Connection, metadata) -> dict[str, tuple[str, list[str]]]:
+    """変更を記録するテーブル -> (主キー列, 列リスト)。単一列の主キーを持ち、DBに存在するものだけ"""
+    tables = {}
+    for table in metadata.sorted_tables:
+        pk_columns = list(table.primary_key.columns)
+        if len(pk_columns) != 1:
+            continue
+        existing = _table_columns(conn, table.name)
+        if not existing:
+            continue
+        columns = [c.name for c in table.columns if c.name in existing]
+        tables[table.name] = (pk_columns[0].name, columns)
+    return tables
+
+
+def _ensure_changelog_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "tbl TEXT NOT NULL, "
+        "op TEXT NOT NULL, " # 'U' = upsert (行全体), 'D' = delete
+        "pk INTEGER NOT NULL, "
+        "row TEXT)"
+    )
+
+
+def install(db_path: str, metadata) -> list[str]:
+    """_changelog テーブルと変更記録トリガーを作成する。記録対象のテーブル名を返す"""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _ensure_changelog_table(conn)
+            _drop_triggers(conn)
+            tables = _tracked_tables(conn, metadata)
+            for table, (pk, columns) in tables.items():
+                t, q_pk = _quote(table), _quote(pk)
+                json_args = ", ".join(f"'{c}', NEW.{_quote(c)}" for c in columns)
+                insert_upsert = (
+                    f"INSERT INTO {CHANGELOG_TABLE}(tbl, op, pk, row) "
+                    f"VALUES ('{table}', 'U', NEW.{q_pk}, json_object({json_args}));"
+                )
+                conn.execute(
+                    f"CREATE TRIGGER {_quote(TRIGGER_PREFIX + table + '_insert')} "
+                    f"AFTER INSERT ON {t} BEGIN {insert_upsert} END"
+                )
+                conn.execute(
+                    f"CREATE TRIGGER {_quote(TRIGGER_PREFIX + table + '_update')} "
+                    f"AFTER UPDATE ON {t} BEGIN "
+                    # 主キー自体が変わった場合は旧キーの削除も記録する
+                    f"INSERT INTO {CHANGELOG_TABLE}(tbl, op, pk, row) "
+                    f"SELECT '{table}', 'D', OLD.{q_pk}, NULL WHERE OLD.{q_pk} IS NOT NEW.{q_pk}; "
+                    f"{insert_upsert} END"
+                )
+                conn.execute(
+                    f"CREATE TRIGGER {_quote(TRIGGER_PREFIX + table + '_delete')} "
+                    f"AFTER DELETE ON {t} BEGIN "
+                    f"INSERT INTO {CHANGELOG_TABLE}(tbl, op, pk, row) VALUES ('{table}', 'D', OLD.{q_pk}, NULL); END"
+                )
+        return list(tables)
+    finally:
+        conn.close()
+
+
+def _drop_triggers(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for row in rows:
+        if row["name"].startswith(TRIGGER_PREFIX):
+            conn.execute(f"DROP TRIGGER IF EXISTS {_quote(row['name'])}")
+
+
+def uninstall(db_path: str) -> None:
+    """変更記録トリガーを削除する (スナップショットモードで _changelog が肥大化しないように)"""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _drop_triggers(conn)
+    finally:
+        conn.close()
+
+
+def _current_seq(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (CHANGELOG_TABLE,)).fetchone()
+    except sqlite3.OperationalError: # sqlite_sequence がまだない
+        return 0
+    return int(row["seq"]) if row else 0
+
+
+def current_seq(db_path: str) -> int:
+    """このDBファイルに反映済みの最新の変更番号 (記録がなければ 0)"""
+    conn = _connect(db_path)
+    try:
+        return _current_seq(conn)
+    finally:
+        conn.close()
+
+
+def read_pending(db_path: str, limit: int | None = None) -> list[dict[str, Any]]:
+    """まだストレージへ送っていない変更を古い順に返す"""
+    conn = _connect(db_path)
+    try:
+        sql = f"SELECT seq, tbl, op, pk, row FROM {CHANGELOG_TABLE} ORDER BY seq"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        try:
+            rows = conn.execute(sql).fetchall()
+        except sqlite3.OperationalError: # _changelog がまだない
+            return []
+        return [
+            {
+                "seq": row["seq"],
+                "table": row["tbl"],
+                "op": row["op"],
+                "pk": row["pk"],
+                "row": json.loads(row["row"]) if row["row"] is not None else None,
+            }
+            for row in rows
+        ]
+    finally:
+        conn.close()
+
+
+def mark_shipped(db_path: str, last_seq: int) -> None:
+    """last_seq までの変更を送信済みとして _changelog から削除する"""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM {CHANGELOG_TABLE} WHERE seq <= ?", (last_seq,))
+    finally:
+        conn.close()
+
+
+def rebase_pending(db_path: str, after_seq: int) -> int:
+    """
+    未送信の変更の番号を after_seq より後に付け直す (他のインスタンスが同じ番号までのセグメントやベースを
+    書き込んでいた場合に、その上に積み直すため)。付け直した後の反映済み変更番号を返す。
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _ensure_changelog_table(conn)
+            row = conn.execute(f"SELECT MIN(seq) AS first, MAX(seq) AS last FROM {CHANGELOG_TABLE}").fetchone()
+            current = _current_seq(conn)
+            if row["first"] is None:
+                _set_seq(conn, max(current, after_seq))
+                return max(current, after_seq)
+            if row["first"] > after_seq:
+                return current
+            # 付け直した番号が元の番号と重ならないよう、元の最大値より後ろにずらす
+            offset = max(after_seq, row["last"]) + 1 - row["first"]
+            conn.execute(f"UPDATE {CHANGELOG_TABLE} SET seq = seq + ?", (offset,))
+            _set_seq(conn, row["last"] + offset)
+            return row["last"] + offset
+    finally:
+        conn.close()
+
+
+def apply_changes(db_path: str, changes: list[dict[str, Any]]) -> int:
+    """
+    セグメントの変更を順に適用する。このファイルに反映済みの変更番号以下のものは読み飛ばす。
+    upsert/delete の順次適用なので、同じ変更を2回適用しても結果は変わらない。
+    適用後の反映済み変更番号を返す。
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _ensure_changelog_table(conn)
+            applied_seq = _current_seq(conn)
+            seq_before_replay = applied_seq
+            columns_cache: dict[str, list[str]] = {}
+            pk_cache: dict[str, str] = {}
+            for change in changes:
+                if change["seq"] <= applied_seq:
+                    continue
+                table = change["table"]
+                if table not in columns_cache:
+                    columns_cache[table] = _table_columns(conn, table)
+                    pk_rows = [r for r in conn.execute(f"PRAGMA table_info({_quote(table)})") if r["pk"]]
+                    pk_cache[table] = pk_rows[0]["name"] if pk_rows else "id"
+                pk = pk_cache[table]
+                if change["op"] == "D":
+                    conn.execute(f"DELETE FROM {_quote(table)} WHERE {_quote(pk)} = ?", (change["pk"],))
+                else:
+                    row = {k: v for k, v in change["row"].items() if k in columns_cache[table]}
+                    cols = list(row)
+                    updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in cols if c != pk)
+                    conn.execute(
+                        f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in cols)}) "
+                        f"VALUES ({', '.join('?' for _ in cols)}) "
+                        f"ON CONFLICT({_quote(pk)}) DO "
+                        + (f"UPDATE SET {updates}" if updates else "NOTHING"),
+                        [row[c] for c in cols],
+                    )
+                applied_seq = change["seq"]
+            # replay 中にトリガーが記録した行は送信不要なので消し、採番をリモートの番号に合わせる
+            conn.execute(f"DELETE FROM {CHANGELOG_TABLE} WHERE seq > ?", (seq_before_replay,))
+            _set_seq(conn, applied_seq)
+        return applied_seq
+    finally:
+        conn.close()
+
+
+def _set_seq(conn: sqlite3.Connection, seq: int) -> None:
+    updated = conn.execute(
+        "UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (seq, CHANGELOG_TABLE)
+    ).rowcount
+    if not updated:
+        conn.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?, ?)", (CHANGELOG_TABLE, seq))
@@ -1,8 +1,49 @@
+import base64
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select # select をインポート
-from sqlalchemy.orm import selectinload # selectinload をインポート
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import select, insert, or_, text, table, column, literal, literal_column, func, distinct, case, exists # select をインポート
 import models
 import schemas
+import search_index
+import profiling
+import serialization
+from product_cache import normalize_name, product_cache
+from recommender import recommender
+from repurchase import predictor
+
+logger = logging.getLogger(__name__)
+
+# --- 全文検索 (FTS5) ---
+# DBに存在する FTS テーブル名 (初回の検索時に確認してキャッシュする)
+_fts_tables: set[str] | None = None
+
+async def _fts_available(db: AsyncSession, fts_table: str) -> bool:
+    """FTS テーブルが作成済みか (マイグレーション未適用のDBでは LIKE 検索にフォールバックする)"""
+    global _fts_tables
+    if _fts_tables is None:
+        result = await db.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('products_fts', 'users_fts')")
+        )
+        _fts_tables = set(result.scalars().all())
+    return fts_table in _fts_tables
+
+async def _fts_search(db: AsyncSession, model, fts_table: str, query: str, limit: int) -> list | None:
+    """FTS で部分一致検索し、関連度順 (bm25) に返す。FTS が使えない場合は None"""
+    if len(query) < search_index.MIN_QUERY_LENGTH or not await _fts_available(db, fts_table):
+        return None
+    fts = table(fts_table, column("rowid"), column("rank"))
+    statement = (
+        select(model)
+        .join(fts, fts.c.rowid == model.id)
+        .where(literal_column(fts_table).op("MATCH")(search_index.match_expression(query)))
+        .order_by(fts.c.rank)
+        .limit(limit)
+    )
+    result = await db.execute(statement)
+    return result.scalars().all()
 
 # --- User CRUD ---
 async def get_user(db: AsyncSession, user_id: int) -> models.User | None:
@@ -24,14 +65,16 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User
         user_data = user.model_dump()
     except AttributeError:
         user_data = user.dict()
-    db_user = models.User(**user_data)
-    db.add(db_user)
+    # INSERT ... RETURNING で登録と読み戻しを1回の問い合わせで行う (コミット後の refresh は不要)
+    db_user = (await db.scalars(insert(models.User).values(**user_data).returning(models.User))).one()
     await db.commit()
-    await db.refresh(db_user)
     return db_user
 
 async def search_users_by_name(db: AsyncSession, query: str, limit: int = 10) -> list[models.User]:
-    """指定された文字列を名前に含むユーザーを検索する (部分一致、大文字小文字区別なし)"""
+    """指定された文字列を名前に含むユーザーを検索する (部分一致、大文字小文字区別なし。3文字以上は関連度順)"""
+    users = await _fts_search(db, models.User, "users_fts", query, limit)
+    if users is not None:
+        return users
     search = f"%{query}%"
     statement = select(models.User).where(models.User.name.ilike(search)).limit(limit)
     result = await db.execute(statement)
@@ -44,53 +87,409 @@ async def get_product(db: AsyncSession, product_id: int) -> models.Product | Non
     result = await db.execute(statement)
     return result.scalar_one_or_none()
 
+async def get_product_cached(db: AsyncSession, product_id: int) -> schemas.Product | None:
+    """指定されたIDの商品を取得する (キャッシュにあればDBに問い合わせない)"""
+    cached = product_cache.get(product_id)
+    if cached is not None:
+        return cached
+    db_product = await get_product(db, product_id)
+    return product_cache.put(db_product) if db_product is not None else None
+
+async def get_product_by_name(db: AsyncSession, name: str) -> schemas.Product | None:
+    """指定された名前 (全角・半角、大文字・小文字の違いは無視) の商品を取得する"""
+    cached = product_cache.get_by_name(name)
+    if cached is not None:
+        return cached
+    if product_cache.complete:
+        return None
+    # キャッシュにない商品がある場合。名前の正規化はSQLではできないので、商品名を読んで同じ正規化で比べる
+    normalized = normalize_name(name)
+    result = await db.execute(select(models.Product.id, models.Product.name).order_by(models.Product.id))
+    for product_id, product_name in result:
+        if product_name is not None and normalize_name(product_name) == normalized:
+            return await get_product_cached(db, product_id)
+    return None
+
+async def get_products_by_ids(db: AsyncSession, product_ids) -> dict[int, schemas.Product]:
+    """複数の商品をまとめて取得する。キャッシュにないものだけを1回のクエリで読み込む"""
+    products: dict[int, schemas.Product] = {}
+    missing = []
+    for product_id in set(product_ids):
+        cached = product_cache.get(product_id)
+        if cached is not None:
+            products[product_id] = cached
+        else:
+            missing.append(product_id)
+    if missing:
+        result = await db.execute(select(models.Product).where(models.Product.id.in_(missing)))
+        for db_product in result.scalars():
+            products[db_product.id] = product_cache.put(db_product)
+    return products
+
+async def warm_product_cache(db: AsyncSession) -> int:
+    """商品キャッシュを上限件数まで読み込んでおく (アプリ起動時)。読み込んだ件数を返す"""
+    statement = select(models.Product).order_by(models.Product.id).limit(product_cache.max_entries)
+    result = await db.execute(statement)
+    count = 0
+    for db_product in result.scalars():
+        product_cache.put(db_product)
+        count += 1
+    # 上限に達していなければ、すべての商品を読み込めた
+    product_cache.complete = count < product_cache.max_entries
+    return count
+
 async def create_product(db: AsyncSession, product: schemas.ProductCreate) -> models.Product:
     """新しい商品を作成する"""
     try:
         product_data = product.model_dump()
     except AttributeError:
         product_data = product.dict()
-    db_product = models.Product(**product_data)
-    db.add(db_product)
+    db_product = (await db.scalars(insert(models.Product).values(**product_data).returning(models.Product))).one()
     await db.commit()
-    await db.refresh(db_product)
+    product_cache.put(db_product)
     return db_product
 
 async def search_products_by_name(db: AsyncSession, query: str, limit: int = 10) -> list[models.Product]:
-    """指定された文字列を名前に含む商品を検索する (部分一致、大文字小文字区別なし)"""
+    """指定された文字列を名前に含む商品を検索する (部分一致、大文字小文字区別なし。3文字以上は関連度順)"""
+    products = await _fts_search(db, models.Product, "products_fts", query, limit)
+    if products is not None:
+        return products
     search = f"%{query}%"
     statement = select(models.Product).where(models.Product.name.ilike(search)).limit(limit)
     result = await db.execute(statement)
     return result.scalars().all()
 
 # --- PurchaseHistory CRUD ---
-async def create_purchase_history(db: AsyncSession, purchase: schemas.PurchaseHistoryCreate) -> models.PurchaseHistory:
-    """購入履歴をデータベースに登録する"""
-    try:
-        # スキーマに quantity がないことを想定
-        purchase_data = purchase.model_dump()
-    except AttributeError:
-        purchase_data = purchase.dict()
-    db_purchase = models.PurchaseHistory(**purchase_data)
-    db.add(db_purchase)
+async def create_purchase_history(db: AsyncSession, purchase: schemas.PurchaseHistoryCreate) -> schemas.PurchaseHistory | None:
+    """
+    購入履歴をデータベースに登録する。
+    ユーザーが存在するかは INSERT ... SELECT ... WHERE EXISTS で登録と同じ文の中で確認し、
+    登録した行は RETURNING で受け取る。商品はキャッシュから取得してレスポンスに含める。
+    ユーザーまたは商品が存在しない場合は何も登録せず None を返す
+    """
+    product = await get_product_cached(db, product_id=purchase.product_id) # キャッシュにあればDBに問い合わせない
+    if product is None:
+        return None
+    purchase_date = literal(purchase.purchase_date, models.PurchaseHistory.purchase_date.type)
+    statement = (
+        insert(models.PurchaseHistory)
+        .from_select(
+            ["user_id", "product_id", "purchase_date"],
+            select(literal(purchase.user_id), literal(purchase.product_id), purchase_date)
+            .where(exists().where(models.User.id == purchase.user_id)),
+        )
+        .returning(models.PurchaseHistory.id, models.PurchaseHistory.purchase_date)
+    )
+    row = (await db.execute(statement)).one_or_none()
     await db.commit()
-    await db.refresh(db_purchase)
-    # 関連オブジェクトをリフレッシュ後に読み込む (任意だが役立つ場合がある)
-    await db.refresh(db_purchase, attribute_names=['product', 'owner'])
-    return db_purchase
+    if row is None:
+        return None
+    # おすすめ (共起) と購入周期の予測にも反映する
+    recommender.add_purchase(purchase.user_id, purchase.product_id, row.purchase_date)
+    predictor.add_purchase(purchase.user_id, purchase.product_id, row.purchase_date)
+    return schemas.PurchaseHistory(
+        id=row.id,
+        user_id=purchase.user_id,
+        product_id=purchase.product_id,
+        purchase_date=row.purchase_date,
+        product=product,
+    )
+
+async def create_purchase_histories_batch(
+    db: AsyncSession, purchases: list[schemas.PurchaseHistoryCreate]
+) -> schemas.PurchaseBatchResult:
+    """
+    複数の購入履歴を1つのトランザクションで登録する。
+    ユーザーと商品の存在確認はそれぞれ1回のクエリ (商品はキャッシュにないものだけ) で行い、
+    存在しないユーザー・商品を含む項目はエラーとして返し、残りの項目だけを登録する
+    """
+    user_ids = {purchase.user_id for purchase in purchases}
+    result = await db.execute(select(models.User.id).where(models.User.id.in_(user_ids)))
+    existing_users = set(result.scalars())
+    products = await get_products_by_ids(db, (purchase.product_id for purchase in purchases))
+
+    errors = []
+    valid = []
+    for index, purchase in enumerate(purchases):
+        if purchase.user_id not in existing_users:
+            detail = "User not found"
+        elif purchase.product_id not in products:
+            detail = "Product not found"
+        else:
+            valid.append(purchase)
+            continue
+        errors.append(schemas.PurchaseBatchError(
+            index=index, user_id=purchase.user_id, product_id=purchase.product_id, detail=detail
+        ))
+    if not valid:
+        return schemas.PurchaseBatchResult(errors=errors)
+
+    # 複数行の VALUES を持つ1つの INSERT ... RETURNING で登録する。
+    # 1つの文の中ではIDが行の順に採番されるので、ID順に並べればリクエストの順になる
+    statement = (
+        insert(models.PurchaseHistory)
+        .values([
+            {"user_id": purchase.user_id, "product_id": purchase.product_id, "purchase_date": purchase.purchase_date}
+            for purchase in valid
+        ])
+        .returning(
+            models.PurchaseHistory.id,
+            models.PurchaseHistory.user_id,
+            models.PurchaseHistory.product_id,
+            models.PurchaseHistory.purchase_date,
+        )
+    )
+    rows = sorted((await db.execute(statement)).all(), key=lambda row: row.id)
+    await db.commit()
+
+    created = []
+    for row in rows:
+        recommender.add_purchase(row.user_id, row.product_id, row.purchase_date)
+        predictor.add_purchase(row.user_id, row.product_id, row.purchase_date)
+        created.append(schemas.PurchaseHistory(
+            id=row.id,
+            user_id=row.user_id,
+            product_id=row.product_id,
+            purchase_date=row.purchase_date,
+            product=products[row.product_id],
+        ))
+    return schemas.PurchaseBatchResult(created=created, errors=errors)
 
-async def get_purchase_history(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> list[models.PurchaseHistory]:
-    """指定されたユーザーの購入履歴を取得する (商品情報も含む)"""
+async def load_purchase_models(db: AsyncSession) -> int:
+    """
+    購入履歴全体を1度読み込み、おすすめ (共起) と購入周期の予測を構築し直す (アプリ起動時)。
+    読み込んだ購入の件数を返す
+    """
+    recommender.clear()
+    statement = select(
+        models.PurchaseHistory.user_id, models.PurchaseHistory.product_id, models.PurchaseHistory.purchase_date
+    )
+    user_ids, product_ids, days = [], [], []
+    result = await db.stream(statement.execution_options(yield_per=10000))
+    async for partition in result.partitions():
+        for user_id, product_id, purchase_date in partition:
+            recommender.add_purchase(user_id, product_id, purchase_date)
+            user_ids.append(user_id)
+            product_ids.append(product_id)
+            days.append(purchase_date.toordinal())
+    predictor.build(user_ids, product_ids, days)
+    return len(user_ids)
+
+async def get_due_items(
+    db: AsyncSession, user_id: int, today: date | None = None, limit: int = 10, min_probability: float = 0.5
+) -> list[schemas.DueItem]:
+    """購入周期から見て、そろそろ買う時期の商品を確率の高い順に返す"""
+    if predictor.is_stale(user_id):
+        # 過去の日付の購入が追加されたユーザーは、購入履歴から計算し直す
+        result = await db.execute(
+            select(models.PurchaseHistory.product_id, models.PurchaseHistory.purchase_date)
+            .where(models.PurchaseHistory.user_id == user_id)
+        )
+        rows = result.all()
+        predictor.load_user(user_id, [row.product_id for row in rows], [row.purchase_date.toordinal() for row in rows])
+    due = predictor.due(user_id, today=today, limit=limit, min_probability=min_probability)
+    products = await get_products_by_ids(db, (item["product_id"] for item in due))
+    return [
+        schemas.DueItem(product=products[item["product_id"]], **item)
+        for item in due
+        if item["product_id"] in products
+    ]
+
+def encode_history_cursor(purchase_date: date, purchase_id: int) -> str:
+    """履歴ページの最後の行から、次ページ取得用の不透明なカーソル文字列を作る"""
+    raw = json.dumps([purchase_date.isoformat(), purchase_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str) -> tuple[date, int]:
+    """カーソル文字列を (購入日, 購入履歴ID) に戻す。不正な値なら ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        purchase_date_str, purchase_id = json.loads(raw)
+        return date.fromisoformat(purchase_date_str), int(purchase_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+async def _select_purchase_history(
+    db: AsyncSession, user_id: int, skip: int, limit: int, after: tuple[date, int] | None
+) -> list:
+    """購入履歴の (id, user_id, product_id, purchase_date) の行を新しい順に取得する"""
     statement = (
-        select(models.PurchaseHistory)
-        .options(selectinload(models.PurchaseHistory.product)) # Eager loading
+        select(
+            models.PurchaseHistory.id,
+            models.PurchaseHistory.user_id,
+            models.PurchaseHistory.product_id,
+            models.PurchaseHistory.purchase_date,
+        )
         .where(models.PurchaseHistory.user_id == user_id)
-        .order_by(models.PurchaseHistory.purchase_date.desc())
+    )
+    if after is not None:
+        # (purchase_date DESC, id ASC) の順で after より後ろの行。
+        # 購入日の範囲条件で複合インデックスを使い、同じ購入日の行だけIDで絞り込む
+        after_date, after_id = after
+        statement = statement.where(
+            models.PurchaseHistory.purchase_date <= after_date,
+            or_(models.PurchaseHistory.purchase_date < after_date, models.PurchaseHistory.id > after_id),
+        )
+    statement = (
+        statement
+        .order_by(models.PurchaseHistory.purchase_date.desc(), models.PurchaseHistory.id)
         .offset(skip)
         .limit(limit)
     )
     result = await db.execute(statement)
-    return result.scalars().all()
+    return result.all()
+
+async def _purchase_history_dicts(db: AsyncSession, rows) -> list[dict]:
+    products = await get_products_by_ids(db, (row.product_id for row in rows))
+    # 商品が削除された履歴は除外される
+    if profiling.PROFILING_ENABLED:
+        with profiling.phase("serialize"):
+            return serialization.purchase_history_rows(rows, products)
+    return serialization.purchase_history_rows(rows, products)
+
+async def get_purchase_history(
+    db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, after: tuple[date, int] | None = None
+) -> list[dict]:
+    """
+    指定されたユーザーの購入履歴を新しい順に取得する (商品情報も含む)
+    after (購入日, ID) を指定すると、その行より後ろから取得する (キーセットページネーション)
+    商品情報は商品キャッシュから付与し、キャッシュにない商品だけをまとめてDBから読み込む
+    行は schemas.PurchaseHistory と同じ形の辞書で返す (SQLの結果からそのまま組み立て、Pydanticモデルは作らない)
+    """
+    rows = await _select_purchase_history(db, user_id, skip, limit, after)
+    return await _purchase_history_dicts(db, rows)
+
+async def get_purchase_history_page(
+    db: AsyncSession, user_id: int, limit: int = 100, skip: int = 0, cursor: str | None = None
+) -> tuple[list[dict], str | None]:
+    """
+    購入履歴を1ページ分取得し、(履歴リスト, 次ページのカーソル) を返す。次ページがなければカーソルは None
+    cursor を指定した場合は skip を無視する
+    """
+    after = decode_history_cursor(cursor) if cursor else None
+    # 1件多く取得して次ページの有無を判定する。商品が削除された行を除外する前のSQLの行で判定し、
+    # カーソルも最後に読んだ行から作る (除外した行があっても次ページを取りこぼさない)
+    rows = await _select_purchase_history(db, user_id, 0 if after else skip, limit + 1, after)
+    if len(rows) <= limit:
+        return await _purchase_history_dicts(db, rows), None
+    rows = rows[:limit]
+    last_id, _, _, last_date = rows[-1]
+    return await _purchase_history_dicts(db, rows), encode_history_cursor(last_date, last_id)
+
+async def get_purchase_history_summary(db: AsyncSession, user_id: int) -> schemas.PurchaseHistorySummary:
+    """
+    ユーザーの全購入履歴を商品ごとに集計する (購入回数・最初と最後の購入日・平均購入間隔・カテゴリ別の割合)
+    集計はSQLで行い、商品情報は商品キャッシュから付与する
+    """
+    purchase_date = models.PurchaseHistory.purchase_date
+    distinct_days = func.count(distinct(purchase_date))
+    statement = (
+        select(
+            models.PurchaseHistory.product_id,
+            func.count().label("purchase_count"),
+            func.min(purchase_date).label("first_purchase_date"),
+            func.max(purchase_date).label("last_purchase_date"),
+            # 同じ日の重複購入は1回と数え、購入日と購入日の間隔の平均を取る
+            case(
+                (distinct_days > 1, (func.julianday(func.max(purchase_date)) - func.julianday(func.min(purchase_date))) / (distinct_days - 1)),
+                else_=None,
+            ).label("mean_interval_days"),
+        )
+        .where(models.PurchaseHistory.user_id == user_id)
+        .group_by(models.PurchaseHistory.product_id)
+    )
+    rows = (await db.execute(statement)).all()
+    products = await get_products_by_ids(db, (row.product_id for row in rows))
+
+    items = []
+    category_counts: dict[str, int] = {}
+    for row in rows:
+        product = products.get(row.product_id)
+        if product is None: # 商品が削除された履歴は除外する
+            continue
+        items.append(schemas.ProductPurchaseSummary(
+            product_id=row.product_id,
+            name=product.name,
+            category=product.category,
+            purchase_count=row.purchase_count,
+            first_purchase_date=row.first_purchase_date,
+            last_purchase_date=row.last_purchase_date,
+            mean_interval_days=round(row.mean_interval_days, 1) if row.mean_interval_days is not None else None,
+        ))
+        category = product.category or "未分類"
+        category_counts[category] = category_counts.get(category, 0) + row.purchase_count
+    items.sort(key=lambda item: (-item.purchase_count, -item.last_purchase_date.toordinal(), item.product_id))
+
+    total = sum(item.purchase_count for item in items)
+    return schemas.PurchaseHistorySummary(
+        user_id=user_id,
+        total_purchases=total,
+        first_purchase_date=min((item.first_purchase_date for item in items), default=None),
+        last_purchase_date=max((item.last_purchase_date for item in items), default=None),
+        category_shares={
+            category: round(count / total, 3)
+            for category, count in sorted(category_counts.items(), key=lambda kv: -kv[1])
+        },
+        products=items,
+    )
 
 # --- Suggestion CRUD ---
-# (将来実装)
+# 提案キャッシュのテーブルがあるか (初回の読み書き時に確認してキャッシュする)
+_suggestion_cache_exists: bool | None = None
+
+async def _suggestion_cache_available(db: AsyncSession) -> bool:
+    """suggestion_cache テーブルが作成済みか (マイグレーション c41e9f07d2a8 未適用のDBではキャッシュを使わない)"""
+    global _suggestion_cache_exists
+    if _suggestion_cache_exists is None:
+        result = await db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": models.SuggestionCache.__tablename__},
+        )
+        _suggestion_cache_exists = result.first() is not None
+        if not _suggestion_cache_exists:
+            logger.warning(
+                "Table suggestion_cache does not exist (run 'alembic upgrade head' on the DB). Suggestions are not cached."
+            )
+    return _suggestion_cache_exists
+
+def _utcnow() -> datetime:
+    # SQLite の DateTime はタイムゾーンを保持しないので、UTC の naive datetime で統一する
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+async def get_cached_suggestion(
+    db: AsyncSession, user_id: int, cache_key: str, max_age_seconds: int
+) -> models.SuggestionCache | None:
+    """キーが一致し、有効期限内のキャッシュ済み提案を返す (なければ、テーブルがなければ None)"""
+    if not await _suggestion_cache_available(db):
+        return None
+    result = await db.execute(
+        select(models.SuggestionCache).filter(
+            models.SuggestionCache.user_id == user_id,
+            models.SuggestionCache.cache_key == cache_key,
+            models.SuggestionCache.created_at >= _utcnow() - timedelta(seconds=max_age_seconds),
+        )
+    )
+    return result.scalars().first()
+
+def suggestion_cache_age_seconds(entry: models.SuggestionCache) -> float:
+    return round(max(0.0, (_utcnow() - entry.created_at).total_seconds()), 3)
+
+async def save_cached_suggestion(
+    db: AsyncSession, user_id: int, cache_key: str, provider: str, model: str, season: str, suggestions_text: str
+) -> bool:
+    """ユーザーの提案キャッシュを保存する (以前のキャッシュは置き換える)。テーブルがなければ保存せず False を返す"""
+    if not await _suggestion_cache_available(db):
+        return False
+    values = {
+        "cache_key": cache_key,
+        "provider": provider,
+        "model": model,
+        "season": season,
+        "suggestions_text": suggestions_text,
+        "created_at": _utcnow(),
+    }
+    stmt = sqlite_insert(models.SuggestionCache).values(user_id=user_id, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=["user_id"], set_=values)
+    await db.execute(stmt)
+    await db.commit()
+    return True
@@ -1,13 +1,24 @@
 import os
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
-from google.cloud import storage
-from google.cloud.exceptions import NotFound
 import asyncio
+import gzip
+import hashlib
+import json
+import sqlite3
+import time
+import uuid
 # import aiofiles # Unused import removed
 import logging # Use logging for better output
 
+import changelog
+import metrics
+import profiling
+import storage
+from storage import ObjectInfo, ObjectNotFound, PreconditionFailed
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -18,87 +29,1004 @@ BUCKET_NAME = os.getenv("STORAGE_BUCKET", "shopping-app-sqlite-db")
 DB_FILE_NAME = os.getenv("DB_FILE_NAME", "shopping_app.db")
 # Use /tmp explicitly for Cloud Run compatibility
 LOCAL_DB_PATH = f"/tmp/{DB_FILE_NAME}"
+# 指定するとGCSの代わりにローカルディレクトリへ保存する (開発・テスト用)
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR")
+# 保存先: gcs / local (LOCAL_STORAGE_DIR) / memory (プロセス内。テスト・ベンチマーク用)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local" if LOCAL_STORAGE_DIR else "gcs").lower()
+# このサイズ以上のファイルは分割して並列に転送する
+STORAGE_PARALLEL_THRESHOLD_BYTES = int(os.getenv("STORAGE_PARALLEL_THRESHOLD_BYTES", str(32 * 1024 * 1024)))
+STORAGE_CHUNK_BYTES = int(os.getenv("STORAGE_CHUNK_BYTES", str(8 * 1024 * 1024)))
+STORAGE_MAX_CONCURRENCY = int(os.getenv("STORAGE_MAX_CONCURRENCY", "8"))
+# 読み込んだ後にリモートのマニフェストが他から書き換えられていたら、そのまま上書きせずに読み直す
+# (他のインスタンスのアップロードならその上に積み直し、公開された別のDBなら上書きしない)
+DB_CONDITIONAL_UPLOADS = os.getenv("DB_CONDITIONAL_UPLOADS", "true").lower() in ("1", "true", "yes", "on")
+# ローカルDBの元になったリモートのオブジェクトと世代 (同じなら起動時のダウンロードを省く)
+LOCAL_SOURCE_PATH = f"{LOCAL_DB_PATH}.source.json"
+
+# 永続化モード
+# - snapshot: 変更のたびにDBファイル全体をアップロードする
+# - incremental: ベーススナップショット + 行単位の変更セグメントをアップロードし、定期的にベースへ統合 (compaction) する
+PERSISTENCE_MODE = os.getenv("DB_PERSISTENCE_MODE", "snapshot").lower()
+COMPACT_EVERY_SEGMENTS = int(os.getenv("DB_COMPACT_EVERY_SEGMENTS", "50"))
+COMPACT_MAX_SEGMENT_BYTES = int(os.getenv("DB_COMPACT_MAX_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+# ベーススナップショット (gzip圧縮) と、そのメタデータ・反映済みの変更番号を記録するマニフェスト、変更セグメントの置き場所。
+# スナップショットは毎回別の名前で書き込み、マニフェストの差し替えで切り替える (書き込み中・競合時も、
+# マニフェストが指すスナップショットは上書きされない)。SNAPSHOT_NAME は固定の名前だった以前の形式
+SNAPSHOT_NAME = f"{DB_FILE_NAME}.gz"
+SNAPSHOT_PREFIX = f"{DB_FILE_NAME}.snapshots/"
+MANIFEST_NAME = f"{DB_FILE_NAME}.manifest.json"
+SEGMENT_PREFIX = f"{DB_FILE_NAME}.segments/"
+SNAPSHOT_COMPRESS_LEVEL = int(os.getenv("DB_SNAPSHOT_COMPRESS_LEVEL", "6"))
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# オブジェクトストレージ (最初に使うときに作る。GCS の認証情報の探索もインポート時には行わない)
+_object_store: storage.ObjectStore | None = None
+_object_store_initialized = False
+
+
+def get_object_store() -> storage.ObjectStore | None:
+    """設定に応じたオブジェクトストレージ (設定が不正なら None)"""
+    global _object_store, _object_store_initialized
+    if not _object_store_initialized:
+        _object_store_initialized = True
+        try:
+            _object_store = storage.create_object_store(
+                STORAGE_BACKEND,
+                bucket_name=BUCKET_NAME,
+                local_dir=LOCAL_STORAGE_DIR,
+                parallel_threshold=STORAGE_PARALLEL_THRESHOLD_BYTES,
+                chunk_size=STORAGE_CHUNK_BYTES,
+                max_concurrency=STORAGE_MAX_CONCURRENCY,
+            )
+        except Exception as e:
+            logger.error(f"Failed to initialize object storage ({STORAGE_BACKEND}): {e}. Database persistence might fail.")
+    return _object_store
+
+
+# incremental モードの状態 (リモートのベース以降に積まれたセグメント数・サイズ)
+segments_since_base = 0
+segment_bytes_since_base = 0
+remote_base_exists = False
+# 最後に読み書きしたときのリモートのマニフェストの世代 (条件付きの書き込みに使う。0 は存在しなかったことを表す)
+# と、それが指すスナップショットの名前
+remote_manifest_generation: int | None = None
+remote_snapshot_name: str | None = None
+# 読み込んだDBの系統 (db_snapshot.py publish で公開するたびに変わる。通常のアップロードは引き継ぐ)
+remote_lineage: str | None = None
+# 公開された別のDBに差し替えられていたため、アップロードを止めている状態 (再起動するまで続く)
+persistence_conflict: dict | None = None
+# 他のインスタンスの書き込みの上に積み直した回数
+conflict_rebases = 0
+# ローカルDBにアップロードできなかった変更が残っている (次回の起動時にリモートのDBで上書きしない)
+local_unpublished = False
+
+
+def _segment_name(first_seq: int, last_seq: int) -> str:
+    return f"{SEGMENT_PREFIX}{first_seq:012d}-{last_seq:012d}.jsonl"
+
+
+def _segment_range(name: str) -> tuple[int, int]:
+    first, last = os.path.basename(name).removesuffix(".jsonl").split("-")
+    return int(first), int(last)
+
+
+def _read_manifest() -> tuple[dict | None, int]:
+    """マニフェストとその世代 (存在しなければ None, 0)"""
+    object_store = get_object_store()
+    info = object_store.stat(MANIFEST_NAME)
+    if info is None:
+        return None, 0
+    return json.loads(object_store.download_bytes(MANIFEST_NAME, info.generation)), info.generation
+
+
+def _snapshot_name(base_seq: int) -> str:
+    return f"{SNAPSHOT_PREFIX}{base_seq:012d}-{uuid.uuid4().hex[:8]}.gz"
+
+
+def _read_local_source() -> dict | None:
+    try:
+        with open(LOCAL_SOURCE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_local_source(source: dict) -> None:
+    with open(LOCAL_SOURCE_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(source, f)
+    os.replace(LOCAL_SOURCE_PATH + ".tmp", LOCAL_SOURCE_PATH)
+
+
+def _write_local_source(info: ObjectInfo | None) -> None:
+    """ローカルDBがリモートのどのオブジェクト・世代と同じ内容かを記録する (None なら記録を消す)"""
+    global local_unpublished
+    local_unpublished = False
+    if info is None:
+        if os.path.exists(LOCAL_SOURCE_PATH):
+            os.remove(LOCAL_SOURCE_PATH)
+        return
+    _save_local_source({"object": info.name, "generation": info.generation, "lineage": remote_lineage})
+
+
+def _same_source(local_source: dict | None, base: ObjectInfo | None) -> bool:
+    return (
+        local_source is not None and base is not None
+        and (local_source.get("object"), local_source.get("generation")) == (base.name, base.generation)
+    )
+
+
+def mark_local_unpublished() -> None:
+    """
+    アップロードできなかった変更がローカルDBに残っていることを記録する。
+    次回の起動時にリモートのDBが変わっていても、このDBをそのまま上書きしない (download_db_file_async を参照)
+    """
+    global local_unpublished
+    source = _read_local_source()
+    if source is None or source.get("unpublished"):
+        return
+    source["unpublished"] = True
+    _save_local_source(source)
+    local_unpublished = True
+
+
+def _clear_local_unpublished() -> None:
+    global local_unpublished
+    source = _read_local_source()
+    if source is not None and source.pop("unpublished", None):
+        _save_local_source(source)
+    local_unpublished = False
+
+
+def _set_aside_local_db() -> str:
+    """ローカルDBを (WAL の内容を反映してから) 別の名前に移して残し、そのパスを返す"""
+    aside_path = f"{LOCAL_DB_PATH}.unpublished-{int(time.time())}"
+    conn = sqlite3.connect(LOCAL_DB_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    os.replace(LOCAL_DB_PATH, aside_path)
+    _remove_sqlite_sidecars(LOCAL_DB_PATH)
+    _write_local_source(None)
+    return aside_path
+
+
+def set_local_db_path(path: str) -> None:
+    """
+    ダウンロード・アップロードに使うローカルDBのパスを変える (バッチ・CLI用)。
+    サーバーと同じ手順 (世代を確認したダウンロードと条件付きのアップロード) を別のファイルで行うときに使う。
+    エンジンは作り直さないので、DBには create_engines(path) で作ったエンジンで接続すること。
+    """
+    global LOCAL_DB_PATH, LOCAL_SOURCE_PATH
+    LOCAL_DB_PATH = os.path.abspath(path)
+    LOCAL_SOURCE_PATH = f"{LOCAL_DB_PATH}.source.json"
+
+
+def _remove_sqlite_sidecars(db_path: str) -> None:
+    """
+    DBファイルを置き換える前に、前のDBの -wal / -shm を削除する
+    (残っていると、クラッシュしたプロセスの WAL が新しいDBファイルに適用されて壊れることがある)
+    """
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+# --- スナップショット ---
+def _create_snapshot(db_path: str, snapshot_path: str) -> dict:
+    """
+    稼働中のDBから SQLite のオンラインバックアップAPIで一貫したコピーを作り、gzip で圧縮する。
+    スナップショットのメタデータ (変更番号・サイズ・チェックサム) を返す。
+    """
+    raw_path = snapshot_path + ".raw"
+    src = sqlite3.connect(db_path, timeout=30)
+    dst = sqlite3.connect(raw_path)
+    try:
+        # 1回の読み取りトランザクションでまとめてコピーする。
+        # 数ページずつのコピーは途中で他の接続が書き込むと最初からやり直しになり、
+        # 書き込みが続くと終わらないため使わない (ローカルディスク上のコピーなので短時間で済む)
+        src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+
+    try:
+        base_seq = changelog.current_seq(raw_path)
+        sha256 = hashlib.sha256()
+        raw_size = 0
+        with open(raw_path, "rb") as f, gzip.open(snapshot_path, "wb", compresslevel=SNAPSHOT_COMPRESS_LEVEL) as gz:
+            while chunk := f.read(COPY_CHUNK_SIZE):
+                sha256.update(chunk)
+                raw_size += len(chunk)
+                gz.write(chunk)
+    finally:
+        os.remove(raw_path)
+    return {
+        "base_seq": base_seq,
+        "snapshot": _snapshot_name(base_seq),
+        "compression": "gzip",
+        "sha256": sha256.hexdigest(),
+        "raw_size": raw_size,
+        "compressed_size": os.path.getsize(snapshot_path),
+    }
+
+
+def _restore_snapshot(manifest: dict, db_path: str, generation: int | None = None, source_path: str | None = None) -> None:
+    """
+    圧縮スナップショットをストリーミングで展開しながらディスクへ書き出し、チェックサムを検証する。
+    source_path を渡すとダウンロード済みの圧縮ファイルから展開する。
+    """
+    tmp_path = db_path + ".download"
+    sha256 = hashlib.sha256()
+    try:
+        source = open(source_path, "rb") if source_path else get_object_store().open_read(manifest["snapshot"], generation)
+        with source as remote, \
+                gzip.GzipFile(fileobj=remote, mode="rb") as gz, \
+                open(tmp_path, "wb") as out:
+            while chunk := gz.read(COPY_CHUNK_SIZE):
+                sha256.update(chunk)
+                out.write(chunk)
+        if manifest.get("sha256") and sha256.hexdigest() != manifest["sha256"]:
+            raise ValueError(f"Snapshot checksum mismatch for {manifest['snapshot']}")
+        _remove_sqlite_sidecars(db_path)
+        os.replace(tmp_path, db_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def _replay_segments_async(manifest: dict | None) -> None:
+    """ベーススナップショット以降の変更セグメントをローカルDBに適用する"""
+    global segments_since_base, segment_bytes_since_base
+    base_seq = manifest["base_seq"] if manifest else 0
+    object_store = get_object_store()
+    names = [n for n in await object_store.list_names_async(SEGMENT_PREFIX) if n.endswith(".jsonl")]
+    names = [n for n in names if _segment_range(n)[1] > base_seq]
+    segments_since_base = len(names)
+    segment_bytes_since_base = 0
+    if not names:
+        return
+    if not os.path.exists(LOCAL_DB_PATH):
+        logger.warning(f"{len(names)} change segments found but no base snapshot exists. Skipping replay.")
+        return
+
+    local_seq = await asyncio.to_thread(changelog.current_seq, LOCAL_DB_PATH)
+    changes = []
+    for name in names:
+        if _segment_range(name)[1] <= local_seq:
+            continue
+        data = await object_store.download_bytes_async(name)
+        segment_bytes_since_base += len(data)
+        metrics.STORAGE_TRANSFER_BYTES.labels("download").inc(len(data))
+        changes.extend(json.loads(line) for line in data.decode("utf-8").splitlines() if line)
+    applied_seq = await asyncio.to_thread(changelog.apply_changes, LOCAL_DB_PATH, changes)
+    logger.info(f"Replayed {len(changes)} changes from {len(names)} segments (now at change #{applied_seq}).")
+
+
+async def _remote_base(manifest: dict | None) -> ObjectInfo | None:
+    """リモートのベース (圧縮スナップショット、なければ以前の形式のDBファイル) のメタデータ"""
+    object_store = get_object_store()
+    if manifest and manifest.get("snapshot"):
+        if manifest.get("snapshot_generation"):
+            return ObjectInfo(manifest["snapshot"], manifest.get("compressed_size") or 0, manifest["snapshot_generation"])
+        # 世代を記録する前のマニフェスト
+        info = await object_store.stat_async(manifest["snapshot"])
+        if info is None:
+            raise ObjectNotFound(manifest["snapshot"])
+        return info
+    return await object_store.stat_async(DB_FILE_NAME)
+
+
+async def _warn_if_legacy_file_newer(manifest: dict) -> None:
+    """
+    マニフェストがあると以前の形式のDBファイル (<DB_FILE_NAME>) は読まないので、
+    それがマニフェストより後に置かれていれば (gsutil cp で差し替えたなど) 警告する
+    """
+    try:
+        legacy = await get_object_store().stat_async(DB_FILE_NAME)
+    except Exception as e:
+        logger.warning(f"Failed to check {DB_FILE_NAME} for a newer legacy DB file: {e}")
+        return
+    uploaded_at = manifest.get("uploaded_at")
+    if legacy is not None and legacy.updated is not None and uploaded_at and legacy.updated > uploaded_at:
+        logger.warning(
+            f"{get_object_store().describe(DB_FILE_NAME)} is newer than the DB manifest but is ignored "
+            f"because {MANIFEST_NAME} exists. To replace the remote DB, publish the file with "
+            f"'python db_snapshot.py publish <db file>' instead of copying it to the bucket."
+        )
 
-# Cloud Storageクライアント (Initialize later if needed, or ensure credentials available)
-try:
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(DB_FILE_NAME)
-except Exception as e:
-    logger.error(f"Failed to initialize Google Cloud Storage client: {e}. Database persistence might fail.")
-    storage_client = None
-    bucket = None
-    blob = None
 
 # 非同期でDBファイルをダウンロード (アプリケーション起動時に呼び出す)
-async def download_db_file_async():
-    if storage_client is None or blob is None:
+@metrics.timed_transfer("download")
+async def download_db_file_async() -> bool:
+    """ベーススナップショット (または以前の形式のDBファイル) をダウンロードし、変更セグメントを適用する。成功時に True を返す"""
+    global remote_base_exists, remote_manifest_generation, remote_snapshot_name, remote_lineage, local_unpublished
+    object_store = get_object_store()
+    if object_store is None:
         logger.error("Storage client not initialized. Skipping DB download.")
-        return
+        return False
+
+    try:
+        manifest, manifest_generation = await asyncio.to_thread(_read_manifest)
+        base = await _remote_base(manifest)
+    except Exception as e:
+        logger.error(f"Error reading DB manifest: {e}", exc_info=True)
+        return False
+    remote_manifest_generation = manifest_generation
+    # ダウンロードを省く場合も、リモートにベースがあればセグメントだけを送ればよい
+    remote_base_exists = base is not None
+    remote_lineage = manifest.get("lineage") if manifest else None
+    if manifest:
+        remote_snapshot_name = manifest.get("snapshot")
+        await _warn_if_legacy_file_newer(manifest)
 
     # Check if file already exists locally (e.g., container reuse)
-    if os.path.exists(LOCAL_DB_PATH):
+    local_source = _read_local_source() if os.path.exists(LOCAL_DB_PATH) else None
+    keep_unpublished = False
+    if local_source is not None and local_source.get("unpublished") and not _same_source(local_source, base):
+        # 前回アップロードできなかった変更がローカルDBに残っていて、その後リモートのDBが変わった
+        if local_source.get("lineage") == remote_lineage:
+            # 同じDBから続く他のインスタンスのアップロードがあった。ローカルDBを残し、次のアップロードで
+            # ベースごと置き換える (後から書いた方が残る。リモートのセグメントは別のベースへの変更なので適用しない)
+            logger.warning(
+                f"Local DB at {LOCAL_DB_PATH} has changes that were not uploaded, and the remote DB was updated by "
+                f"another instance since. Keeping the local DB; its next upload replaces the remote one."
+            )
+            keep_unpublished = True
+            remote_base_exists = False
+        else:
+            # 公開された別のDBに差し替えられている。ローカルDBは上書きせずに別の名前で残す
+            aside_path = await asyncio.to_thread(_set_aside_local_db)
+            logger.error(
+                f"Remote DB was replaced with a published DB, but the local DB has changes that were not uploaded. "
+                f"Kept the local DB as {aside_path}; loading the published DB."
+            )
+            local_source = None
+    if local_source is not None and local_source.get("unpublished"):
+        # 残っている変更をアップロードする
+        local_unpublished = True
+        snapshot_uploader.mark_dirty()
+
+    if keep_unpublished:
+        pass # ローカルDBをそのまま使う (上でログを出した)
+    elif os.path.exists(LOCAL_DB_PATH) and (base is None or local_source is None):
          logger.info(f"DB file already exists locally at {LOCAL_DB_PATH}. Skipping download.")
-         return
+    elif _same_source(local_source, base):
+        logger.info(
+            f"Local DB at {LOCAL_DB_PATH} matches {object_store.describe(base.name)} "
+            f"(generation {base.generation}). Skipping download."
+        )
+    elif manifest and manifest.get("snapshot"):
+        if local_source is not None:
+            logger.warning(f"Remote DB snapshot changed since {LOCAL_DB_PATH} was downloaded. Replacing the local DB.")
+        logger.info(
+            f"Attempting to download DB snapshot from {object_store.describe(manifest['snapshot'])} "
+            f"({manifest.get('compressed_size')} bytes compressed, {manifest.get('raw_size')} bytes raw) to {LOCAL_DB_PATH}"
+        )
+        gz_path = LOCAL_DB_PATH + ".snapshot.gz"
+        try:
+            os.makedirs(os.path.dirname(LOCAL_DB_PATH), exist_ok=True)
+            _write_local_source(None)
+            if base.size >= object_store.parallel_threshold:
+                # 大きいスナップショットは並列にダウンロードしてから展開する
+                await object_store.download_async(base.name, gz_path, info=base)
+                await asyncio.to_thread(_restore_snapshot, manifest, LOCAL_DB_PATH, source_path=gz_path)
+            else:
+                await asyncio.to_thread(_restore_snapshot, manifest, LOCAL_DB_PATH, base.generation)
+            _write_local_source(base)
+            metrics.STORAGE_TRANSFER_BYTES.labels("download").inc(manifest.get("compressed_size") or 0)
+            logger.info(f"DB snapshot restored successfully to {LOCAL_DB_PATH}")
+        except Exception as e:
+            logger.error(f"Error downloading DB snapshot: {e}", exc_info=True)
+            return False
+        finally:
+            if os.path.exists(gz_path):
+                os.remove(gz_path)
+    elif base is None:
+        logger.warning(f"DB file not found in Cloud Storage ({object_store.describe(DB_FILE_NAME)}). Assuming first run or no existing data. A new DB will be created locally.")
+        # Ensure the /tmp directory exists if needed (usually does in Cloud Run)
+        os.makedirs(os.path.dirname(LOCAL_DB_PATH), exist_ok=True)
+    else:
+        # 圧縮スナップショット導入前のDBファイルをそのままダウンロードする
+        logger.info(f"Attempting to download DB file from {object_store.describe(DB_FILE_NAME)} to {LOCAL_DB_PATH}")
+        try:
+            _write_local_source(None)
+            _remove_sqlite_sidecars(LOCAL_DB_PATH)
+            await object_store.download_async(DB_FILE_NAME, LOCAL_DB_PATH, info=base)
+            _write_local_source(base)
+            metrics.STORAGE_TRANSFER_BYTES.labels("download").inc(os.path.getsize(LOCAL_DB_PATH))
+            logger.info(f"DB file downloaded successfully to {LOCAL_DB_PATH}")
+        except Exception as e:
+            logger.error(f"Error downloading DB file: {e}", exc_info=True)
+            # Decide if the app should proceed without the DB or raise an error
+            return False
+
+    try:
+        # どちらのモードで保存されたデータでも読めるよう、セグメントは常に適用する
+        if not keep_unpublished:
+            await _replay_segments_async(manifest)
+        if os.path.exists(LOCAL_DB_PATH):
+            if PERSISTENCE_MODE == "incremental":
+                tables = await asyncio.to_thread(changelog.install, LOCAL_DB_PATH, Base.metadata)
+                logger.info(f"Incremental persistence enabled for tables: {tables}")
+            else:
+                await asyncio.to_thread(changelog.uninstall, LOCAL_DB_PATH)
+    except Exception as e:
+        logger.error(f"Error replaying change segments: {e}", exc_info=True)
+        return False
+    return True
+
+
+async def _delete_old_snapshots(object_store: storage.ObjectStore, keep: set) -> None:
+    """
+    現在と1つ前のスナップショット以外を削除する
+    (1つ前は、マニフェストの差し替え前に読み始めた他のインスタンスがまだダウンロードしている可能性があるので残す)
+    """
+    # 他のインスタンスがアップロード中のパーツ (<スナップショット>.parts/...) は対象にしない
+    names = [name for name in await object_store.list_names_async(SNAPSHOT_PREFIX) if "/" not in name[len(SNAPSHOT_PREFIX):]]
+    if await object_store.stat_async(SNAPSHOT_NAME) is not None:
+        names.append(SNAPSHOT_NAME)
+    for name in names:
+        if name not in keep:
+            await object_store.delete_async(name)
+
+
+def _log_conflict(e: PreconditionFailed) -> None:
+    logger.error(f"Remote DB was modified by another writer during the upload ({e}). Not overwriting it; will retry.")
+
+
+def _enter_conflict(e: PreconditionFailed, generation: int) -> None:
+    """公開された別のDBに差し替えられていた。上書きしないよう、再起動するまでアップロードを止める"""
+    global persistence_conflict
+    persistence_conflict = {"since": time.time(), "remote_generation": generation, "error": str(e)}
+    logger.error(
+        f"Remote DB was replaced with a published DB since this instance loaded it ({e}). Not overwriting it; "
+        f"changes on this instance are no longer uploaded. Restart the instance to load the published DB "
+        f"(the local DB is then kept as {LOCAL_DB_PATH}.unpublished-<time>)."
+    )
+
+
+async def _rebase_onto_remote(e: PreconditionFailed) -> dict | None:
+    """
+    条件付きの書き込みが失敗したときに、リモートのマニフェストを読み直す。
+    同じ系統 (lineage) のDBへの他のインスタンスのアップロードなら、その世代を使うように切り替えて新しいマニフェストを返す
+    (その上にこのインスタンスの変更を積み直す。ベースのスナップショットは後から書いた方が残る)。
+    公開された別のDBに差し替えられていれば、競合の状態にして None を返す。
+    """
+    global remote_manifest_generation, remote_snapshot_name, conflict_rebases
+    manifest, generation = await asyncio.to_thread(_read_manifest)
+    if manifest is None or manifest.get("lineage") != remote_lineage:
+        _enter_conflict(e, generation)
+        return None
+    logger.warning(
+        f"Remote DB was updated by another instance since this instance read it ({e}). "
+        f"Rebasing the changes of this instance onto manifest generation {generation}."
+    )
+    remote_manifest_generation = generation
+    remote_snapshot_name = manifest.get("snapshot")
+    conflict_rebases += 1
+    return manifest
+
 
-    logger.info(f"Attempting to download DB file from gs://{BUCKET_NAME}/{DB_FILE_NAME} to {LOCAL_DB_PATH}")
+async def _upload_snapshot_async(db_path: str, rebase: bool = True) -> dict | None:
+    """
+    db_path の圧縮スナップショットを新しいベースとしてアップロードし、マニフェストを差し替える。
+    成功時は新しいマニフェストを返す (失敗時は None)。
+    rebase=True では、他のインスタンスがマニフェストを書き換えていれば読み直して差し替え直す (_rebase_onto_remote)
+    """
+    global remote_base_exists, remote_manifest_generation, remote_snapshot_name
+    object_store = get_object_store()
+    snapshot_path = db_path + ".snapshot.gz"
+    snapshot_info = None
+    committed = False
+    logger.info(f"Attempting to upload DB snapshot of {db_path} to {object_store.describe(SNAPSHOT_PREFIX)}")
     try:
         # Use asyncio.to_thread for blocking I/O
-        await asyncio.to_thread(blob.download_to_filename, LOCAL_DB_PATH)
-        logger.info(f"DB file downloaded successfully to {LOCAL_DB_PATH}")
-    except NotFound:
-         logger.warning(f"DB file not found in Cloud Storage (gs://{BUCKET_NAME}/{DB_FILE_NAME}). Assuming first run or no existing data. A new DB will be created locally.")
-         # Ensure the /tmp directory exists if needed (usually does in Cloud Run)
-         os.makedirs(os.path.dirname(LOCAL_DB_PATH), exist_ok=True)
+        manifest = await asyncio.to_thread(_create_snapshot, db_path, snapshot_path)
+        snapshot_info = await object_store.upload_async(manifest["snapshot"], snapshot_path, if_generation_match=0)
+        # スナップショット本体のアップロード完了後にマニフェストを差し替える
+        # (読み込んだ後に他から差し替えられていれば、条件付きの書き込みが失敗する)
+        manifest["snapshot_generation"] = snapshot_info.generation
+        manifest["uploaded_at"] = time.time()
+        manifest["lineage"] = remote_lineage
+        manifest_data = json.dumps(manifest).encode("utf-8")
+        try:
+            manifest_info = await object_store.upload_bytes_async(
+                MANIFEST_NAME, manifest_data, remote_manifest_generation if DB_CONDITIONAL_UPLOADS else None
+            )
+        except PreconditionFailed as e:
+            if not rebase or await _rebase_onto_remote(e) is None:
+                raise
+            manifest_info = await object_store.upload_bytes_async(MANIFEST_NAME, manifest_data, remote_manifest_generation)
+        committed = True
+        previous_snapshot_name = remote_snapshot_name
+        remote_manifest_generation = manifest_info.generation
+        remote_snapshot_name = manifest["snapshot"]
+        metrics.STORAGE_TRANSFER_BYTES.labels("upload").inc(manifest["compressed_size"] + len(manifest_data))
+        remote_base_exists = True
+        if db_path == LOCAL_DB_PATH:
+            # 次回の起動時、ローカルDBがこのスナップショットと同じならダウンロードを省く
+            # (以降の変更はセグメント、または次のアップロードで反映される)
+            await asyncio.to_thread(_write_local_source, snapshot_info)
+        logger.info(
+            f"DB snapshot uploaded successfully ({manifest['raw_size']} -> {manifest['compressed_size']} bytes)."
+        )
+    except PreconditionFailed as e:
+        if persistence_conflict is None:
+            _log_conflict(e)
+        elif db_path == LOCAL_DB_PATH:
+            await asyncio.to_thread(mark_local_unpublished)
+        return None
+    except Exception as e:
+        logger.error(f"Error uploading DB file: {e}", exc_info=True)
+        return None
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        if snapshot_info is not None and not committed:
+            # どのマニフェストからも指されないスナップショットを残さない
+            try:
+                await object_store.delete_async(snapshot_info.name)
+            except Exception as e:
+                logger.warning(f"Failed to delete unused snapshot {object_store.describe(snapshot_info.name)}: {e}")
+
+    try:
+        await _delete_old_snapshots(object_store, keep={remote_snapshot_name, previous_snapshot_name})
     except Exception as e:
-        logger.error(f"Error downloading DB file: {e}", exc_info=True)
-        # Decide if the app should proceed without the DB or raise an error
+        logger.warning(f"Failed to delete old DB snapshots: {e}")
+    return manifest
+
+
+async def _delete_segments(object_store: storage.ObjectStore, up_to_seq: int | None = None) -> int:
+    """変更番号が up_to_seq 以下のセグメント (None ならすべて) を削除し、削除した数を返す"""
+    deleted = 0
+    for name in await object_store.list_names_async(SEGMENT_PREFIX):
+        if name.endswith(".jsonl") and (up_to_seq is None or _segment_range(name)[1] <= up_to_seq):
+            await object_store.delete_async(name)
+            deleted += 1
+    return deleted
+
 
-# 非同期でDBファイルをアップロード (アプリケーション終了時に呼び出す)
-async def upload_db_file_async():
-    if storage_client is None or blob is None:
+# 非同期でDBファイルをアップロード (書き込み後・アプリケーション終了時に呼び出す)
+@metrics.timed_transfer("upload")
+async def upload_db_file_async() -> bool:
+    """DBの圧縮スナップショットをベースとしてアップロードする。成功時に True を返す"""
+    global segments_since_base, segment_bytes_since_base
+    object_store = get_object_store()
+    if object_store is None:
         logger.error("Storage client not initialized. Skipping DB upload.")
-        return
+        return False
 
     if not os.path.exists(LOCAL_DB_PATH):
         logger.warning(f"Local DB file {LOCAL_DB_PATH} not found. Skipping upload.")
-        return
+        return False
+
+    rebases_before = conflict_rebases
+    manifest = await _upload_snapshot_async(LOCAL_DB_PATH)
+    if manifest is None:
+        return False
+    base_seq = manifest["base_seq"]
+
+    if PERSISTENCE_MODE == "incremental":
+        try:
+            # ベースに含まれた変更は送信不要。古いセグメントも削除する
+            # (他のインスタンスのベースを置き換えた場合、残りのセグメントもそのベースへの変更なので削除する)
+            await asyncio.to_thread(changelog.mark_shipped, LOCAL_DB_PATH, base_seq)
+            await _delete_segments(object_store, base_seq if conflict_rebases == rebases_before else None)
+            segments_since_base = 0
+            segment_bytes_since_base = 0
+        except Exception as e:
+            logger.error(f"Error cleaning up change segments after compaction: {e}", exc_info=True)
+    return True
 
-    logger.info(f"Attempting to upload DB file from {LOCAL_DB_PATH} to gs://{BUCKET_NAME}/{DB_FILE_NAME}")
+
+async def publish_db_file_async(db_path: str, keep_segments: bool = False) -> bool:
+    """
+    手元で作ったDBファイル (import_data.py で作り直した・マイグレーションを適用したDBなど) を
+    リモートの新しいベースとして公開する。成功時に True を返す。
+    直前に読んだマニフェストの世代を条件にして差し替えるので、その間に他の書き込みがあれば失敗する。
+    keep_segments=False では既存の変更セグメントをすべて削除する (別のDBを元にした変更なので、新しいベースには適用しない)。
+    True ではベースに含まれる分だけを削除する (リモートからダウンロードしたDBに書き込んで公開し直す場合)。
+    稼働中のインスタンスは古いベースのままなので、公開後に再起動すること。
+    """
+    global remote_manifest_generation, remote_snapshot_name, remote_lineage
+    object_store = get_object_store()
+    if object_store is None:
+        logger.error("Storage client not initialized. Skipping DB publish.")
+        return False
+    if not os.path.exists(db_path):
+        logger.error(f"DB file {db_path} not found. Skipping publish.")
+        return False
     try:
-        # Use asyncio.to_thread for blocking I/O
-        await asyncio.to_thread(blob.upload_from_filename, LOCAL_DB_PATH)
-        logger.info(f"DB file uploaded successfully.")
+        manifest, remote_manifest_generation = await asyncio.to_thread(_read_manifest)
     except Exception as e:
-        logger.error(f"Error uploading DB file: {e}", exc_info=True)
+        logger.error(f"Error reading DB manifest: {e}", exc_info=True)
+        return False
+    remote_snapshot_name = manifest.get("snapshot") if manifest else None
+    # 新しい系統として公開する (稼働中のインスタンスは、これを自分の変更で上書きしない)
+    remote_lineage = uuid.uuid4().hex
+
+    new_manifest = await _upload_snapshot_async(db_path, rebase=False)
+    if new_manifest is None:
+        return False
+    try:
+        deleted = await _delete_segments(object_store, new_manifest["base_seq"] if keep_segments else None)
+        if deleted:
+            logger.info(f"Deleted {deleted} change segments superseded by the published DB.")
+    except Exception as e:
+        logger.error(f"Error deleting change segments after publishing: {e}", exc_info=True)
+        return False
+    return True
+
+
+async def _rebase_segments_async(e: PreconditionFailed) -> bool:
+    """
+    他のインスタンスの書き込みと競合したセグメントを積み直す。
+    未送信の変更の番号を、リモートのベースとセグメントの最新の番号より後に付け直す。積み直せれば True
+    """
+    global segments_since_base, segment_bytes_since_base
+    try:
+        manifest = await _rebase_onto_remote(e)
+        if manifest is None:
+            return False
+        object_store = get_object_store()
+        names = [n for n in await object_store.list_names_async(SEGMENT_PREFIX) if n.endswith(".jsonl")]
+        names = [n for n in names if _segment_range(n)[1] > manifest.get("base_seq", 0)]
+        remote_seq = max([manifest.get("base_seq", 0)] + [_segment_range(n)[1] for n in names])
+        await asyncio.to_thread(changelog.rebase_pending, LOCAL_DB_PATH, remote_seq)
+        segments_since_base = len(names)
+        segment_bytes_since_base = 0
+        return True
+    except Exception as rebase_error:
+        logger.error(f"Error rebasing change segments: {rebase_error}", exc_info=True)
+        return False
+
+
+@metrics.timed_transfer("ship_changes")
+async def ship_changes_async() -> bool:
+    """未送信の変更を1つのセグメントとしてアップロードする (incremental モード)"""
+    global segments_since_base, segment_bytes_since_base
+    object_store = get_object_store()
+    if object_store is None:
+        logger.error("Storage client not initialized. Skipping change shipping.")
+        return False
+    if not os.path.exists(LOCAL_DB_PATH):
+        logger.warning(f"Local DB file {LOCAL_DB_PATH} not found. Skipping change shipping.")
+        return False
+    if not remote_base_exists:
+        # リモートにベースがなければセグメントを積んでも復元できないので、まずベースを作る
+        return await upload_db_file_async()
+
+    for attempt in range(2):
+        try:
+            changes = await asyncio.to_thread(changelog.read_pending, LOCAL_DB_PATH)
+            if not changes:
+                return True
+            first_seq, last_seq = changes[0]["seq"], changes[-1]["seq"]
+            if DB_CONDITIONAL_UPLOADS:
+                # 他のインスタンスがベースを差し替えていたり (compaction・シャットダウン時のアップロードなど)、
+                # 同じ番号を含むセグメントを送っていたりすれば、その番号の変更は読み込まれないので、積み直してから送る
+                info = await object_store.stat_async(MANIFEST_NAME)
+                if (info.generation if info else 0) != remote_manifest_generation:
+                    raise PreconditionFailed(
+                        f"{MANIFEST_NAME}: expected generation {remote_manifest_generation}, found {info.generation if info else 0}"
+                    )
+                for other in await object_store.list_names_async(SEGMENT_PREFIX):
+                    if other.endswith(".jsonl") and _segment_range(other)[1] >= first_seq:
+                        raise PreconditionFailed(f"{other}: overlaps changes #{first_seq}-#{last_seq}")
+            payload = "".join(json.dumps(c, ensure_ascii=False) + "\n" for c in changes).encode("utf-8")
+            name = _segment_name(first_seq, last_seq)
+            # 同じ変更番号のセグメントがすでにあれば、他のインスタンスが書き込んでいる
+            await object_store.upload_bytes_async(name, payload, 0 if DB_CONDITIONAL_UPLOADS else None)
+            metrics.STORAGE_TRANSFER_BYTES.labels("ship_changes").inc(len(payload))
+            await asyncio.to_thread(changelog.mark_shipped, LOCAL_DB_PATH, last_seq)
+            segments_since_base += 1
+            segment_bytes_since_base += len(payload)
+            logger.info(f"Shipped {len(changes)} changes ({len(payload)} bytes) to {object_store.describe(name)}")
+            break
+        except PreconditionFailed as e:
+            if attempt == 0 and await _rebase_segments_async(e):
+                continue
+            if persistence_conflict is None:
+                _log_conflict(e)
+            else:
+                await asyncio.to_thread(mark_local_unpublished)
+            return False
+        except Exception as e:
+            logger.error(f"Error shipping change segment: {e}", exc_info=True)
+            return False
+    if local_unpublished:
+        # 前回の起動で残っていた変更も送信済み
+        await asyncio.to_thread(_clear_local_unpublished)
+
+    if segments_since_base >= COMPACT_EVERY_SEGMENTS or segment_bytes_since_base >= COMPACT_MAX_SEGMENT_BYTES:
+        logger.info(f"Compacting {segments_since_base} segments into a new base snapshot.")
+        await upload_db_file_async() # 失敗してもセグメントは送信済みなので、次回に再試行する
+    return True
+
+
+async def persist_db_async() -> bool:
+    """永続化モードに応じてローカルDBの変更をストレージへ反映する"""
+    if persistence_conflict is not None:
+        # 公開された別のDBを上書きしない (再起動するまで)
+        return False
+    if PERSISTENCE_MODE == "incremental":
+        return await ship_changes_async()
+    return await upload_db_file_async()
+
+
+def persistence_stats() -> dict:
+    return {
+        "mode": PERSISTENCE_MODE,
+        "segments_since_base": segments_since_base,
+        "segment_bytes_since_base": segment_bytes_since_base,
+        "conflict": persistence_conflict,
+        "conflict_rebases": conflict_rebases,
+        "local_unpublished": local_unpublished,
+    }
+
+
+# --- Write-behind アップローダー ---
+# 書き込みのたびにDB全体をアップロードせず、一定時間 or 一定件数ごとにまとめてアップロードする
+UPLOAD_INTERVAL_SECONDS = float(os.getenv("DB_UPLOAD_INTERVAL_SECONDS", "10"))
+UPLOAD_MAX_PENDING_WRITES = int(os.getenv("DB_UPLOAD_MAX_PENDING_WRITES", "50"))
+
+class SnapshotUploader:
+    """
+    DBの変更を dirty として記録し、バックグラウンドでまとめてアップロードする。
+
+    最初の書き込みから interval 秒経過するか、未アップロードの書き込みが
+    max_pending_writes 件に達した時点で1回だけアップロードする。
+    """
+
+    def __init__(self, upload_func, interval: float, max_pending_writes: int):
+        self._upload_func = upload_func
+        self.interval = interval
+        self.max_pending_writes = max_pending_writes
+        self.pending_writes = 0 # まだアップロードされていない書き込み件数
+        self.completed_flushes = 0
+        self.failed_flushes = 0
+        self.uploaded_writes = 0 # アップロード済みの書き込み件数 (累計)
+        self.last_flush_at: float | None = None
+        self._dirty = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def mark_dirty(self) -> None:
+        """DBが変更されたことを記録する (リクエスト処理中に呼ばれる。待機しない)"""
+        self.pending_writes += 1
+        self._dirty.set()
+        if self.pending_writes >= self.max_pending_writes:
+            self._full.set()
+
+    @property
+    def pending_flushes(self) -> int:
+        """予定されている (またはアップロード中の) フラッシュ数"""
+        return 1 if self.pending_writes > 0 or self._flush_lock.locked() else 0
+
+    def stats(self) -> dict:
+        return {
+            "pending_writes": self.pending_writes,
+            "pending_flushes": self.pending_flushes,
+            "completed_flushes": self.completed_flushes,
+            "failed_flushes": self.failed_flushes,
+            "uploaded_writes": self.uploaded_writes,
+            "last_flush_at": self.last_flush_at,
+            "interval_seconds": self.interval,
+            "max_pending_writes": self.max_pending_writes,
+        }
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="db-snapshot-uploader")
+
+    async def stop(self) -> bool:
+        """バックグラウンドタスクを停止し、未アップロードの変更があれば最後にフラッシュする。すべてアップロードできれば True"""
+        if self._task is not None:
+            # アップロード中のフラッシュは中断せず、終わってからタスクを止める
+            async with self._flush_lock:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        return await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await self._dirty.wait()
+            try:
+                # interval 秒の間に届いた書き込みをまとめる (件数上限に達したら即時)
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if not await self.flush():
+                # 失敗直後に連続リトライしないよう、次の interval まで待つ
+                await asyncio.sleep(self.interval)
+
+    async def flush(self) -> bool:
+        """未アップロードの変更があればアップロードする"""
+        async with self._flush_lock:
+            if self.pending_writes == 0:
+                self._dirty.clear()
+                return True
+            writes = self.pending_writes
+            self.pending_writes = 0
+            self._dirty.clear()
+            self._full.clear()
+            try:
+                ok = await self._upload_func()
+            except BaseException:
+                # キャンセルされた場合なども、書き込みを次回のフラッシュに持ち越す
+                self.pending_writes += writes
+                self._dirty.set()
+                raise
+            if ok:
+                self.completed_flushes += 1
+                self.uploaded_writes += writes
+                self.last_flush_at = time.time()
+                logger.info(f"Snapshot flush completed ({writes} writes coalesced).")
+            else:
+                # 失敗した分は次回のフラッシュに持ち越す
+                self.failed_flushes += 1
+                self.pending_writes += writes
+                self._dirty.set()
+            return ok
+
+snapshot_uploader = SnapshotUploader(
+    persist_db_async,
+    interval=UPLOAD_INTERVAL_SECONDS,
+    max_pending_writes=UPLOAD_MAX_PENDING_WRITES,
+)
 
 
 # SQLite接続URL
 DATABASE_URL = f"sqlite+aiosqlite:///{LOCAL_DB_PATH}"
 logger.info(f"Database URL configured: {DATABASE_URL}")
 
+# --- エンジンプロファイル ---
+# - tuned: WAL + プラグマ設定。書き込みは1本の接続に集約し、読み取りは読み取り専用の接続プールで並行に行う
+# - default: 以前と同じ、デフォルト設定のエンジン1つ (比較・切り戻し用)
+SQLITE_ENGINE_PROFILE = os.getenv("SQLITE_ENGINE_PROFILE", "tuned").lower()
+# 接続ごとに適用するプラグマ
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-32768")), # 負の値は KiB 単位 (32MiB)
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # 外部キー制約を検査する (SQLiteは既定で検査しない)。存在しないユーザー・商品を参照する行を登録させない
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "ON"),
+}
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+DB_READ_POOL_MAX_OVERFLOW = int(os.getenv("DB_READ_POOL_MAX_OVERFLOW", "4"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+
+
+def _pragma_listener(read_only: bool):
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if read_only and name == "journal_mode":
+                continue # 読み取り専用接続ではジャーナルモードを変更できない
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_sqlite_pragmas
+
+
+def create_engines(db_path: str, profile: str = SQLITE_ENGINE_PROFILE):
+    """書き込み用と読み取り用のエンジンを作成する (default プロファイルでは同じエンジンを返す)"""
+    if profile != "tuned":
+        default_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{db_path}",
+            echo=False, # Set to True for debugging SQL
+            connect_args={"check_same_thread": False}  # Required for SQLite with threads/asyncio
+        )
+        metrics.instrument_engine(default_engine.sync_engine, "default")
+        profiling.instrument_engine(default_engine.sync_engine)
+        return default_engine, default_engine
+
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000}
+    # 書き込みは1本の接続に集約し、SQLiteのロック待ちではなくプールの待ち行列で直列化する
+    writer = create_async_engine(
+        f"sqlite+aiosqlite:///{db_path}",
+        echo=False,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        connect_args=connect_args,
+    )
+    # 読み取り専用接続 (URIモードで mode=ro を指定する)
+    reader = create_async_engine(
+        f"sqlite+aiosqlite:///file:{db_path}?mode=ro&uri=true",
+        echo=False,
+        pool_size=DB_READ_POOL_SIZE,
+        max_overflow=DB_READ_POOL_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        connect_args=connect_args,
+    )
+    event.listen(writer.sync_engine, "connect", _pragma_listener(read_only=False))
+    event.listen(reader.sync_engine, "connect", _pragma_listener(read_only=True))
+    metrics.instrument_engine(writer.sync_engine, "writer")
+    metrics.instrument_engine(reader.sync_engine, "reader")
+    profiling.instrument_engine(writer.sync_engine)
+    profiling.instrument_engine(reader.sync_engine)
+    return writer, reader
+
+
 # エンジン作成
-# Consider adding pool_size and max_overflow if needed, though less critical for SQLite
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False, # Set to True for debugging SQL
-    connect_args={"check_same_thread": False}  # Required for SQLite with threads/asyncio
-)
+engine, read_engine = create_engines(LOCAL_DB_PATH)
 
 # セッションメーカー
 AsyncSessionLocal = async_sessionmaker(
     autocommit=False, autoflush=False, bind=engine, expire_on_commit=False
 )
+# 読み取り専用のセッションメーカー (GETエンドポイント用)
+AsyncReadSessionLocal = async_sessionmaker(
+    autocommit=False, autoflush=False, bind=read_engine, expire_on_commit=False
+)
 
 # モデルベース
 Base = declarative_base()
 
+
+async def init_engine_async() -> None:
+    """
+    書き込み用接続を先に開いてプラグマ (WALモードへの切り替えなど) を適用しておく。
+    DBファイルのダウンロード後、リクエストを受け付ける前に呼び出す。
+    """
+    if not os.path.exists(LOCAL_DB_PATH):
+        return
+    try:
+        async with engine.connect() as conn:
+            journal_mode = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+        logger.info(f"SQLite engine profile '{SQLITE_ENGINE_PROFILE}' ready (journal_mode={journal_mode}).")
+    except Exception as e:
+        logger.error(f"Error initializing database engine: {e}", exc_info=True)
+
+
+async def dispose_engines_async() -> None:
+    """プールの接続をすべて閉じる (WALの内容はここでDBファイルへチェックポイントされる)"""
+    await read_engine.dispose()
+    if engine is not read_engine:
+        await engine.dispose()
+
+
+# --- 起動時のDBの準備 ---
+# STARTUP_MODE=fast では、DBのダウンロードなどの準備をバックグラウンドで行いながらリクエストを受け付ける。
+# その間DBを使うリクエスト (get_db / get_read_db) は準備の完了を最大 DB_READY_TIMEOUT_SECONDS 秒待つ
+DB_READY_TIMEOUT_SECONDS = float(os.getenv("DB_READY_TIMEOUT_SECONDS", "30"))
+
+
+class DatabaseNotReady(Exception):
+    """起動時のDBの準備が待ち時間内に終わらなかった"""
+
+
+# 準備が終わっていればセット (通常の起動では準備が終わってからリクエストを受け付けるので、最初からセットしておく)
+db_ready = asyncio.Event()
+db_ready.set()
+
+
+async def wait_until_ready() -> None:
+    """起動時のDBの準備が終わるまで待つ。DB_READY_TIMEOUT_SECONDS 以内に終わらなければ DatabaseNotReady"""
+    if db_ready.is_set():
+        return
+    try:
+        await asyncio.wait_for(db_ready.wait(), timeout=DB_READY_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise DatabaseNotReady(f"Database is still being prepared (waited {DB_READY_TIMEOUT_SECONDS:g}s).") from None
+
+
 # 非同期データベースセッションを取得するための依存性関数
 async def get_db():
     """
     Provides an asynchronous database session.
     Upload is now handled by application lifespan events.
     """
+    await wait_until_ready()
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -108,3 +1036,17 @@ async def get_db():
             # await session.rollback()
             raise
         # Removed upload_db_file() call from here
+
+# 読み取り専用セッションを取得するための依存性関数
+async def get_read_db():
+    """
+    Provides an asynchronous read-only database session.
+    Reads do not wait for the single writer connection.
+    """
+    await wait_until_ready()
+    async with AsyncReadSessionLocal() as session:
+        try:
+            yield session
+        except Exception as e:
+            logger.error(f"Error during read-only DB session: {e}", exc_info=True)
+            raise
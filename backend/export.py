@@ -0,0 +1,185 @@
+"""
+購入履歴のエクスポート (NDJSON / CSV / Parquet)。
+
+購入履歴に商品名・カテゴリを結合した行を、サーバーサイドカーソル (AsyncSession.stream + yield_per) で
+EXPORT_CHUNK_ROWS 行ずつ読み出し、チャンクごとにエンコードして返す。件数によらずメモリ使用量は一定になる。
+GET /export/purchases と export_data.py (CLI) で共有する。出力した形式はそのまま
+import_data.py --export-file で読み込める (エクスポートとインポートで往復できる)。
+
+Parquet は pyarrow がインストールされている場合だけ使える (チャンクごとに1つの行グループとして書き出す)。
+"""
+import csv
+import io
+import json
+import os
+from datetime import date
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# 1回に読み出してエンコードする行数
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+# エクスポートする列 (import_data.py --export-file もこの列名で読み込む)
+EXPORT_COLUMNS = ["id", "user_id", "product_id", "purchase_date", "product_name", "product_category"]
+
+
+def export_statement(user_id: int | None = None, start_date: date | None = None, end_date: date | None = None):
+    """購入履歴に商品名・カテゴリを結合するクエリ (ID順)。期間は開始日・終了日を含む"""
+    statement = (
+        select(
+            models.PurchaseHistory.id,
+            models.PurchaseHistory.user_id,
+            models.PurchaseHistory.product_id,
+            models.PurchaseHistory.purchase_date,
+            models.Product.name.label("product_name"),
+            models.Product.category.label("product_category"),
+        )
+        .outerjoin(models.Product, models.Product.id == models.PurchaseHistory.product_id)
+        .order_by(models.PurchaseHistory.id)
+    )
+    if user_id is not None:
+        statement = statement.where(models.PurchaseHistory.user_id == user_id)
+    if start_date is not None:
+        statement = statement.where(models.PurchaseHistory.purchase_date >= start_date)
+    if end_date is not None:
+        statement = statement.where(models.PurchaseHistory.purchase_date <= end_date)
+    return statement
+
+
+class NDJSONEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def __init__(self):
+        # json.dumps は呼び出しごとにエンコーダを作るので、1つを使い回す (日付は ISO 形式の文字列にする)
+        self._encode = json.JSONEncoder(ensure_ascii=False, default=date.isoformat).encode
+
+    def begin(self) -> bytes:
+        return b""
+
+    def encode(self, rows) -> bytes:
+        if not rows:
+            return b""
+        lines = [self._encode(dict(zip(EXPORT_COLUMNS, row))) for row in rows]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def end(self) -> bytes:
+        return b""
+
+
+class CSVEncoder:
+    """1行目が列名のCSV (空の値は空文字列)"""
+    media_type = "text/csv; charset=utf-8"
+    extension = "csv"
+
+    def _write(self, rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def begin(self) -> bytes:
+        return self._write([EXPORT_COLUMNS])
+
+    def encode(self, rows) -> bytes:
+        return self._write(rows)
+
+    def end(self) -> bytes:
+        return b""
+
+
+class _ChunkSink:
+    """ParquetWriter の書き込み先。書き込まれたバイト列を溜めておき、take() でまとめて取り出す"""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position # フッターに書く位置はファイル全体の先頭からの位置
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ParquetEncoder:
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("product_id", pa.int64()),
+            ("purchase_date", pa.date32()),
+            ("product_name", pa.string()),
+            ("product_category", pa.string()),
+        ])
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(pa.PythonFile(self._sink, mode="w"), self._schema)
+
+    def begin(self) -> bytes:
+        return self._sink.take()
+
+    def encode(self, rows) -> bytes:
+        columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema,
+        )
+        self._writer.write_table(table)
+        return self._sink.take()
+
+    def end(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+EXPORT_ENCODERS = {"ndjson": NDJSONEncoder, "csv": CSVEncoder, "parquet": ParquetEncoder}
+
+
+def get_encoder(export_format: str):
+    """形式に対応するエンコーダを作る。未対応の形式や、pyarrow がない場合の parquet は ValueError"""
+    encoder_class = EXPORT_ENCODERS.get(export_format)
+    if encoder_class is None:
+        raise ValueError(f"Unsupported export format: {export_format} (choose from {', '.join(EXPORT_ENCODERS)})")
+    try:
+        return encoder_class()
+    except ImportError:
+        raise ValueError("Parquet export requires pyarrow (pip install pyarrow).")
+
+
+async def export_chunks(db: AsyncSession, encoder, statement, chunk_rows: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[bytes]:
+    """クエリの結果を chunk_rows 行ずつ読み出し、エンコードしたバイト列を順に返す"""
+    data = encoder.begin()
+    if data:
+        yield data
+    result = await db.stream(statement.execution_options(yield_per=chunk_rows))
+    async for rows in result.partitions():
+        data = encoder.encode(rows)
+        if data:
+            yield data
+    data = encoder.end()
+    if data:
+        yield data
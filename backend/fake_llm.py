@@ -0,0 +1,112 @@
+"""
+開発・テスト・ベンチマーク用の偽のチャットモデル。
+
+APIキーやネットワークなしで、決まった提案テキストをトークン (空白・改行区切り) ごとに返す。
+最初のトークンまでの待ち時間とトークン間の待ち時間を指定でき、実際のLLMに近い
+ストリーミングの挙動を再現できる。llm_interface で LLM_PROVIDER を "fake" にすると使われる。
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_LLM_FIRST_TOKEN_DELAY_SECONDS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_DELAY_SECONDS", "0.2"))
+FAKE_LLM_TOKEN_DELAY_SECONDS = float(os.getenv("FAKE_LLM_TOKEN_DELAY_SECONDS", "0.02"))
+
+DEFAULT_RESPONSE = """## 【提案商品】
+- 牛乳
+- 卵
+- 食パン
+- 鶏むね肉
+- 木綿豆腐
+- 納豆
+- ほうれん草
+- にんじん
+- たまねぎ
+- じゃがいも
+- さつまいも
+- 鮭切り身
+- りんご
+- バナナ
+- ヨーグルト
+
+## 【提案商品を使った献立例】
+
+- **鮭とほうれん草のバターソテー**
+    - 鮭切り身とほうれん草をバターで焼くだけの簡単な一品
+- **鶏むね肉と野菜の煮物**
+    - 鶏むね肉、にんじん、じゃがいも、たまねぎを甘辛く煮込む
+- **さつまいもの味噌汁**
+    - 旬のさつまいもと豆腐を使った秋らしい味噌汁
+"""
+
+
+def split_tokens(text: str) -> List[str]:
+    """空白・改行を直前の語に含めて分割する (連結すると元のテキストに戻る)"""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    response: str = DEFAULT_RESPONSE
+    first_token_delay: float = FAKE_LLM_FIRST_TOKEN_DELAY_SECONDS
+    token_delay: float = FAKE_LLM_TOKEN_DELAY_SECONDS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat-model"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = split_tokens(self.response)
+        time.sleep(self.first_token_delay + self.token_delay * max(0, len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = split_tokens(self.response)
+        await asyncio.sleep(self.first_token_delay + self.token_delay * max(0, len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(split_tokens(self.response)):
+            time.sleep(self.first_token_delay if i == 0 else self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for i, token in enumerate(split_tokens(self.response)):
+            await asyncio.sleep(self.first_token_delay if i == 0 else self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,64 @@
+"""
+LLMの呼び出しごとのメトリクスを記録する LangChain のコールバック。
+
+langchain_core の読み込みには時間がかかるので、llm_interface はこのモジュールを
+最初のLLM呼び出し (LLMService の作成) まで読み込まない。
+"""
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import metrics
+import profiling
+from llm_interface import SYSTEM_TEMPLATE, estimate_tokens
+
+
+class LLMCallMetrics(BaseCallbackHandler):
+    """
+    1回のLLM呼び出しのレイテンシ・最初のトークンまでの時間・トークン数を metrics に記録する。
+    トークン数はLangChainのコールバック (on_llm_end) で応答の usage_metadata から受け取り、
+    APIが返さない場合 (fake など) は estimate_tokens で概算する。
+    """
+    run_inline = True # 同期ハンドラーをスレッドプールに回さず、その場で呼び出す
+    ignore_chain = True
+
+    def __init__(self, provider: str, model_name: str, mode: str, user_prompt: str):
+        self.provider = provider
+        self.model_name = model_name
+        self.mode = mode
+        self.user_prompt = user_prompt
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.reported = False
+        self.started = time.perf_counter()
+        self._first_token_seen = False
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.input_tokens += usage.get("input_tokens", 0)
+                    self.output_tokens += usage.get("output_tokens", 0)
+                    self.reported = True
+
+    def first_token(self) -> None:
+        if not self._first_token_seen:
+            self._first_token_seen = True
+            metrics.LLM_TIME_TO_FIRST_TOKEN_SECONDS.labels(self.provider, self.model_name).observe(time.perf_counter() - self.started)
+
+    def finish(self, outcome: str, output: str = "") -> None:
+        elapsed = time.perf_counter() - self.started
+        metrics.LLM_REQUEST_SECONDS.labels(self.provider, self.model_name, self.mode, outcome).observe(elapsed)
+        if profiling.PROFILING_ENABLED:
+            profiling.add_phase("llm", elapsed)
+        if self.reported:
+            source = "reported"
+        elif outcome == "ok":
+            source = "estimated"
+            self.input_tokens = estimate_tokens(SYSTEM_TEMPLATE) + estimate_tokens(self.user_prompt)
+            self.output_tokens = estimate_tokens(output)
+        else:
+            return
+        metrics.LLM_TOKENS.labels(self.provider, self.model_name, "input", source).inc(self.input_tokens)
+        metrics.LLM_TOKENS.labels(self.provider, self.model_name, "output", source).inc(self.output_tokens)
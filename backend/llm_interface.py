@@ -1,43 +1,43 @@
 import os
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import date
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Any
+import schemas
+# LangChain・各プロバイダーのSDK・httpx は読み込みに時間がかかる (コールドスタートが遅くなる) ので、
+# モジュールの読み込み時には import せず、最初にLLMを使うとき (get_llm・build_chain・LLMService) に読み込む
+if TYPE_CHECKING:
+    import httpx
 # from langchain_core.messages import SystemMessage, HumanMessage # ChatPromptTemplateを使うので直接は不要かも
 
-LLM_PROVIDER = "OPENAI"
-MAX_TOKENS = 1000
+logger = logging.getLogger(__name__)
 
-# LLMの初期化
-def get_llm():
-    if LLM_PROVIDER.lower() == "anthropic":
-        model_name = "claude-3-7-sonnet-20250219"
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        return ChatAnthropic(model=model_name, api_key=api_key, max_tokens=MAX_TOKENS)
-    elif LLM_PROVIDER.lower() == "openai":
-        model_name = "gpt-4o-2024-08-06"
-        api_key = os.getenv("OPENAI_API_KEY")
-        return ChatOpenAI(model=model_name, api_key=api_key, max_tokens=MAX_TOKENS)
+# "openai" / "anthropic" / "fake" (fake_llm の偽モデル。開発・テスト用)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_MODEL = os.getenv("LLM_MODEL") or None # 未指定ならプロバイダーごとのデフォルト (MODEL_NAMES)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None # APIのエンドポイント (プロキシやローカルのスタブサーバー用)
+MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1000"))
+# 1回の呼び出しのタイムアウトと再試行回数
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# LLM APIへのHTTP接続プール (keep-alive で接続とTLSハンドシェイクを使い回す)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+# 購入履歴の集計表に使うトークン数の上限 (目安)
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "1500"))
+# プロバイダーごとのモデル名
+MODEL_NAMES = {
+    "anthropic": "claude-3-7-sonnet-20250219",
+    "openai": "gpt-4o-2024-08-06",
+    "fake": "fake-streaming-chat-model",
+}
 
-def generate_suggestions(
-    user_prompt: str, max_tokens: int = 1000 # 引数名とモデル名を変更 (最新の推奨モデル名を確認)
-) -> str:
-    """
-    指定されたプロンプトを使用して Anthropic Claude から提案を生成する。
-
-    Args:
-        user_prompt (str): LLMに渡すユーザー固有のプロンプト部分（例: 購入履歴）。
-        max_tokens (int): 生成する最大トークン数。
-
-    Returns:
-        str: LLMによって生成された提案テキスト。エラー時は空文字列を返す。
-    """
-    llm = get_llm()  # LLMを初期化
-
-    # システムプロンプトを定義 (Anthropic APIでは別パラメータで渡す)
-    # --- LangChain プロンプトテンプレートの定義 ---
-    system_template = """あなたは**食品スーパーで購入する商品をユーザーに提案するアシスタント**です。
+# システムプロンプト
+SYSTEM_TEMPLATE = """あなたは**食品スーパーで購入する商品をユーザーに提案するアシスタント**です。
 
 ユーザーから過去に購入した食品の履歴を受け取ります。
 あなたの役割は、ユーザーの購入履歴を分析して、次回の買い物で購入するとよい食品を推薦することです。
@@ -70,6 +70,63 @@ def generate_suggestions(
     - 使用する提案商品、簡単な調理方法や特徴
 ```
 """
+
+
+def get_model_info() -> tuple[str, str]:
+    """現在使用しているLLMの (プロバイダー, モデル名)"""
+    if _llm_service is not None:
+        return _llm_service.provider, _llm_service.model_name
+    provider = LLM_PROVIDER.lower()
+    return provider, LLM_MODEL or MODEL_NAMES.get(provider, "")
+
+# LLMの初期化
+def get_llm(provider: str | None = None, model_name: str | None = None,
+            http_client: "httpx.Client | None" = None, http_async_client: "httpx.AsyncClient | None" = None):
+    """
+    チャットモデルを作成する。プロバイダー・モデルを省略した場合は設定 (環境変数) の値を使う。
+    http_client / http_async_client を渡すと、その接続プールを使う (OpenAI のみ)。
+    """
+    if provider is None:
+        provider, model_name = LLM_PROVIDER, model_name or LLM_MODEL
+    provider = provider.lower()
+    model_name = model_name or MODEL_NAMES.get(provider, "")
+    if provider == "anthropic":
+        from langchain_anthropic import ChatAnthropic
+
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        # ChatAnthropic は HTTP クライアントを受け取れないため、インスタンスが内部で保持する接続プールを使い回す
+        return ChatAnthropic(
+            model=model_name, api_key=api_key, max_tokens=MAX_TOKENS, base_url=LLM_BASE_URL,
+            default_request_timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES,
+        )
+    elif provider == "openai":
+        import httpx
+        from langchain_openai import ChatOpenAI
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        return ChatOpenAI(
+            model=model_name, api_key=api_key, max_tokens=MAX_TOKENS, base_url=LLM_BASE_URL,
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            max_retries=LLM_MAX_RETRIES, http_client=http_client, http_async_client=http_async_client,
+            stream_usage=True, # ストリーミングでもトークン数を受け取る (メトリクス用)
+        )
+    elif provider == "fake":
+        from fake_llm import FakeStreamingChatModel
+
+        return FakeStreamingChatModel()
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+def build_chain(llm=None):
+    """システムプロンプト -> LLM -> 文字列 のチェーンを作成する"""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
+
+    if llm is None:
+        llm = get_llm()  # LLMを初期化
+
+    # システムプロンプトを定義 (Anthropic APIでは別パラメータで渡す)
+    # --- LangChain プロンプトテンプレートの定義 ---
+    system_template = SYSTEM_TEMPLATE
     human_template = "{user_history_prompt}" # ユーザー履歴は変数として渡す
 
     system_message_prompt = SystemMessagePromptTemplate.from_template(system_template)
@@ -78,14 +135,134 @@ def generate_suggestions(
     chat_prompt = ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
     # -----------------------------------------
 
-    # --- LangChain チェーンの定義と実行 ---
+    # --- LangChain チェーンの定義 ---
     output_parser = StrOutputParser()
-    chain = chat_prompt | llm | output_parser
+    return chat_prompt | llm | output_parser
+
+class LLMService:
+    """
+    チャットモデル・プロンプトチェーン・HTTP接続プールを保持し、リクエスト間で使い回す。
+    アプリ起動時に init_llm_service で作成し (STARTUP_MODE=fast では最初の提案のときに作成し)、終了時に close_llm_service で閉じる。
+    """
+
+    def __init__(self, provider: str | None = None, model_name: str | None = None):
+        import httpx
+
+        if provider is None:
+            provider, model_name = LLM_PROVIDER, model_name or LLM_MODEL
+        self.provider = provider.lower()
+        self.model_name = model_name or MODEL_NAMES.get(self.provider, "")
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+        self._http_client = None
+        self._http_async_client = None
+        if self.provider == "openai":
+            self._http_client = httpx.Client(limits=limits, timeout=timeout)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self.llm = get_llm(self.provider, self.model_name, self._http_client, self._http_async_client)
+        self.chain = build_chain(self.llm)
+
+    def _call_metrics(self, mode: str, user_prompt: str):
+        from llm_callbacks import LLMCallMetrics
+
+        return LLMCallMetrics(self.provider, self.model_name, mode, user_prompt)
+
+    def generate(self, user_prompt: str) -> str:
+        call = self._call_metrics("invoke", user_prompt)
+        try:
+            text = self.chain.invoke({"user_history_prompt": user_prompt}, config={"callbacks": [call]}).strip()
+        except Exception:
+            call.finish("error")
+            raise
+        call.finish("ok", text)
+        return text
+
+    async def agenerate(self, user_prompt: str) -> str:
+        call = self._call_metrics("invoke", user_prompt)
+        try:
+            text = (await self.chain.ainvoke({"user_history_prompt": user_prompt}, config={"callbacks": [call]})).strip()
+        except Exception:
+            call.finish("error")
+            raise
+        except BaseException:
+            call.finish("cancelled") # タイムアウトでフォールバックに切り替えた場合など
+            raise
+        call.finish("ok", text)
+        return text
+
+    async def astream(self, user_prompt: str) -> AsyncIterator[str]:
+        call = self._call_metrics("stream", user_prompt)
+        chunks = []
+        try:
+            async for chunk in self.chain.astream({"user_history_prompt": user_prompt}, config={"callbacks": [call]}):
+                if chunk:
+                    call.first_token()
+                    chunks.append(chunk)
+                    yield chunk
+        except Exception:
+            call.finish("error")
+            raise
+        except BaseException:
+            call.finish("cancelled") # クライアントの切断などでストリームが途中で閉じられた場合
+            raise
+        call.finish("ok", "".join(chunks))
+
+    async def aclose(self) -> None:
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+_llm_service: LLMService | None = None
+_llm_service_lock = threading.Lock()
+
+def get_llm_service() -> LLMService:
+    """共有の LLMService を返す (未作成なら作成する。プロバイダーのSDKの読み込みもこのとき)"""
+    global _llm_service
+    if _llm_service is None:
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = LLMService()
+                logger.info(f"LLM service ready (provider={_llm_service.provider}, model={_llm_service.model_name}).")
+    return _llm_service
+
+async def aget_llm_service() -> LLMService:
+    """get_llm_service の非同期版。初回の作成 (SDKの読み込み) はスレッドで行い、イベントループを止めない"""
+    if _llm_service is not None:
+        return _llm_service
+    return await asyncio.to_thread(get_llm_service)
+
+def init_llm_service() -> LLMService:
+    return get_llm_service()
 
+async def close_llm_service() -> None:
+    global _llm_service
+    if _llm_service is not None:
+        await _llm_service.aclose()
+        _llm_service = None
+
+def generate_suggestions(
+    user_prompt: str, max_tokens: int = 1000 # 引数名とモデル名を変更 (最新の推奨モデル名を確認)
+) -> str:
+    """
+    指定されたプロンプトを使用してLLMから提案を生成する (同期版)。
+    イベントループをブロックするため、APIからは agenerate_suggestions を使うこと。
+
+    Args:
+        user_prompt (str): LLMに渡すユーザー固有のプロンプト部分（例: 購入履歴）。
+        max_tokens (int): 生成する最大トークン数。
+
+    Returns:
+        str: LLMによって生成された提案テキスト。エラー時は空文字列を返す。
+    """
     try:
         # チェーンを実行し、ユーザープロンプトを渡す
-        suggestion_text = chain.invoke({"user_history_prompt": user_prompt})
-        return suggestion_text.strip()
+        return get_llm_service().generate(user_prompt)
 
     # except APIError as e: # LangChainは独自の例外を発生させる可能性がある
     #     print(f"Anthropic APIエラーが発生しました (LangChain経由): {e}") # エラーの詳細を確認
@@ -99,10 +276,30 @@ def generate_suggestions(
         return ""
     # ------------------------------------
 
+async def agenerate_suggestions(user_prompt: str) -> str:
+    """
+    generate_suggestions の非同期版。LLMの応答を待つ間もイベントループをブロックしない。
+    エラー時は空文字列を返す。
+    """
+    try:
+        return await (await aget_llm_service()).agenerate(user_prompt)
+    except Exception as e:
+        logger.error(f"LangChain実行中に予期せぬエラーが発生しました: {e}", exc_info=True)
+        return ""
+
+async def astream_suggestions(user_prompt: str) -> AsyncIterator[str]:
+    """
+    提案テキストを生成されたトークンから順に返す。
+    エラーはそのまま呼び出し側に送出する (ストリームの途中で失敗する場合があるため)。
+    """
+    async for chunk in (await aget_llm_service()).astream(user_prompt):
+        yield chunk
+
 
 def format_purchase_history_for_prompt(history: List[Dict[str, Any]]) -> str:
     """
     購入履歴リストをLLMプロンプト用の文字列に整形する。
+    history は crud.get_purchase_history が返す辞書のリスト (purchase_date は date または ISO形式の文字列)
     (この関数は改善の余地あり。より詳細な情報を含めるなど)
     """
     if not history:
@@ -124,5 +321,109 @@ def format_purchase_history_for_prompt(history: List[Dict[str, Any]]) -> str:
 
     return "最近の購入履歴:\n" + "\n".join(recent_history)
 
+def build_user_prompt(user_id: int, history: List[Dict[str, Any]]) -> str:
+    """購入履歴からLLMに渡すユーザープロンプトを作成する"""
+    history_text = format_purchase_history_for_prompt(history)
+    return f"""以下が、ユーザーID {user_id}がこれまでに購入した食品の履歴です。
+この履歴を参考にして、次回購入すべき食品を提案してください。
+
+{history_text}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算。英数字・記号は約4文字で1トークン、日本語などそれ以外は1文字1トークンとして数える
+    (モデルごとのトークナイザーに依存せず、上限の判定に使える程度の精度)
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def format_history_summary_for_prompt(summary: schemas.PurchaseHistorySummary, token_budget: int = LLM_PROMPT_TOKEN_BUDGET) -> str:
+    """
+    購入履歴の集計をLLMプロンプト用の表に整形する。
+    購入回数の多い商品から順に、token_budget (目安) に収まるまで行を追加する。
+    """
+    if not summary.products:
+        return "購入履歴はありません。"
+
+    header = [
+        f"購入履歴の集計 ({summary.first_purchase_date}〜{summary.last_purchase_date}, 全{summary.total_purchases}回):",
+        "カテゴリ別の割合: " + ", ".join(f"{category} {share:.0%}" for category, share in summary.category_shares.items()),
+        "",
+        "商品名 | 購入回数 | 最終購入日 | 平均購入間隔(日)",
+    ]
+    used = estimate_tokens("\n".join(header))
+    lines = []
+    for item in summary.products:
+        interval = f"{item.mean_interval_days:g}" if item.mean_interval_days is not None else "-"
+        line = f"{item.name} | {item.purchase_count} | {item.last_purchase_date} | {interval}"
+        cost = estimate_tokens(line) + 1
+        if lines and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    omitted = len(summary.products) - len(lines)
+    if omitted:
+        lines.append(f"(ほか {omitted} 商品は省略)")
+    return "\n".join(header + lines)
+
+
+def format_due_items_for_prompt(due_items: List[schemas.DueItem]) -> str:
+    """
+    購入周期から見てそろそろ買う時期の商品をLLMプロンプト用に整形する。
+    確率は毎日少しずつ変わるので含めない (含めると提案キャッシュのキーが毎日変わる)。
+    ただし、どの商品が対象になるかは今日の日付で決まるため、商品が加わったり外れたりした日にはキーが変わり、提案を作り直す
+    """
+    lines = [
+        f"- {item.product.name} (最終購入日: {item.last_purchase_date}, およそ{item.typical_interval_days:.0f}日ごとに購入)"
+        for item in due_items
+    ]
+    return "購入周期から見て、そろそろ買う時期の商品:\n" + "\n".join(lines)
+
+
+def build_summary_prompt(
+    user_id: int,
+    summary: schemas.PurchaseHistorySummary,
+    token_budget: int = LLM_PROMPT_TOKEN_BUDGET,
+    due_items: List[schemas.DueItem] | None = None,
+) -> str:
+    """購入履歴の集計 (と、そろそろ買う時期の商品) からLLMに渡すユーザープロンプトを作成する"""
+    history_text = format_history_summary_for_prompt(summary, token_budget)
+    if due_items:
+        history_text += "\n\n" + format_due_items_for_prompt(due_items)
+    return f"""以下が、ユーザーID {user_id}がこれまでに購入した食品の履歴を商品ごとに集計したものです。
+この履歴を参考にして、次回購入すべき食品を提案してください。
+
+{history_text}
+"""
+
+
+def get_current_season(today: date | None = None) -> str:
+    """現在の月を基に季節を返す"""
+    month = (today or date.today()).month
+    if month in [3, 4, 5]:
+        return "春"
+    elif month in [6, 7, 8]:
+        return "夏"
+    elif month in [9, 10, 11]:
+        return "秋"
+    else: # 12, 1, 2
+        return "冬"
+
+
+def suggestion_cache_key(user_prompt: str, season: str) -> str:
+    """
+    提案キャッシュのキー。
+    プロンプト (購入履歴) ・システムプロンプト・プロバイダー・モデル・季節のいずれかが変われば別のキーになる。
+    """
+    provider, model_name = get_model_info()
+    digest = hashlib.sha256()
+    for part in (provider, model_name, season, SYSTEM_TEMPLATE, user_prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
 # --- テスト用コード削除 ---
 # (必要であればAnthropic用に書き直す)
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import json
 import os
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,29 +10,111 @@ import logging # Import logging
 
 # ローカルモジュールを絶対インポート
 import models
-from database import download_db_file_async, upload_db_file_async # Import new async functions
+from database import download_db_file_async # Import new async functions
 import database # Keep this for Depends(database.get_db)
 import crud
 import schemas
 import llm_interface
+import suggestions
+import export
+import serialization
+import metrics
+import profiling
+from product_cache import product_cache
+from singleflight import SingleFlight
+from recommender import recommender
+from repurchase import predictor
 from datetime import date
+from typing import Optional
+import asyncio
+import time
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# 購入履歴の一括登録 (/purchases/batch) で1回に受け付ける最大件数
+PURCHASE_BATCH_MAX_ITEMS = int(os.getenv("PURCHASE_BATCH_MAX_ITEMS", "500"))
+# この秒数以内にLLMが応答しなければ、購入履歴からのおすすめ (recommender) を代わりに返す
+SUGGESTION_LLM_TIMEOUT_SECONDS = float(os.getenv("SUGGESTION_LLM_TIMEOUT_SECONDS", "20"))
+# 起動方法
+# - eager: DBのダウンロード・キャッシュの構築・LLMクライアントの作成が終わってからリクエストを受け付ける
+# - fast: すぐにリクエストを受け付け (ヘルスチェックなど)、DBの準備はバックグラウンドで行う。
+#         DBを使うリクエストは準備の完了を待つ。LLMクライアントは最初の提案のときに作成する (コールドスタート向け)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager").lower()
+# 同じユーザー・同じ履歴に対する提案の生成を1回にまとめる
+suggestion_flights = SingleFlight()
+
 # --- Application Lifespan ---
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+async def prepare_database() -> None:
+    """DBのダウンロード・エンジンの初期化・商品キャッシュとおすすめ/購入周期のモデルの構築"""
     # Startup: Download DB from GCS
     logger.info("Application startup: Downloading database...")
     await download_db_file_async()
     logger.info("Database download complete (or skipped if exists/not found).")
+    await database.init_engine_async()
+    # 商品マスタをキャッシュに読み込んでおく
+    try:
+        async with database.AsyncReadSessionLocal() as db:
+            count = await crud.warm_product_cache(db)
+        logger.info(f"Product cache warmed with {count} products.")
+    except Exception as e:
+        logger.error(f"Failed to warm product cache: {e}", exc_info=True)
+    # 購入履歴からおすすめ (共起) と購入周期の予測を構築しておく
+    try:
+        async with database.AsyncReadSessionLocal() as db:
+            count = await crud.load_purchase_models(db)
+        logger.info(f"Recommender and repurchase predictor built from {count} purchases.")
+    except Exception as e:
+        logger.error(f"Failed to build recommender and repurchase predictor: {e}", exc_info=True)
+
+
+async def _prepare_database_in_background() -> None:
+    """STARTUP_MODE=fast のDBの準備。失敗しても準備の完了として扱う (eager と同じく、DBなしで動き続ける)"""
+    started = time.perf_counter()
+    try:
+        await prepare_database()
+    except Exception as e:
+        logger.error(f"Failed to prepare database: {e}", exc_info=True)
+    finally:
+        database.db_ready.set()
+        logger.info(f"Database ready for requests ({time.perf_counter() - started:.2f}s after startup).")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prepare_task = None
+    if STARTUP_MODE == "fast":
+        database.db_ready.clear()
+        prepare_task = asyncio.create_task(_prepare_database_in_background(), name="db-prepare")
+    else:
+        await prepare_database()
+        # LLMクライアントとプロンプトチェーンは起動時に1度だけ作成し、リクエスト間で使い回す
+        try:
+            llm_interface.init_llm_service()
+        except Exception as e:
+            # APIキー未設定など。提案エンドポイントの呼び出し時に再度作成を試みる
+            logger.error(f"Failed to initialize LLM service: {e}", exc_info=True)
+    # 書き込み後のアップロードはバックグラウンドでまとめて行う
+    database.snapshot_uploader.start()
     yield
-    # Shutdown: Upload DB to GCS
-    logger.info("Application shutdown: Uploading database...")
-    await upload_db_file_async()
-    logger.info("Database upload complete.")
+    if prepare_task is not None and not prepare_task.done():
+        # 準備の途中で終了する場合 (書き込みは受け付けていないので、アップロードするものはない)
+        prepare_task.cancel()
+        try:
+            await prepare_task
+        except asyncio.CancelledError:
+            pass
+    # Shutdown: 未アップロードの変更をGCSへフラッシュ
+    logger.info("Application shutdown: Flushing pending database changes...")
+    if await database.snapshot_uploader.stop():
+        logger.info("Database upload complete.")
+    else:
+        # 次回の起動時に、アップロードできなかった変更を含むローカルDBを上書きしないようにする
+        database.mark_local_unpublished()
+        logger.error("Failed to upload pending database changes; they remain in the local DB only.")
+    await database.dispose_engines_async()
+    await llm_interface.close_llm_service()
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
@@ -53,9 +137,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # すべてのHTTPメソッドを許可
     allow_headers=["*"], # すべてのHTTPヘッダーを許可
+    expose_headers=["X-Next-Cursor", "Server-Timing"], # 履歴のページネーション用カーソルとプロファイリングの計測結果をフロントエンドから読めるようにする
 )
+# ルートごとのレイテンシ・件数を記録する (GET /metrics で取得する)
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+# X-Profile ヘッダー付き (またはサンプリングされた) リクエストをプロファイルする (PROFILING_ENABLED=true のときだけ)
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    if not profiling.PROFILING_TOKEN:
+        logger.warning("PROFILING_TOKEN is not set; X-Profile headers and GET /profiles are disabled (only PROFILING_SAMPLE_RATE applies).")
 # -----------------------------
 
+@app.exception_handler(database.DatabaseNotReady)
+async def database_not_ready_handler(request, exc: database.DatabaseNotReady):
+    """起動時のDBの準備中 (STARTUP_MODE=fast) に待ちきれなかったリクエストには、再試行を促す 503 を返す"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 @app.get("/")
 async def read_root():
     """
@@ -63,6 +161,58 @@ async def read_root():
     """
     return {"message": "Shopping Recommendation API is running!"}
 
+@app.get("/persistence/stats")
+async def persistence_stats():
+    """
+    DBのアップロード状況 (保留中・完了したフラッシュ数、永続化モードなど) を返す
+    """
+    return {**database.snapshot_uploader.stats(), **database.persistence_stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    商品キャッシュの件数・ヒット数・ミス数と、提案生成の同時実行をまとめた件数を返す
+    """
+    return {
+        "products": product_cache.stats(),
+        "suggestion_flights": suggestion_flights.stats(),
+        "recommender": recommender.stats(),
+        "repurchase": predictor.stats(),
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """
+    リクエスト・SQL・DBファイルの転送・LLM呼び出しのメトリクスを Prometheus のテキスト形式で返す
+    """
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def require_profiling_token(x_profile_token: Optional[str] = Header(None)) -> None:
+    """プロファイルの取得には X-Profile-Token ヘッダー (PROFILING_TOKEN) が必要"""
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiling.token_matches(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+@app.get("/profiles", include_in_schema=False, dependencies=[Depends(require_profiling_token)])
+async def list_profiles_endpoint():
+    """
+    保存されているリクエストのプロファイル (pstats 形式) のファイル名を新しい順に返す
+    """
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/profiles/{name}", include_in_schema=False, dependencies=[Depends(require_profiling_token)])
+async def download_profile_endpoint(name: str):
+    """
+    プロファイルをダウンロードする (python -m pstats などで開く)
+    """
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
 # --- ここから下にAPIエンドポイントを追加していく ---
 
 @app.post("/purchase/", response_model=schemas.PurchaseHistory)
@@ -70,36 +220,88 @@ async def create_purchase(purchase: schemas.PurchaseHistoryCreate, db: AsyncSess
     """
     新しい購入履歴を登録する
     """
-    # ユーザーと商品が存在するかチェック
-    db_user = await crud.get_user(db, user_id=purchase.user_id) # await 追加
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    db_product = await crud.get_product(db, product_id=purchase.product_id) # await 追加
-    if db_product is None:
-        # 商品が存在しない場合はエラー
+    # ユーザーと商品の存在確認は登録と同時に行う (どちらかが存在しなければ None)
+    new_purchase = await crud.create_purchase_history(db=db, purchase=purchase)
+    if new_purchase is None:
+        # 登録できなかった場合だけ、どちらが存在しないかを調べる
+        if await crud.get_user(db, user_id=purchase.user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=404, detail="Product not found")
-
-    new_purchase = await crud.create_purchase_history(db=db, purchase=purchase) # await 追加
-    # DB書き込み後にCloud Storageへアップロード
-    try:
-        await database.upload_db_file_async()
-        logger.info(f"Database uploaded after creating purchase {new_purchase.id}")
-    except Exception as e:
-        logger.error(f"Failed to upload database after creating purchase {new_purchase.id}: {e}", exc_info=True)
-        # アップロード失敗はAPIエラーとしない（DB書き込みは成功しているため）
+    # Cloud Storageへのアップロードはバックグラウンドでまとめて行う (ここでは待たない)
+    database.snapshot_uploader.mark_dirty()
     return new_purchase
 
+@app.post("/purchases/batch", response_model=schemas.PurchaseBatchResult)
+async def create_purchases_batch(purchases: list[schemas.PurchaseHistoryCreate], db: AsyncSession = Depends(database.get_db)):
+    """
+    複数の購入履歴 (レシート1枚分など) をまとめて登録する。
+    存在しないユーザー・商品を含む項目は登録せず errors に位置 (index) と理由を返し、残りの項目は登録する
+    """
+    if len(purchases) > PURCHASE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Too many items (max {PURCHASE_BATCH_MAX_ITEMS}).")
+    result = await crud.create_purchase_histories_batch(db, purchases)
+    if result.created:
+        # Cloud Storageへのアップロードはバックグラウンドでまとめて行う (一括登録全体で1回)
+        database.snapshot_uploader.mark_dirty()
+    return result
+
 @app.get("/history/{user_id}", response_model=list[schemas.PurchaseHistory])
-async def read_purchase_history(user_id: int, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db)): # Session -> AsyncSession
+async def read_purchase_history(
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(database.get_read_db),
+):
     """
     指定されたユーザーの購入履歴を取得する
+    次ページがある場合は X-Next-Cursor ヘッダーにカーソルを返す。cursor に指定すると続きを取得できる (skip より高速)
     """
     db_user = await crud.get_user(db, user_id=user_id) # await 追加
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    history = await crud.get_purchase_history(db, user_id=user_id, skip=skip, limit=limit) # await 追加
-    # history は ORM オブジェクトのリスト。Pydanticがレスポンスモデルに合わせて自動変換
-    return history
+    try:
+        history, next_cursor = await crud.get_purchase_history_page(
+            db, user_id=user_id, limit=limit, skip=skip, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # history はSQLの結果から組み立てた response_model と同じ形の辞書のリスト。
+    # 1ページが数千行になっても Pydantic での検証を繰り返さないよう、orjson で直接エンコードする
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return serialization.ORJSONResponse(history, headers=headers)
+
+# --- 購入履歴のエクスポート ---
+@app.get("/export/purchases")
+async def export_purchases_endpoint(
+    format: str = "ndjson",
+    user_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    購入履歴 (商品名・カテゴリ付き) を NDJSON / CSV / Parquet でストリーミングして返す。
+    user_id で特定のユーザー、start_date〜end_date (両端を含む) で期間に絞り込める
+    """
+    try:
+        encoder = export.get_encoder(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    statement = export.export_statement(user_id=user_id, start_date=start_date, end_date=end_date)
+    await database.wait_until_ready()
+
+    async def body():
+        # 送り終えるまで読み取り用のセッション (サーバーサイドカーソル) を保持する
+        async with database.AsyncReadSessionLocal() as db:
+            async for chunk in export.export_chunks(db, encoder, statement):
+                yield chunk
+
+    filename = f"purchase_history{f'_user{user_id}' if user_id is not None else ''}.{encoder.extension}"
+    return StreamingResponse(
+        body(),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 # --- ユーザー作成エンドポイント (テスト用) ---
 @app.post("/users/", response_model=schemas.User)
@@ -109,17 +311,12 @@ async def create_user_endpoint(user: schemas.UserCreate, db: AsyncSession = Depe
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     new_user = await crud.create_user(db=db, user=user) # await 追加
-    # DB書き込み後にCloud Storageへアップロード
-    try:
-        await database.upload_db_file_async()
-        logger.info(f"Database uploaded after creating user {new_user.id}")
-    except Exception as e:
-        logger.error(f"Failed to upload database after creating user {new_user.id}: {e}", exc_info=True)
+    database.snapshot_uploader.mark_dirty()
     return new_user
 
 # --- ユーザー検索エンドポイント ---
 @app.get("/users/search", response_model=list[schemas.User])
-async def search_users_endpoint(q: str = "", db: AsyncSession = Depends(database.get_db)): # def -> async def, Session -> AsyncSession
+async def search_users_endpoint(q: str = "", db: AsyncSession = Depends(database.get_read_db)): # def -> async def, Session -> AsyncSession
     """
     クエリ文字列に名前が部分一致するユーザーを検索する
     """
@@ -131,20 +328,17 @@ async def search_users_endpoint(q: str = "", db: AsyncSession = Depends(database
 # --- 商品作成エンドポイント (テスト用) ---
 @app.post("/products/", response_model=schemas.Product)
 async def create_product_endpoint(product: schemas.ProductCreate, db: AsyncSession = Depends(database.get_db)): # def -> async def, Session -> AsyncSession
-    """新しい商品を作成する"""
-    # 簡単のため、同名商品の重複チェックは省略
+    """新しい商品を作成する。同じ名前 (全角・半角、大文字・小文字、空白の違いは無視) の商品があれば、作らずにそれを返す"""
+    existing = await crud.get_product_by_name(db, product.name)
+    if existing is not None:
+        return existing
     new_product = await crud.create_product(db=db, product=product) # await 追加
-    # DB書き込み後にCloud Storageへアップロード
-    try:
-        await database.upload_db_file_async()
-        logger.info(f"Database uploaded after creating product {new_product.id}")
-    except Exception as e:
-        logger.error(f"Failed to upload database after creating product {new_product.id}: {e}", exc_info=True)
+    database.snapshot_uploader.mark_dirty()
     return new_product
 
 # --- 商品検索エンドポイント ---
 @app.get("/products/search", response_model=list[schemas.Product])
-async def search_products_endpoint(q: str = "", db: AsyncSession = Depends(database.get_db)): # def -> async def, Session -> AsyncSession
+async def search_products_endpoint(q: str = "", db: AsyncSession = Depends(database.get_read_db)): # def -> async def, Session -> AsyncSession
     """
     クエリ文字列に名前が部分一致する商品を検索する
     """
@@ -153,67 +347,172 @@ async def search_products_endpoint(q: str = "", db: AsyncSession = Depends(datab
     products = await crud.search_products_by_name(db=db, query=q) # await 追加
     return products
 
-# --- ヘルパー関数: 現在の季節を取得 ---
-# DBアクセス不要なので同期関数のまま
-def get_current_season() -> str:
-    """現在の月を基に季節を返す"""
-    month = date.today().month
-    if month in [3, 4, 5]:
-        return "春"
-    elif month in [6, 7, 8]:
-        return "夏"
-    elif month in [9, 10, 11]:
-        return "秋"
-    else: # 12, 1, 2
-        return "冬"
-
 # --- 商品提案エンドポイント ---
-@app.get("/suggest/{user_id}", response_model=schemas.SuggestionResponse)
-async def suggest_items_endpoint(user_id: int, db: AsyncSession = Depends(database.get_db)): # Session -> AsyncSession
+async def _prepare_suggestion(db: AsyncSession, user_id: int):
     """
-    指定されたユーザーにおすすめの商品をLLMを使って提案する
+    提案用のプロンプトとキャッシュキーを作成し、有効なキャッシュがあれば併せて返す。
+    戻り値: (プロンプト, 季節, キャッシュキー, キャッシュ (なければ None))
     """
     # ユーザー存在チェック
     db_user = await crud.get_user(db, user_id=user_id) # await 追加
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # 購入履歴を取得
-    history_orm = await crud.get_purchase_history(db, user_id=user_id)
+    prompt, season, cache_key = await suggestions.build_prompt(db, user_id)
+    # 履歴・モデル・季節が前回と同じで、有効期限内の提案 (バッチで事前に生成したものを含む) があればLLMを呼ばずに返す
+    cached = await suggestions.get_cached(db, user_id, cache_key)
+    return prompt, season, cache_key, cached
 
-    # PurchaseHistoryオブジェクトを辞書のリストに変換 (Pydanticモデル経由)
-    # Pydantic V2 を想定: model_validate と model_dump
+async def _save_suggestion(user_id: int, cache_key: str, season: str, suggestion_text: str) -> None:
+    """提案をキャッシュに保存する (読み取り専用セッションとは別の書き込み用セッションを使う)"""
     try:
-        # mode='json' は datetime オブジェクトなどをISO形式文字列に変換する
-        history_dict = [schemas.PurchaseHistory.model_validate(item).model_dump(mode='json') for item in history_orm]
-    except AttributeError: # Pydantic V1 fallback
-        # V1 の from_orm はネストしたリレーションを自動で読み込まない場合があるため注意
-        # crud側で selectinload しているので大丈夫なはず
-        history_dict = [schemas.PurchaseHistory.from_orm(item).dict() for item in history_orm]
+        async with database.AsyncSessionLocal() as write_db:
+            saved = await suggestions.save(write_db, user_id, cache_key, season, suggestion_text)
+        if saved:
+            database.snapshot_uploader.mark_dirty()
+    except Exception as e:
+        # キャッシュの保存に失敗しても提案自体は返す
+        logger.error(f"Failed to cache suggestions for user {user_id}: {e}", exc_info=True)
 
+async def _recommendations(db: AsyncSession, user_id: int, limit: int, include_purchased: bool = True) -> list[schemas.Recommendation]:
+    ranked = recommender.recommend(user_id, limit=limit, include_purchased=include_purchased)
+    products = await crud.get_products_by_ids(db, (product_id for product_id, _ in ranked))
+    return [
+        schemas.Recommendation(product=products[product_id], score=score)
+        for product_id, score in ranked
+        if product_id in products
+    ]
 
-    # 現在の季節を取得
-    # current_season = get_current_season()
+async def _fallback_suggestion_text(db: AsyncSession, user_id: int) -> str:
+    """LLMの代わりに、購入履歴からのおすすめを提案と同じ形式のテキストにする"""
+    recommendations = await _recommendations(db, user_id, limit=15)
+    if not recommendations:
+        return ""
+    lines = ["## 【提案商品】"] + [f"- {item.product.name}" for item in recommendations]
+    lines += ["", "(AIによる提案を取得できなかったため、購入履歴から一緒に買われることの多い商品を表示しています)"]
+    return "\n".join(lines)
 
-    # LLMへのプロンプトを作成
-    # llm_interface.format_purchase_history_for_prompt は history_dict を受け取るように修正が必要かもしれない
-    history_text = llm_interface.format_purchase_history_for_prompt(history_dict) # 辞書リストを渡す
-    prompt = f"""以下が、ユーザーID {user_id}がこれまでに購入した食品の履歴です。
-この履歴を参考にして、次回購入すべき食品を提案してください。
+@app.get("/recommend/{user_id}", response_model=list[schemas.Recommendation])
+async def recommend_items_endpoint(
+    user_id: int, limit: int = Query(10, ge=1, le=100), include_purchased: bool = True, db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    購入履歴の共起 (同じ日に一緒に買われた商品) から、ユーザーへのおすすめ商品をスコアの高い順に返す (LLMは使わない)
+    include_purchased=false で、ユーザーがまだ買ったことのない商品だけにする
+    """
+    db_user = await crud.get_user(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await _recommendations(db, user_id, limit=limit, include_purchased=include_purchased)
 
-{history_text}
-"""
+@app.get("/due/{user_id}", response_model=list[schemas.DueItem])
+async def due_items_endpoint(
+    user_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    min_probability: float = Query(0.5, ge=0, le=1),
+    as_of: Optional[date] = None,
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """
+    商品ごとの購入周期から、そろそろ買う時期の商品を確率の高い順に返す (LLMは使わない)
+    as_of を指定すると、その日時点で予測する (省略時は今日)
+    """
+    db_user = await crud.get_user(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await crud.get_due_items(db, user_id, today=as_of, limit=limit, min_probability=min_probability)
 
-    # LLMから提案を生成 (llm_interface.py内の関数が同期的なのでawait不要)
-    suggestion_text = llm_interface.generate_suggestions(user_prompt=prompt) # 引数名を user_prompt に変更
+@app.get("/suggest/{user_id}", response_model=schemas.SuggestionResponse)
+async def suggest_items_endpoint(user_id: int, db: AsyncSession = Depends(database.get_read_db)): # Session -> AsyncSession
+    """
+    指定されたユーザーにおすすめの商品をLLMを使って提案する
+    """
+    prompt, season, cache_key, cached = await _prepare_suggestion(db, user_id)
+    if cached is not None:
+        return schemas.SuggestionResponse(
+            suggestions_text=cached.suggestions_text,
+            cached=True,
+            cache_age_seconds=crud.suggestion_cache_age_seconds(cached),
+        )
 
-    if not suggestion_text:
-        raise HTTPException(status_code=500, detail="Failed to generate suggestions from LLM.")
+    async def generate() -> str:
+        # LLMから提案を生成 (応答を待つ間も他のリクエストを処理できるよう非同期で呼ぶ)
+        suggestion_text = await llm_interface.agenerate_suggestions(user_prompt=prompt)
+        if suggestion_text:
+            await _save_suggestion(user_id, cache_key, season, suggestion_text)
+        return suggestion_text
 
-    # (オプション) 提案内容をDBに保存する処理をここに追加可能 (非同期で)
+    # 同じユーザー・同じ履歴の生成が実行中なら、LLMを呼ばずにその結果を待つ
+    # (呼び出し元が切断されたりタイムアウトしたりしても生成は続き、結果はキャッシュに保存される)
+    try:
+        suggestion_text = await asyncio.wait_for(
+            suggestion_flights.run((user_id, cache_key), generate), timeout=SUGGESTION_LLM_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"LLM did not respond within {SUGGESTION_LLM_TIMEOUT_SECONDS}s for user {user_id}; using recommender.")
+        suggestion_text = ""
+
+    if not suggestion_text:
+        # LLMがタイムアウト・失敗した場合は、購入履歴からのおすすめを返す
+        fallback_text = await _fallback_suggestion_text(db, user_id)
+        if not fallback_text:
+            raise HTTPException(status_code=500, detail="Failed to generate suggestions from LLM.")
+        return schemas.SuggestionResponse(suggestions_text=fallback_text, fallback=True)
 
     return schemas.SuggestionResponse(suggestions_text=suggestion_text)
 
+def _sse_event(event: str, data: dict) -> str:
+    """Server-Sent Events の1イベント"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/suggest/{user_id}/stream")
+async def suggest_items_stream_endpoint(user_id: int, db: AsyncSession = Depends(database.get_read_db)):
+    """
+    /suggest/{user_id} のストリーミング版。LLMが生成したテキストを Server-Sent Events で順に送る。
+
+    イベント:
+        token: {"text": 生成されたテキストの断片}
+        done:  {"cached": bool, "cache_age_seconds": float | null, "fallback": bool (購入履歴からのおすすめで代用した場合)}
+        error: {"detail": エラー内容}
+    """
+    # DBの読み取りはストリーミング開始前に済ませる
+    prompt, season, cache_key, cached = await _prepare_suggestion(db, user_id)
+
+    async def event_stream():
+        if cached is not None:
+            yield _sse_event("token", {"text": cached.suggestions_text})
+            yield _sse_event("done", {"cached": True, "cache_age_seconds": crud.suggestion_cache_age_seconds(cached), "fallback": False})
+            return
+        parts = []
+        try:
+            async for token in llm_interface.astream_suggestions(prompt):
+                parts.append(token)
+                yield _sse_event("token", {"text": token})
+        except Exception as e:
+            logger.error(f"Failed to stream suggestions for user {user_id}: {e}", exc_info=True)
+            if not parts:
+                # まだ何も送っていなければ、購入履歴からのおすすめを代わりに送る
+                async with database.AsyncReadSessionLocal() as fallback_db:
+                    fallback_text = await _fallback_suggestion_text(fallback_db, user_id)
+                if fallback_text:
+                    yield _sse_event("token", {"text": fallback_text})
+                    yield _sse_event("done", {"cached": False, "cache_age_seconds": None, "fallback": True})
+                    return
+            yield _sse_event("error", {"detail": "Failed to generate suggestions from LLM."})
+            return
+        suggestion_text = "".join(parts).strip()
+        if not suggestion_text:
+            yield _sse_event("error", {"detail": "Failed to generate suggestions from LLM."})
+            return
+        await _save_suggestion(user_id, cache_key, season, suggestion_text)
+        yield _sse_event("done", {"cached": False, "cache_age_seconds": None, "fallback": False})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # プロキシでバッファリングさせない
+    )
+
 
 # -------------------------------------------------
 
@@ -0,0 +1,313 @@
+"""
+アプリケーションのメトリクス (Prometheus のテキスト形式で GET /metrics から取得する)。
+
+記録するもの:
+    - HTTPリクエスト: ルート (パスのテンプレート) ごとのレイテンシのヒストグラムと件数 (MetricsMiddleware)
+    - SQL: 文の種類 (SELECT / INSERT ...) とエンジン (writer / reader) ごとの実行時間 (instrument_engine)
+    - DBファイルの転送: ダウンロード・アップロードの時間と転送バイト数 (database)
+    - LLM: 呼び出しのレイテンシ、最初のトークンまでの時間、トークン数 (llm_interface)
+
+記録時はラベルに対応する値を1つ加算するだけにし (ヒストグラムも該当するバケットだけを加算する)、
+累積値の計算やテキストへの整形はスクレイプされたときにだけ行う。スクレイプされなければ、
+1回の記録はラベルの辞書引きと加算程度のコストで済む。METRICS_ENABLED=false で記録自体を、
+METRICS_SQL_ENABLED=false でSQL文ごとの計測だけを無効にできる。
+
+prometheus_client には依存しない (必要なのはカウンターとヒストグラムだけなので)。
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# SQL文ごとの計測だけを無効にする (SQLAlchemy のイベントの呼び出し自体に1文あたり十数マイクロ秒かかるため)
+METRICS_SQL_ENABLED = METRICS_ENABLED and os.getenv("METRICS_SQL_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# この時間 (ミリ秒) 以上かかったSQL文をログに出す (0 で無効)
+SQL_SLOW_STATEMENT_MS = float(os.getenv("SQL_SLOW_STATEMENT_MS", "0"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ヒストグラムのバケット (秒)
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+TRANSFER_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, lock: threading.Lock, bounds: tuple[float, ...]):
+        self._lock = lock
+        self._bounds = bounds
+        # バケットごとの件数 (累積ではない。最後の要素は +Inf のバケット)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._bounds, value) # le (以下) なので、値と等しい上限のバケットに入る
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """ラベルの値 (labelnames の順) に対応する系列を返す"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def _render_child(self, values, child) -> list[str]:
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.buckets)
+
+    def _render_child(self, values, child) -> list[str]:
+        with self._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    """登録されたすべてのメトリクスを Prometheus のテキスト形式で返す"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- メトリクスの定義 ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the last body chunk is sent.",
+    ("method", "route"), HTTP_BUCKETS,
+)
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by status code.", ("method", "route", "status"))
+
+SQL_STATEMENT_SECONDS = Histogram(
+    "sql_statement_duration_seconds", "SQL statement execution time (cursor execute).",
+    ("engine", "statement"), SQL_BUCKETS,
+)
+SQL_STATEMENT_ERRORS = Counter("sql_statement_errors_total", "SQL statements that raised an error.", ("engine", "statement"))
+
+STORAGE_TRANSFER_SECONDS = Histogram(
+    "db_storage_transfer_duration_seconds", "Time spent transferring the database to/from object storage.",
+    ("operation", "outcome"), TRANSFER_BUCKETS,
+)
+STORAGE_TRANSFER_BYTES = Counter(
+    "db_storage_transfer_bytes_total", "Bytes transferred to/from object storage (compressed size).", ("operation",),
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "LLM call latency until the full response is received.",
+    ("provider", "model", "mode", "outcome"), LLM_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed chunk of an LLM response.",
+    ("provider", "model"), LLM_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "LLM token usage (source=reported by the API, or estimated when the API does not report it).",
+    ("provider", "model", "type", "source"),
+)
+
+
+# --- HTTPリクエスト ---
+class MetricsMiddleware:
+    """
+    ルートごとのレイテンシと件数を記録するASGIミドルウェア。
+    ラベルにはパスそのものではなくルートのテンプレート (/history/{user_id} など) を使い、
+    どのルートにも一致しなかったリクエストは "<unmatched>" にまとめる (系列が増え続けないように)。
+    ストリーミングレスポンスは最後のチャンクを送り終えるまでを計測する。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500 # レスポンスを返す前に例外になった場合
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+
+
+# --- SQL ---
+_SQL_VERBS = frozenset({
+    "SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA",
+    "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "CREATE", "DROP", "ALTER",
+})
+
+
+def _statement_verb(statement: str) -> str:
+    """SQL文の種類 (先頭のキーワード)。文全体をラベルにすると IN 句の展開などで系列が増え続けるため使わない"""
+    head = statement[:16].split(None, 1)
+    verb = head[0].upper() if head else ""
+    return verb if verb in _SQL_VERBS else "OTHER"
+
+
+# 文字列ごとにキャッシュするSQL文の数の上限 (コンパイル済みの文はキャッシュされるので、通常は数十〜数百種類)
+_SQL_STATEMENT_CACHE_MAX = 1024
+
+
+def instrument_engine(sync_engine, engine_name: str) -> None:
+    """エンジンで実行するSQL文の実行時間を記録する (AsyncEngine の場合は .sync_engine を渡す)"""
+    if not METRICS_SQL_ENABLED:
+        return
+    # SQL文の文字列 -> 記録先の系列。同じ文を実行するたびに種類を判定・ラベルを引き直さないようにする
+    series_by_statement: dict[str, _HistogramChild] = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        series = series_by_statement.get(statement)
+        if series is None:
+            series = SQL_STATEMENT_SECONDS.labels(engine_name, _statement_verb(statement))
+            if len(series_by_statement) < _SQL_STATEMENT_CACHE_MAX:
+                series_by_statement[statement] = series
+        series.observe(elapsed)
+        if SQL_SLOW_STATEMENT_MS and elapsed * 1000 >= SQL_SLOW_STATEMENT_MS:
+            logger.warning(f"Slow SQL statement on {engine_name} ({elapsed * 1000:.1f} ms): {statement}")
+
+    def handle_error(exception_context):
+        statement = exception_context.statement or ""
+        SQL_STATEMENT_ERRORS.labels(engine_name, _statement_verb(statement)).inc()
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_error)
+
+
+# --- DBファイルの転送 ---
+def timed_transfer(operation: str):
+    """
+    DBファイルを転送する非同期関数の所要時間を記録するデコレーター。
+    関数は成功時に True を返すこと (False なら outcome="error" として記録する)。
+    転送したバイト数は関数の中で STORAGE_TRANSFER_BYTES に加算する。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                ok = await func(*args, **kwargs)
+                return ok
+            finally:
+                elapsed = time.perf_counter() - start
+                STORAGE_TRANSFER_SECONDS.labels(operation, "ok" if ok else "error").observe(elapsed)
+                if profiling.PROFILING_ENABLED:
+                    profiling.add_phase("storage", elapsed)
+        return wrapper
+    return decorator
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base # database.pyで定義したBaseクラスをインポート
 
@@ -36,6 +36,11 @@ class PurchaseHistory(Base):
     owner = relationship("User", back_populates="purchase_history")
     product = relationship("Product", back_populates="purchase_history")
 
+    __table_args__ = (
+        # ユーザーごとの履歴を新しい順に取得するための複合インデックス (キーセットページネーション用)
+        Index("ix_purchase_history_user_id_purchase_date", "user_id", purchase_date.desc(), "id"),
+    )
+
 class Suggestion(Base):
     __tablename__ = "suggestions"
 
@@ -48,3 +53,15 @@ class Suggestion(Base):
 
     user = relationship("User", back_populates="suggestions")
     product = relationship("Product", back_populates="suggestions")
+
+class SuggestionCache(Base):
+    """LLMが生成した提案テキストのキャッシュ (ユーザーごとに最新の1件)"""
+    __tablename__ = "suggestion_cache"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    cache_key = Column(String(64), nullable=False) # 履歴・モデル・季節から計算したハッシュ
+    provider = Column(String)
+    model = Column(String)
+    season = Column(String)
+    suggestions_text = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False) # UTC
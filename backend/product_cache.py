@@ -0,0 +1,90 @@
+"""
+商品マスタのインメモリキャッシュ。
+
+products テーブルはほとんど更新されないため、購入登録時の存在チェックや
+購入履歴への商品情報の付与は、このキャッシュにヒットすればDBへ問い合わせない。
+ID と正規化した商品名の両方で O(1) に引けるようにし、件数の上限を超えたら
+最も長く使われていない商品から追い出す (LRU)。
+
+アプリ起動時に warm され、crud.create_product で追加・更新される。
+すべての商品を読み込めていれば (complete)、名前で引けない商品はDBにもない。
+"""
+import os
+import unicodedata
+from collections import OrderedDict
+
+import schemas
+
+PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", "10000"))
+
+
+def normalize_name(name: str) -> str:
+    """全角・半角や大文字・小文字、余分な空白の違いを吸収した商品名"""
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+class ProductCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._by_id: OrderedDict[int, schemas.Product] = OrderedDict()
+        self._id_by_name: dict[str, int] = {}
+        self.complete = False # DBのすべての商品を保持している (warm で上限内に収まり、追い出していない)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, product_id: int) -> schemas.Product | None:
+        product = self._by_id.get(product_id)
+        if product is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._by_id.move_to_end(product_id)
+        return product
+
+    def get_by_name(self, name: str) -> schemas.Product | None:
+        product_id = self._id_by_name.get(normalize_name(name))
+        if product_id is None:
+            self.misses += 1
+            return None
+        return self.get(product_id)
+
+    def put(self, product) -> schemas.Product:
+        """商品 (ORMオブジェクトまたはスキーマ) をキャッシュに追加・更新し、キャッシュしたスキーマを返す"""
+        cached = schemas.Product.model_validate(product)
+        old = self._by_id.pop(cached.id, None)
+        if old is not None and self._id_by_name.get(normalize_name(old.name)) == old.id:
+            del self._id_by_name[normalize_name(old.name)]
+        self._by_id[cached.id] = cached
+        # 同名の商品が複数ある場合は先に登録されたものを優先する
+        self._id_by_name.setdefault(normalize_name(cached.name), cached.id)
+        while len(self._by_id) > self.max_entries:
+            _, evicted = self._by_id.popitem(last=False)
+            if self._id_by_name.get(normalize_name(evicted.name)) == evicted.id:
+                del self._id_by_name[normalize_name(evicted.name)]
+            self.evictions += 1
+            self.complete = False
+        return cached
+
+    def clear(self) -> None:
+        self._by_id.clear()
+        self._id_by_name.clear()
+        self.complete = False
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._by_id),
+            "max_entries": self.max_entries,
+            "complete": self.complete,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+product_cache = ProductCache(max_entries=PRODUCT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,212 @@
+"""
+リクエスト単位のプロファイリング (本番で遅いリクエストの原因を調べる用。既定では無効)。
+
+PROFILING_ENABLED=true のときだけ ProfilingMiddleware を組み込み、次のリクエストを対象にする:
+    - X-Profile: 1 (または profile) ヘッダー付きのリクエスト → cProfile で計測し、プロファイルを保存する
+    - X-Profile: timing ヘッダー付きのリクエスト → フェーズごとの時間だけを計測する
+    - PROFILING_SAMPLE_RATE の割合で無作為に選んだリクエスト → cProfile で計測する
+X-Profile ヘッダーは、X-Profile-Token ヘッダーが PROFILING_TOKEN と一致するときだけ受け付ける
+(PROFILING_TOKEN が未設定ならサンプリングだけが有効)。
+
+トークンが一致したリクエストには Server-Timing ヘッダーで、フェーズ (db, serialize, prompt, llm, storage) ごとの合計時間と
+レスポンスを返し始めるまでの時間 (total) を付ける。ストリーミングレスポンスではヘッダーを送る時点までの値になる
+(リクエスト全体の値はログに出す)。プロファイルは pstats 形式で PROFILE_DIR に保存し
+(python -m pstats や snakeviz で開ける)、PROFILE_MAX_FILES を超えたら古いものから削除する。
+GET /profiles で一覧、GET /profiles/{name} でダウンロードできる (どちらも X-Profile-Token が必要)。
+
+無効のときはミドルウェアもSQLのイベントも登録せず、各フェーズの計測箇所も
+PROFILING_ENABLED の分岐1つだけで済む。
+cProfile はスレッド全体を計測するので、同時に処理している別のリクエストの処理も含まれる
+(同時に計測するのは1リクエストだけにする)。SQLite へのクエリは aiosqlite のスレッドで実行されるため
+プロファイルには現れない。その時間は db フェーズで確認する。
+"""
+import asyncio
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+# ヘッダーがなくてもプロファイルを取るリクエストの割合 (0〜1)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_HEADER = b"x-profile"
+# X-Profile ヘッダーと GET /profiles に必要なトークン (プロファイルには内部のパスや呼び出し関係が含まれるため)
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+
+# フェーズの表示順 (Server-Timing に載せる順)
+PHASES = ("db", "serialize", "prompt", "llm", "storage")
+
+# 計測中のリクエストのフェーズごとの合計時間 (秒)。計測対象でなければ None
+_current_phases: ContextVar[dict[str, float] | None] = ContextVar("profiling_phases", default=None)
+_profile_active = False
+
+
+def add_phase(name: str, seconds: float) -> None:
+    """計測中のリクエストのフェーズに時間を加算する (呼び出し側で PROFILING_ENABLED を確認してから呼ぶ)"""
+    phases = _current_phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    """with ブロックの時間をフェーズに加算する (呼び出し側で PROFILING_ENABLED を確認してから使う)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+def server_timing(phases: dict[str, float], total: float, profile_name: str | None = None) -> str:
+    """Server-Timing ヘッダーの値 (時間はミリ秒)"""
+    names = [name for name in PHASES if name in phases] + sorted(set(phases) - set(PHASES))
+    entries = [f"{name};dur={phases[name] * 1000:.2f}" for name in names]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    if profile_name:
+        entries.append(f'profile;desc="{profile_name}"')
+    return ", ".join(entries)
+
+
+def token_matches(value: str | None) -> bool:
+    """PROFILING_TOKEN と一致するか (未設定なら常に False)"""
+    if not PROFILING_TOKEN or value is None:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), PROFILING_TOKEN.encode("utf-8"))
+
+
+def _requested_mode(scope) -> tuple[str | None, bool]:
+    """
+    リクエストの計測方法 ("profile" / "timing" / None (計測しない)) と、
+    トークンが一致したか (X-Profile ヘッダーを受け付け、Server-Timing ヘッダーを付けるか)
+    """
+    headers = dict(scope["headers"])
+    token = headers.get(PROFILE_TOKEN_HEADER)
+    authorized = token is not None and token_matches(token.decode("latin-1"))
+    if authorized and PROFILE_HEADER in headers:
+        value = headers[PROFILE_HEADER].decode("latin-1").strip().lower()
+        if value == "timing":
+            return "timing", True
+        if value in ("1", "true", "profile"):
+            return "profile", True
+    if PROFILING_SAMPLE_RATE and random.random() < PROFILING_SAMPLE_RATE:
+        return "profile", authorized
+    return None, authorized
+
+
+def _profile_name(scope) -> str:
+    now = time.time()
+    path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{scope['method']}-{path[:60]}.prof"
+
+
+def _save_profile(profiler: cProfile.Profile, name: str) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    _prune_profiles()
+
+
+def _prune_profiles() -> None:
+    """PROFILE_MAX_FILES を超えた分を古いものから削除する"""
+    names = list_profiles()
+    for name in names[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles() -> list[str]:
+    """保存されているプロファイルのファイル名 (新しい順)"""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)
+
+
+def profile_path(name: str) -> str | None:
+    """プロファイルのファイルパス (PROFILE_DIR 以外を指す名前や、存在しない場合は None)"""
+    if os.path.basename(name) != name or not name.endswith(".prof"):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """対象のリクエストのフェーズごとの時間を計測し、必要なら cProfile でプロファイルを取るASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _profile_active
+        mode, authorized = _requested_mode(scope) if scope["type"] == "http" else (None, False)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        profile_name = None
+        if mode == "profile" and not _profile_active:
+            _profile_active = True
+            profiler = cProfile.Profile()
+            profile_name = _profile_name(scope)
+        phases: dict[str, float] = {}
+        token = _current_phases.set(phases)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            # 計測結果は、トークンが一致したリクエストのレスポンスにだけ付ける (サンプリングされただけならログのみ)
+            if message["type"] == "http.response.start" and authorized:
+                value = server_timing(phases, time.perf_counter() - start, profile_name)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+
+        if profiler is not None:
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profile_active = False
+            _current_phases.reset(token)
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                try:
+                    await asyncio.to_thread(_save_profile, profiler, profile_name)
+                except Exception as e:
+                    logger.error(f"Failed to save profile {profile_name}: {e}", exc_info=True)
+                    profile_name = None
+            logger.info(f"Profiled {scope['method']} {scope['path']}: {server_timing(phases, elapsed, profile_name)}")
+
+
+def instrument_engine(sync_engine) -> None:
+    """計測中のリクエストで実行したSQL文の時間を db フェーズに加算する (無効なら何もしない)"""
+    if not PROFILING_ENABLED:
+        return
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and _current_phases.get() is not None:
+            context._profiling_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_profiling_started", None)
+        if started is not None:
+            add_phase("db", time.perf_counter() - started)
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
@@ -0,0 +1,81 @@
+"""
+購入履歴の共起 (一緒に買われた回数) にもとづく商品のおすすめ。
+
+同じユーザーが同じ日に購入した商品を1つの「買い物かご」とみなし、商品×商品の共起回数を
+疎な辞書で保持する。ユーザーへのおすすめは、そのユーザーが購入した商品と一緒に買われやすい商品を
+コサイン類似度 (共起回数 / sqrt(商品Aのかご数 × 商品Bのかご数)) で重み付けして合計したスコアの高い順。
+購入履歴のないユーザーには、よく買われている商品を返す。
+
+アプリ起動時に購入履歴全体から構築し (crud.load_purchase_models)、以降は
+crud.create_purchase_history で追加された購入を逐次反映する。LLMを使わないので数ミリ秒で応答でき、
+/suggest でLLMが応答しない場合の代わりにも使う。
+"""
+import math
+from collections import defaultdict
+from datetime import date
+
+
+class CooccurrenceRecommender:
+    def __init__(self):
+        self._baskets: dict[tuple[int, date], set[int]] = defaultdict(set) # (ユーザー, 購入日) -> 商品
+        self._cooccurrence: dict[int, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._basket_counts: dict[int, int] = defaultdict(int) # 商品 -> その商品を含むかごの数
+        self._user_items: dict[int, dict[int, int]] = defaultdict(lambda: defaultdict(int)) # ユーザー -> 商品 -> 購入回数
+
+    def add_purchase(self, user_id: int, product_id: int, purchase_date: date) -> None:
+        """購入を1件反映する"""
+        self._user_items[user_id][product_id] += 1
+        basket = self._baskets[(user_id, purchase_date)]
+        if product_id in basket: # 同じ日の同じ商品は共起を数え直さない
+            return
+        for other in basket:
+            self._cooccurrence[product_id][other] += 1
+            self._cooccurrence[other][product_id] += 1
+        basket.add(product_id)
+        self._basket_counts[product_id] += 1
+
+    def clear(self) -> None:
+        self._baskets.clear()
+        self._cooccurrence.clear()
+        self._basket_counts.clear()
+        self._user_items.clear()
+
+    def similarity(self, product_a: int, product_b: int) -> float:
+        count = self._cooccurrence.get(product_a, {}).get(product_b, 0)
+        if not count:
+            return 0.0
+        return count / math.sqrt(self._basket_counts[product_a] * self._basket_counts[product_b])
+
+    def recommend(self, user_id: int, limit: int = 10, include_purchased: bool = True) -> list[tuple[int, float]]:
+        """ユーザーへのおすすめ商品を (商品ID, スコア) のリストでスコアの高い順に返す"""
+        user_items = self._user_items.get(user_id)
+        if not user_items:
+            return self.popular(limit)
+        scores: dict[int, float] = defaultdict(float)
+        for product_id, purchase_count in user_items.items():
+            weight = 1.0 + math.log(purchase_count) # よく買う商品ほど重視するが、回数の差は緩やかにする
+            neighbors = self._cooccurrence.get(product_id, {})
+            for other, count in neighbors.items():
+                scores[other] += weight * count / math.sqrt(self._basket_counts[product_id] * self._basket_counts[other])
+        if not include_purchased:
+            for product_id in user_items:
+                scores.pop(product_id, None)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+        return [(product_id, round(score, 4)) for product_id, score in ranked]
+
+    def popular(self, limit: int = 10) -> list[tuple[int, float]]:
+        """よく買われている商品 (含まれるかごの数が多い順)。スコアはかご全体に占める割合"""
+        total = len(self._baskets)
+        ranked = sorted(self._basket_counts.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+        return [(product_id, round(count / total, 4)) for product_id, count in ranked]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._user_items),
+            "products": len(self._basket_counts),
+            "baskets": len(self._baskets),
+            "product_pairs": sum(len(neighbors) for neighbors in self._cooccurrence.values()) // 2,
+        }
+
+
+recommender = CooccurrenceRecommender()
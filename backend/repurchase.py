@@ -0,0 +1,205 @@
+"""
+商品ごとの購入周期から「そろそろ買う時期」の商品を予測する。
+
+(ユーザー, 商品) ごとに購入日の間隔を対数正規分布とみなし、その平均・分散を
+購入日の間隔の対数の和・二乗和として保持する。最後の購入からの経過日数が、この分布で
+「次の購入までの間隔」以下になる確率 (累積分布関数) を、今買う時期である確率とする。
+購入が少なく分散を推定しにくい商品は、事前の分散 (REPURCHASE_PRIOR_SIGMA) に寄せる。
+
+アプリ起動時に全ユーザーの購入履歴から NumPy でまとめて計算し (build)、以降は
+crud.create_purchase_history で追加された購入を逐次反映する。最終購入日より前の日付の購入が
+追加された場合は、そのユーザーを古い状態として扱い、次に参照したときに購入履歴から計算し直す。
+"""
+import math
+import os
+from datetime import date
+
+import numpy as np
+
+# 購入間隔の対数の標準偏差の事前値と、その重み (間隔の数に換算)
+REPURCHASE_PRIOR_SIGMA = float(os.getenv("REPURCHASE_PRIOR_SIGMA", "0.5"))
+REPURCHASE_PRIOR_WEIGHT = float(os.getenv("REPURCHASE_PRIOR_WEIGHT", "2"))
+
+
+def _normal_cdf(z: np.ndarray) -> np.ndarray:
+    """標準正規分布の累積分布関数 (erf の近似式 Abramowitz & Stegun 7.1.26、誤差 1.5e-7 以下)"""
+    x = np.abs(z) / math.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+
+class _UserCycles:
+    """1ユーザーの商品ごとの購入周期の統計 (配列の i 番目が products[i] の値)"""
+
+    def __init__(self, products, purchase_days, n_intervals, sum_log, sum_sq_log, last_day):
+        self.products = np.asarray(products, dtype=np.int64)
+        self.purchase_days = np.asarray(purchase_days, dtype=np.int64) # 購入した日数 (同じ日の購入は1日)
+        self.n_intervals = np.asarray(n_intervals, dtype=np.int64)
+        self.sum_log = np.asarray(sum_log, dtype=np.float64)
+        self.sum_sq_log = np.asarray(sum_sq_log, dtype=np.float64)
+        self.last_day = np.asarray(last_day, dtype=np.int64) # 最終購入日 (date.toordinal)
+        self.index = {int(product_id): i for i, product_id in enumerate(self.products)}
+
+    def add(self, product_id: int, day: int) -> bool:
+        """購入を1件反映する。最終購入日より前の日付なら反映せず False を返す"""
+        i = self.index.get(product_id)
+        if i is None:
+            self.index[product_id] = len(self.products)
+            self.products = np.append(self.products, product_id)
+            self.purchase_days = np.append(self.purchase_days, 1)
+            self.n_intervals = np.append(self.n_intervals, 0)
+            self.sum_log = np.append(self.sum_log, 0.0)
+            self.sum_sq_log = np.append(self.sum_sq_log, 0.0)
+            self.last_day = np.append(self.last_day, day)
+            return True
+        last = self.last_day[i]
+        if day == last:
+            return True
+        if day < last:
+            return False
+        log_interval = math.log(day - last)
+        self.purchase_days[i] += 1
+        self.n_intervals[i] += 1
+        self.sum_log[i] += log_interval
+        self.sum_sq_log[i] += log_interval * log_interval
+        self.last_day[i] = day
+        return True
+
+
+def compute_cycles(user_ids, product_ids, days) -> dict[int, _UserCycles]:
+    """
+    購入履歴 (ユーザーID, 商品ID, 購入日の序数) の配列から、ユーザーごとの購入周期の統計をまとめて計算する
+    """
+    users = np.asarray(user_ids, dtype=np.int64)
+    products = np.asarray(product_ids, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    if len(users) == 0:
+        return {}
+    order = np.lexsort((days, products, users))
+    users, products, days = users[order], products[order], days[order]
+    # 同じ日の同じ商品の購入は1回にまとめる
+    keep = np.ones(len(users), dtype=bool)
+    keep[1:] = (users[1:] != users[:-1]) | (products[1:] != products[:-1]) | (days[1:] != days[:-1])
+    users, products, days = users[keep], products[keep], days[keep]
+
+    # (ユーザー, 商品) のグループごとに、連続する購入日の間隔の対数を集計する
+    group_start = np.ones(len(users), dtype=bool)
+    group_start[1:] = (users[1:] != users[:-1]) | (products[1:] != products[:-1])
+    group_ids = np.cumsum(group_start) - 1
+    n_groups = int(group_ids[-1]) + 1
+    starts = np.flatnonzero(group_start)
+    ends = np.append(starts[1:], len(users)) - 1
+
+    is_interval = ~group_start[1:]
+    log_intervals = np.log(np.diff(days)[is_interval].astype(np.float64))
+    interval_groups = group_ids[1:][is_interval]
+    n_intervals = np.bincount(interval_groups, minlength=n_groups)
+    sum_log = np.bincount(interval_groups, weights=log_intervals, minlength=n_groups)
+    sum_sq_log = np.bincount(interval_groups, weights=log_intervals * log_intervals, minlength=n_groups)
+    purchase_days = ends - starts + 1
+
+    # ユーザーごとに分割する
+    group_users = users[starts]
+    user_starts = np.flatnonzero(np.append(True, group_users[1:] != group_users[:-1]))
+    user_ends = np.append(user_starts[1:], n_groups)
+    cycles = {}
+    for begin, end in zip(user_starts, user_ends):
+        cycles[int(group_users[begin])] = _UserCycles(
+            products[starts[begin:end]],
+            purchase_days[begin:end],
+            n_intervals[begin:end],
+            sum_log[begin:end],
+            sum_sq_log[begin:end],
+            days[ends[begin:end]],
+        )
+    return cycles
+
+
+class RepurchasePredictor:
+    def __init__(self):
+        self._users: dict[int, _UserCycles] = {}
+        self._stale: set[int] = set() # 購入履歴から計算し直す必要があるユーザー
+
+    def build(self, user_ids, product_ids, days) -> None:
+        """全ユーザーの購入履歴から計算し直す"""
+        self._users = compute_cycles(user_ids, product_ids, days)
+        self._stale.clear()
+
+    def load_user(self, user_id: int, product_ids, days) -> None:
+        """1ユーザーの購入履歴から計算し直す"""
+        cycles = compute_cycles(np.full(len(product_ids), user_id), product_ids, days)
+        if user_id in cycles:
+            self._users[user_id] = cycles[user_id]
+        else:
+            self._users.pop(user_id, None)
+        self._stale.discard(user_id)
+
+    def add_purchase(self, user_id: int, product_id: int, purchase_date: date) -> None:
+        """購入を1件反映する"""
+        if user_id in self._stale:
+            return
+        user = self._users.get(user_id)
+        if user is None:
+            self._users[user_id] = _UserCycles([product_id], [1], [0], [0.0], [0.0], [purchase_date.toordinal()])
+        elif not user.add(product_id, purchase_date.toordinal()):
+            self._stale.add(user_id)
+
+    def is_stale(self, user_id: int) -> bool:
+        return user_id in self._stale
+
+    def due(self, user_id: int, today: date | None = None, limit: int = 10, min_probability: float = 0.5) -> list[dict]:
+        """
+        今買う時期である確率が min_probability 以上の商品を、確率の高い順に返す。
+        2日以上に分けて購入したことのある商品 (購入間隔がわかる商品) だけが対象
+        """
+        user = self._users.get(user_id)
+        if user is None:
+            return []
+        has_cycle = user.n_intervals > 0
+        if not has_cycle.any():
+            return []
+        n = user.n_intervals[has_cycle].astype(np.float64)
+        sum_log = user.sum_log[has_cycle]
+        mu = sum_log / n
+        sample_var = np.where(n > 1, (user.sum_sq_log[has_cycle] - n * mu * mu) / np.maximum(n - 1, 1), 0.0)
+        sample_var = np.maximum(sample_var, 0.0)
+        # 間隔の数が少ないほど事前の分散に寄せる
+        sigma = np.sqrt(((n - 1) * sample_var + REPURCHASE_PRIOR_WEIGHT * REPURCHASE_PRIOR_SIGMA ** 2) / (n - 1 + REPURCHASE_PRIOR_WEIGHT))
+
+        today_ordinal = (today or date.today()).toordinal()
+        last_day = user.last_day[has_cycle]
+        elapsed = today_ordinal - last_day
+        with np.errstate(divide="ignore"):
+            z = (np.log(np.maximum(elapsed, 0).astype(np.float64)) - mu) / sigma
+        probability = np.where(elapsed > 0, _normal_cdf(z), 0.0)
+        typical_interval = np.exp(mu)
+
+        selected = np.flatnonzero(probability >= min_probability)
+        # 確率の高い順、同じなら周期に対して経過日数の長い順
+        overdue_ratio = elapsed / typical_interval
+        selected = selected[np.lexsort((-overdue_ratio[selected], -probability[selected]))][:limit]
+        products = user.products[has_cycle]
+        purchase_days = user.purchase_days[has_cycle]
+        return [
+            {
+                "product_id": int(products[i]),
+                "probability": round(float(probability[i]), 3),
+                "last_purchase_date": date.fromordinal(int(last_day[i])),
+                "days_since_last_purchase": int(elapsed[i]),
+                "typical_interval_days": round(float(typical_interval[i]), 1),
+                "purchase_count": int(purchase_days[i]),
+            }
+            for i in selected
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "user_products": sum(len(user.products) for user in self._users.values()),
+            "stale_users": len(self._stale),
+        }
+
+
+predictor = RepurchasePredictor()
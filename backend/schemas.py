@@ -52,6 +52,53 @@ class PurchaseHistory(PurchaseHistoryBase):
     class Config:
         from_attributes = True # orm_mode から変更
 
+# --- 購入履歴の一括登録 ---
+class PurchaseBatchError(BaseModel):
+    """一括登録で登録できなかった項目"""
+    index: int # リクエストの配列内の位置 (0始まり)
+    user_id: int
+    product_id: int
+    detail: str
+
+class PurchaseBatchResult(BaseModel):
+    created: list[PurchaseHistory] = [] # 登録した購入履歴 (リクエストの順)
+    errors: list[PurchaseBatchError] = []
+
+# --- 購入履歴の集計 (LLMプロンプト用) ---
+class ProductPurchaseSummary(BaseModel):
+    """1商品の購入状況"""
+    product_id: int
+    name: str
+    category: Optional[str] = None
+    purchase_count: int
+    first_purchase_date: date
+    last_purchase_date: date
+    mean_interval_days: Optional[float] = None # 平均購入間隔 (日)。購入日が1日だけなら None
+
+class PurchaseHistorySummary(BaseModel):
+    """ユーザーの全購入履歴の集計"""
+    user_id: int
+    total_purchases: int = 0
+    first_purchase_date: Optional[date] = None
+    last_purchase_date: Optional[date] = None
+    category_shares: dict[str, float] = {} # カテゴリ -> 購入回数の割合 (多い順)
+    products: list[ProductPurchaseSummary] = [] # 購入回数の多い順
+
+# --- おすすめ商品 (共起) ---
+class Recommendation(BaseModel):
+    product: Product
+    score: float # 一緒に買われやすさのスコア (大きいほどおすすめ)
+
+# --- 購入周期からの予測 ---
+class DueItem(BaseModel):
+    """そろそろ買う時期の商品"""
+    product: Product
+    probability: float # 今買う時期である確率
+    last_purchase_date: date
+    days_since_last_purchase: int
+    typical_interval_days: float # 購入間隔の目安 (日)
+    purchase_count: int # 購入した日数
+
 # --- Suggestion スキーマ ---
 # (将来実装: DB保存用)
 # class SuggestionBase(BaseModel):
@@ -74,3 +121,6 @@ class PurchaseHistory(PurchaseHistoryBase):
 class SuggestionResponse(BaseModel):
     """商品提案APIのレスポンス"""
     suggestions_text: str # LLMが生成した提案テキスト
+    cached: bool = False # キャッシュから返した場合は True
+    cache_age_seconds: Optional[float] = None # キャッシュした提案の経過時間 (秒)
+    fallback: bool = False # LLMが応答しなかったため、購入履歴からのおすすめで代用した場合は True
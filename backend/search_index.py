@@ -0,0 +1,77 @@
+"""
+商品名・ユーザー名の全文検索インデックス (SQLite FTS5 + trigram トークナイザー)。
+
+trigram トークナイザーは文字の3-gramで索引を作るため、分かち書きのない日本語の商品名でも
+部分一致検索ができる。インデックスは products / users を外部コンテンツとする FTS5 仮想テーブルで、
+トリガーにより INSERT/UPDATE/DELETE と自動で同期される。
+
+通常は Alembic のマイグレーションで作成される。既存データから作り直す場合:
+    python search_index.py rebuild [DBファイルのパス]
+"""
+import sqlite3
+import sys
+
+# 検索対象: FTS テーブル名 -> (元テーブル, 検索する列)
+FTS_TABLES = {
+    "products_fts": ("products", "name"),
+    "users_fts": ("users", "name"),
+}
+# trigram は3文字未満のクエリにはマッチしないので、それより短い場合は LIKE 検索を使う
+MIN_QUERY_LENGTH = 3
+
+
+def create_statements(fts_table: str, source_table: str, column: str) -> list[str]:
+    """FTS テーブルと同期用トリガーを作成する SQL"""
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{column}, content='{source_table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source_table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column} ON {source_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+
+def drop_statements(fts_table: str) -> list[str]:
+    return [
+        f"DROP TRIGGER IF EXISTS {fts_table}_ai",
+        f"DROP TRIGGER IF EXISTS {fts_table}_ad",
+        f"DROP TRIGGER IF EXISTS {fts_table}_au",
+        f"DROP TABLE IF EXISTS {fts_table}",
+    ]
+
+
+def rebuild_statement(fts_table: str) -> str:
+    """元テーブルの内容からインデックスを作り直す SQL"""
+    return f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"
+
+
+def match_expression(query: str) -> str:
+    """ユーザー入力を FTS5 のフレーズ (部分一致) として安全に扱える MATCH 式にする"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def rebuild(db_path: str) -> None:
+    """FTS テーブルとトリガーがなければ作成し、既存データからインデックスを作り直す"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for fts_table, (source_table, column) in FTS_TABLES.items():
+                for statement in create_statements(fts_table, source_table, column):
+                    conn.execute(statement)
+                conn.execute(rebuild_statement(fts_table))
+                count = conn.execute(f"SELECT count(*) FROM {source_table}").fetchone()[0]
+                print(f"Rebuilt {fts_table} from {count} rows in {source_table}.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python search_index.py rebuild [db_path]")
+        sys.exit(1)
+    # デフォルトは alembic.ini と同じローカルのDBファイル
+    rebuild(sys.argv[2] if len(sys.argv) > 2 else "shopping_app.db")
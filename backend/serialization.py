@@ -0,0 +1,47 @@
+"""
+レスポンスのJSONエンコード。
+
+response_model を指定したエンドポイントは、FastAPI が Pydantic の TypeAdapter.dump_json で検証とエンコードを
+まとめて行う (アプリに独自の default_response_class を設定するとこの処理が使われなくなるので設定しない)。
+1回に大量の行を返すエンドポイント (/history) では、SQLの結果から組み立てた辞書を検証せずに
+orjson で直接エンコードする。行の値はDBの型のまま、商品はキャッシュ済み (検証済み) のスキーマから作った辞書なので、
+response_model と同じJSONになる。
+"""
+from typing import Any
+
+import orjson
+from fastapi import Response
+
+import profiling
+import schemas
+
+
+class ORJSONResponse(Response):
+    """辞書・リスト・日付などをそのまま orjson でエンコードするレスポンス (Pydanticモデルは含めないこと)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if profiling.PROFILING_ENABLED:
+            with profiling.phase("serialize"):
+                return orjson.dumps(content)
+        return orjson.dumps(content)
+
+
+def purchase_history_rows(rows, products: dict[int, schemas.Product]) -> list[dict]:
+    """
+    購入履歴の (id, user_id, product_id, purchase_date) の行と商品から、schemas.PurchaseHistory と同じ形 (キーの順も同じ) の
+    辞書のリストを作る。商品の辞書は商品ごとに1度だけ作り、同じ商品の行で共有する。商品がない行は除外する
+    """
+    product_rows = {product_id: product.model_dump() for product_id, product in products.items()}
+    # 行はタプルとして展開する (Row の属性アクセスは1回ごとに名前を引くので、数千行では無視できない)
+    return [
+        {
+            "product_id": product_id,
+            "purchase_date": purchase_date,
+            "id": history_id,
+            "user_id": user_id,
+            "product": product_rows[product_id],
+        }
+        for history_id, user_id, product_id, purchase_date in rows
+        if product_id in product_rows
+    ]
@@ -0,0 +1,43 @@
+"""
+同じキーの非同期処理の同時実行を1つにまとめる (single-flight)。
+
+同じキーで実行中の処理があれば、新しく実行せずにその結果を待って共有する。
+処理は asyncio.shield で保護するため、待っている呼び出し側がキャンセル (クライアントの切断など) されても
+処理自体は最後まで実行され、他の呼び出し側や後続の処理 (キャッシュへの保存など) に結果が渡る。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.started = 0 # 実際に実行した回数
+        self.coalesced = 0 # 実行中の処理の結果を共有した回数
+        self.failed = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            self.started += 1
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # 待っている呼び出し側がすべてキャンセルされていても、例外を未処理のまま残さない
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
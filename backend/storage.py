@@ -0,0 +1,577 @@
+"""
+オブジェクトストレージへのアクセスをまとめたモジュール。
+
+database.py は Cloud Storage の blob を直接触らず、ここで定義した ObjectStore 経由で
+ファイルの読み書きを行う。実装は create_object_store で選ぶ:
+    - gcs:    Google Cloud Storage (クライアントは最初に使うときに作る。認証情報の探索もそのとき)
+    - local:  ローカルディレクトリをバケットに見立てる (開発用。再起動後もデータが残る)
+    - memory: プロセス内のメモリ (テスト・ベンチマーク用。プロセスが終わると消える)
+
+オブジェクトには GCS と同じく世代番号 (generation) があり、上書きのたびに変わる。
+    - stat でメタデータ (サイズ・世代・更新時刻) だけを読める (ダウンロード済みのものと同じか確かめる用)
+    - 書き込みに if_generation_match を渡すと、リモートの世代がその値のときだけ書き込む
+      (0 は「存在しないときだけ」)。一致しなければ PreconditionFailed
+    - 読み込みに generation を渡すと、その世代だけを読む (上書きされていれば ObjectNotFound)
+
+ブロッキングのメソッドに加えて、イベントループから呼ぶ *_async のメソッドがある。
+parallel_threshold 以上のファイルは chunk_size ごとに分けて、最大 max_concurrency 並列で転送する
+(ダウンロードは範囲指定の読み込み、アップロードは分割したパーツを compose で1つにまとめる)。
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple
+
+try:
+    import fcntl
+except ImportError: # Windows では他のプロセスとの排他はしない
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# compose でまとめられるパーツ数の上限 (GCS の制限)
+MAX_COMPOSE_PARTS = 32
+
+
+class ObjectNotFound(Exception):
+    """指定したオブジェクト (または指定した世代) がストレージに存在しない"""
+
+
+class PreconditionFailed(Exception):
+    """if_generation_match に指定した世代とリモートの世代が一致しない (他の書き込みがあった)"""
+
+
+class ObjectInfo(NamedTuple):
+    name: str
+    size: int
+    generation: int
+    updated: float | None = None # 最終更新時刻 (Unix時間。わからなければ None)
+
+
+class ObjectStore:
+    """オブジェクトストレージのインターフェース (*_async 以外のメソッドはすべてブロッキング)"""
+
+    # 並列転送の設定 (create_object_store で上書きする)
+    parallel_threshold = 32 * 1024 * 1024
+    chunk_size = 8 * 1024 * 1024
+    max_concurrency = 8
+
+    def describe(self, name: str) -> str:
+        """ログ出力用のオブジェクトの場所"""
+        raise NotImplementedError
+
+    def stat(self, name: str) -> ObjectInfo | None:
+        """オブジェクトのメタデータ (存在しなければ None)。本体は読まない"""
+        raise NotImplementedError
+
+    def download_to_filename(self, name: str, path: str, generation: int | None = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    def upload_from_filename(self, name: str, path: str, if_generation_match: int | None = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    def open_read(self, name: str, generation: int | None = None):
+        """オブジェクトを先頭から順に読むためのバイナリのファイルライクオブジェクトを返す"""
+        raise NotImplementedError
+
+    def download_bytes(self, name: str, generation: int | None = None) -> bytes:
+        raise NotImplementedError
+
+    def upload_bytes(self, name: str, data: bytes, if_generation_match: int | None = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    def list_names(self, prefix: str) -> list[str]:
+        """prefix で始まるオブジェクト名を名前順で返す"""
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        """オブジェクトを削除する (存在しなければ何もしない)"""
+        raise NotImplementedError
+
+    # --- 並列転送の部品 (実装ごとに上書きする) ---
+    def download_range(self, name: str, generation: int, path: str, start: int, end: int) -> None:
+        """オブジェクトの [start, end) を path の同じ位置へ書き込む (path は作成済み)"""
+        with self.open_read(name, generation) as remote, open(path, "r+b") as out:
+            remote.seek(start)
+            out.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = remote.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"Unexpected end of {name} at {end - remaining}")
+                out.write(chunk)
+                remaining -= len(chunk)
+
+    def upload_part(self, part_name: str, path: str, start: int, length: int) -> None:
+        """path の [start, start + length) を一時オブジェクト part_name としてアップロードする"""
+        with open(path, "rb") as f:
+            f.seek(start)
+            self.upload_bytes(part_name, f.read(length))
+
+    def compose(self, name: str, part_names: list[str], if_generation_match: int | None = None) -> ObjectInfo:
+        """パーツを順に連結したオブジェクトを name に書き込む (パーツは削除しない)"""
+        raise NotImplementedError
+
+    # --- 非同期のメソッド (既定はブロッキングのメソッドをスレッドで実行する) ---
+    async def stat_async(self, name: str) -> ObjectInfo | None:
+        return await asyncio.to_thread(self.stat, name)
+
+    async def download_bytes_async(self, name: str, generation: int | None = None) -> bytes:
+        return await asyncio.to_thread(self.download_bytes, name, generation)
+
+    async def upload_bytes_async(self, name: str, data: bytes, if_generation_match: int | None = None) -> ObjectInfo:
+        return await asyncio.to_thread(self.upload_bytes, name, data, if_generation_match)
+
+    async def list_names_async(self, prefix: str) -> list[str]:
+        return await asyncio.to_thread(self.list_names, prefix)
+
+    async def delete_async(self, name: str) -> None:
+        await asyncio.to_thread(self.delete, name)
+
+    async def download_async(self, name: str, path: str, info: ObjectInfo | None = None) -> ObjectInfo:
+        """
+        オブジェクトを path へダウンロードする。info (stat の結果) を渡すとその世代を読み、渡さなければ stat する。
+        大きいオブジェクトは範囲に分けて並列に読む。途中で失敗しても path には書きかけのファイルを残さない。
+        """
+        if info is None:
+            info = await self.stat_async(name)
+            if info is None:
+                raise ObjectNotFound(name)
+        if info.size < self.parallel_threshold or self.max_concurrency <= 1:
+            return await asyncio.to_thread(self.download_to_filename, name, path, info.generation)
+
+        tmp_path = path + ".download"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.truncate(info.size)
+            ranges = [(start, min(start + self.chunk_size, info.size)) for start in range(0, info.size, self.chunk_size)]
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def fetch(start: int, end: int) -> None:
+                async with semaphore:
+                    await asyncio.to_thread(self.download_range, name, info.generation, tmp_path, start, end)
+
+            await asyncio.gather(*(fetch(start, end) for start, end in ranges))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f"Downloaded {self.describe(name)} in {len(ranges)} parallel chunks ({info.size} bytes).")
+        return info
+
+    async def upload_async(self, name: str, path: str, if_generation_match: int | None = None) -> ObjectInfo:
+        """
+        ファイルを name へアップロードする。大きいファイルはパーツに分けて並列にアップロードし、
+        compose で1つにまとめる (if_generation_match は最後の compose で確認する)。
+        """
+        size = os.path.getsize(path)
+        if size < self.parallel_threshold or self.max_concurrency <= 1:
+            return await asyncio.to_thread(self.upload_from_filename, name, path, if_generation_match)
+
+        part_size = max(self.chunk_size, -(-size // MAX_COMPOSE_PARTS))
+        prefix = f"{name}.parts/{uuid.uuid4().hex}/"
+        parts = [(f"{prefix}{i:03d}", start, min(part_size, size - start)) for i, start in enumerate(range(0, size, part_size))]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def send(part_name: str, start: int, length: int) -> None:
+            async with semaphore:
+                await asyncio.to_thread(self.upload_part, part_name, path, start, length)
+
+        try:
+            await asyncio.gather(*(send(*part) for part in parts))
+            info = await asyncio.to_thread(self.compose, name, [part[0] for part in parts], if_generation_match)
+        finally:
+            for part_name, _, _ in parts:
+                try:
+                    await self.delete_async(part_name)
+                except Exception as e:
+                    logger.warning(f"Failed to delete temporary part {self.describe(part_name)}: {e}")
+        logger.info(f"Uploaded {self.describe(name)} in {len(parts)} parallel parts ({size} bytes).")
+        return info
+
+
+class GCSObjectStore(ObjectStore):
+    """Google Cloud Storage のバケットをバックエンドにする実装"""
+
+    def __init__(self, bucket_name: str, client=None):
+        self.bucket_name = bucket_name
+        self._client = client
+        self._bucket = None
+        self._client_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        """バケット (初回にクライアントを作る。失敗した場合は認証情報の探索を繰り返さないよう同じ例外を送出する)"""
+        if self._bucket is None:
+            with self._lock:
+                if self._client_error is not None:
+                    raise self._client_error
+                if self._bucket is None:
+                    try:
+                        if self._client is None:
+                            from google.cloud import storage
+
+                            self._client = storage.Client()
+                        self._bucket = self._client.bucket(self.bucket_name)
+                    except Exception as e:
+                        logger.error(f"Failed to initialize Google Cloud Storage client: {e}")
+                        self._client_error = e
+                        raise
+        return self._bucket
+
+    def describe(self, name: str) -> str:
+        return f"gs://{self.bucket_name}/{name}"
+
+    @staticmethod
+    def _info(blob) -> ObjectInfo:
+        return ObjectInfo(blob.name, blob.size or 0, blob.generation, blob.updated.timestamp() if blob.updated else None)
+
+    @staticmethod
+    def _not_found():
+        from google.cloud.exceptions import NotFound
+
+        return NotFound
+
+    def _conditional(self, upload, if_generation_match):
+        from google.api_core.exceptions import PreconditionFailed as GCSPreconditionFailed
+
+        try:
+            return upload(if_generation_match=if_generation_match)
+        except GCSPreconditionFailed as e:
+            raise PreconditionFailed(str(e)) from e
+
+    def stat(self, name: str) -> ObjectInfo | None:
+        blob = self.bucket.get_blob(name)
+        return self._info(blob) if blob is not None else None
+
+    def download_to_filename(self, name: str, path: str, generation: int | None = None) -> ObjectInfo:
+        blob = self.bucket.blob(name, generation=generation)
+        try:
+            blob.download_to_filename(path)
+        except self._not_found() as e:
+            # download_to_filename は失敗時に空ファイルを残すことがあるので消しておく
+            if os.path.exists(path):
+                os.remove(path)
+            raise ObjectNotFound(name) from e
+        # 世代はダウンロードのレスポンスヘッダーから設定される
+        return ObjectInfo(name, os.path.getsize(path), blob.generation)
+
+    def upload_from_filename(self, name: str, path: str, if_generation_match: int | None = None) -> ObjectInfo:
+        blob = self.bucket.blob(name)
+        self._conditional(lambda **kw: blob.upload_from_filename(path, **kw), if_generation_match)
+        return self._info(blob)
+
+    def open_read(self, name: str, generation: int | None = None):
+        blob = self.bucket.get_blob(name, generation=generation)
+        if blob is None:
+            raise ObjectNotFound(name)
+        return blob.open("rb")
+
+    def download_bytes(self, name: str, generation: int | None = None) -> bytes:
+        try:
+            return self.bucket.blob(name, generation=generation).download_as_bytes()
+        except self._not_found() as e:
+            raise ObjectNotFound(name) from e
+
+    def upload_bytes(self, name: str, data: bytes, if_generation_match: int | None = None) -> ObjectInfo:
+        blob = self.bucket.blob(name)
+        self._conditional(lambda **kw: blob.upload_from_string(data, **kw), if_generation_match)
+        return self._info(blob)
+
+    def list_names(self, prefix: str) -> list[str]:
+        return sorted(b.name for b in self.bucket.client.list_blobs(self.bucket_name, prefix=prefix))
+
+    def delete(self, name: str) -> None:
+        try:
+            self.bucket.blob(name).delete()
+        except self._not_found():
+            pass
+
+    def download_range(self, name: str, generation: int, path: str, start: int, end: int) -> None:
+        blob = self.bucket.blob(name, generation=generation)
+        with open(path, "r+b") as out:
+            out.seek(start)
+            try:
+                # 範囲指定の読み込みではオブジェクト全体のチェックサムを検証できない
+                blob.download_to_file(out, start=start, end=end - 1, checksum=None)
+            except self._not_found() as e:
+                raise ObjectNotFound(name) from e
+
+    def upload_part(self, part_name: str, path: str, start: int, length: int) -> None:
+        with open(path, "rb") as f:
+            f.seek(start)
+            self.bucket.blob(part_name).upload_from_file(f, size=length)
+
+    def compose(self, name: str, part_names: list[str], if_generation_match: int | None = None) -> ObjectInfo:
+        blob = self.bucket.blob(name)
+        sources = [self.bucket.blob(part_name) for part_name in part_names]
+        self._conditional(lambda **kw: blob.compose(sources, **kw), if_generation_match)
+        return self._info(blob)
+
+
+class LocalDirObjectStore(ObjectStore):
+    """
+    ローカルディレクトリをバケットに見立てる実装 (開発・テスト用)。
+    世代は書き込みのたびに増やす番号で、オブジェクトごとに .meta/objects/<name> に記録する
+    (更新時刻は同じ時刻の刻みに2回書き込まれると同じ値になるので使わない)。
+    世代の確認と書き込みは .meta/lock のファイルロックで、同じディレクトリを使う他のプロセスとも排他する。
+    ストレージを経由せずに置かれた・書き換えられたファイルは、次に stat したときに新しい世代を割り当てる。
+    """
+
+    META_DIR = ".meta"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._meta_root = os.path.join(self.root, self.META_DIR)
+        os.makedirs(os.path.join(self._meta_root, "objects"), exist_ok=True)
+        self._write_lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep) or path.startswith(self._meta_root + os.sep):
+            raise ValueError(f"Invalid object name: {name}")
+        return path
+
+    def _meta_path(self, name: str) -> str:
+        return os.path.join(self._meta_root, "objects", os.path.relpath(self._path(name), self.root))
+
+    @contextmanager
+    def _locked(self):
+        """このプロセス内のスレッドと、同じディレクトリを使う他のプロセスを排他する"""
+        with self._write_lock, open(os.path.join(self._meta_root, "lock"), "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _next_generation(self) -> int:
+        """世代の番号を1つ進めて返す (_locked の中で呼ぶ)"""
+        counter_path = os.path.join(self._meta_root, "counter")
+        try:
+            with open(counter_path, encoding="utf-8") as f:
+                generation = int(f.read() or 0) + 1
+        except FileNotFoundError:
+            generation = 1
+        with open(counter_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(generation))
+        os.replace(counter_path + ".tmp", counter_path)
+        return generation
+
+    def _stat_locked(self, name: str) -> ObjectInfo | None:
+        """オブジェクトのメタデータ (_locked の中で呼ぶ)。記録と実際のファイルが違えば新しい世代を割り当てる"""
+        try:
+            st = os.stat(self._path(name))
+        except FileNotFoundError:
+            return None
+        file_id = [st.st_size, st.st_mtime_ns, st.st_ino]
+        meta_path = self._meta_path(name)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["file"] == file_id:
+                return ObjectInfo(name, st.st_size, meta["generation"], st.st_mtime)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        generation = self._next_generation()
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "file": file_id}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+        return ObjectInfo(name, st.st_size, generation, st.st_mtime)
+
+    def _existing_path(self, name: str, generation: int | None = None) -> str:
+        path = self._path(name)
+        info = self.stat(name)
+        if info is None:
+            raise ObjectNotFound(name)
+        if generation is not None and info.generation != generation:
+            raise ObjectNotFound(f"{name}#{generation}")
+        return path
+
+    def _replace(self, name: str, write, if_generation_match: int | None) -> ObjectInfo:
+        """一時ファイルに書いてから置き換える (途中まで書かれたファイルが読まれないように)"""
+        dst = self._path(name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp)
+            with self._locked():
+                if if_generation_match is not None:
+                    current = self._stat_locked(name)
+                    if (current.generation if current else 0) != if_generation_match:
+                        raise PreconditionFailed(f"{name}: expected generation {if_generation_match}, found {current.generation if current else 0}")
+                os.replace(tmp, dst)
+                # 置き換えたファイルには記録がないので、新しい世代が割り当てられる
+                return self._stat_locked(name)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def describe(self, name: str) -> str:
+        return self._path(name)
+
+    def stat(self, name: str) -> ObjectInfo | None:
+        with self._locked():
+            return self._stat_locked(name)
+
+    def download_to_filename(self, name: str, path: str, generation: int | None = None) -> ObjectInfo:
+        src = self._existing_path(name, generation)
+        info = self.stat(name)
+        shutil.copyfile(src, path)
+        return info
+
+    def upload_from_filename(self, name: str, path: str, if_generation_match: int | None = None) -> ObjectInfo:
+        return self._replace(name, lambda tmp: shutil.copyfile(path, tmp), if_generation_match)
+
+    def open_read(self, name: str, generation: int | None = None):
+        return open(self._existing_path(name, generation), "rb")
+
+    def download_bytes(self, name: str, generation: int | None = None) -> bytes:
+        with open(self._existing_path(name, generation), "rb") as f:
+            return f.read()
+
+    def upload_bytes(self, name: str, data: bytes, if_generation_match: int | None = None) -> ObjectInfo:
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as f:
+                f.write(data)
+        return self._replace(name, write, if_generation_match)
+
+    def list_names(self, prefix: str) -> list[str]:
+        names = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and self.META_DIR in dirnames:
+                dirnames.remove(self.META_DIR)
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def delete(self, name: str) -> None:
+        path = self._path(name)
+        with self._locked():
+            if os.path.exists(path):
+                os.remove(path)
+                # パーツ用などの空になったディレクトリを残さない
+                parent = os.path.dirname(path)
+                while parent != self.root and not os.listdir(parent):
+                    os.rmdir(parent)
+                    parent = os.path.dirname(parent)
+            meta_path = self._meta_path(name)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+
+    def compose(self, name: str, part_names: list[str], if_generation_match: int | None = None) -> ObjectInfo:
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as out:
+                for part_name in part_names:
+                    with open(self._existing_path(part_name), "rb") as part:
+                        shutil.copyfileobj(part, out, COPY_CHUNK_SIZE)
+        return self._replace(name, write, if_generation_match)
+
+
+class MemoryObjectStore(ObjectStore):
+    """プロセス内のメモリに保存する実装 (テスト・ベンチマーク用)。非同期のメソッドはスレッドを使わずに直接実行する"""
+
+    def __init__(self):
+        self._objects: dict[str, tuple[bytes, int, float]] = {} # 名前 -> (内容, 世代, 更新時刻)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, generation: int | None = None) -> tuple[bytes, int, float]:
+        entry = self._objects.get(name)
+        if entry is None or (generation is not None and entry[1] != generation):
+            raise ObjectNotFound(name if entry is None else f"{name}#{generation}")
+        return entry
+
+    def describe(self, name: str) -> str:
+        return f"memory://{name}"
+
+    def stat(self, name: str) -> ObjectInfo | None:
+        entry = self._objects.get(name)
+        return ObjectInfo(name, len(entry[0]), entry[1], entry[2]) if entry is not None else None
+
+    def download_to_filename(self, name: str, path: str, generation: int | None = None) -> ObjectInfo:
+        data, generation, updated = self._get(name, generation)
+        with open(path, "wb") as f:
+            f.write(data)
+        return ObjectInfo(name, len(data), generation, updated)
+
+    def upload_from_filename(self, name: str, path: str, if_generation_match: int | None = None) -> ObjectInfo:
+        with open(path, "rb") as f:
+            return self.upload_bytes(name, f.read(), if_generation_match)
+
+    def open_read(self, name: str, generation: int | None = None):
+        return io.BytesIO(self._get(name, generation)[0])
+
+    def download_bytes(self, name: str, generation: int | None = None) -> bytes:
+        return self._get(name, generation)[0]
+
+    def upload_bytes(self, name: str, data: bytes, if_generation_match: int | None = None) -> ObjectInfo:
+        with self._lock:
+            current = self._objects.get(name)
+            if if_generation_match is not None and (current[1] if current else 0) != if_generation_match:
+                raise PreconditionFailed(f"{name}: expected generation {if_generation_match}, found {current[1] if current else 0}")
+            self._generation += 1
+            self._objects[name] = (bytes(data), self._generation, time.time())
+            return self.stat(name)
+
+    def list_names(self, prefix: str) -> list[str]:
+        return sorted(name for name in list(self._objects) if name.startswith(prefix))
+
+    def delete(self, name: str) -> None:
+        self._objects.pop(name, None)
+
+    def compose(self, name: str, part_names: list[str], if_generation_match: int | None = None) -> ObjectInfo:
+        return self.upload_bytes(name, b"".join(self._get(part_name)[0] for part_name in part_names), if_generation_match)
+
+    async def stat_async(self, name: str) -> ObjectInfo | None:
+        return self.stat(name)
+
+    async def download_bytes_async(self, name: str, generation: int | None = None) -> bytes:
+        return self.download_bytes(name, generation)
+
+    async def upload_bytes_async(self, name: str, data: bytes, if_generation_match: int | None = None) -> ObjectInfo:
+        return self.upload_bytes(name, data, if_generation_match)
+
+    async def list_names_async(self, prefix: str) -> list[str]:
+        return self.list_names(prefix)
+
+    async def delete_async(self, name: str) -> None:
+        self.delete(name)
+
+
+BACKENDS = ("gcs", "local", "memory")
+
+
+def create_object_store(backend: str, *, bucket_name: str | None = None, local_dir: str | None = None,
+                        parallel_threshold: int | None = None, chunk_size: int | None = None,
+                        max_concurrency: int | None = None) -> ObjectStore:
+    """設定に応じた ObjectStore を作る (GCS でもクライアントはまだ作らない)"""
+    if backend == "gcs":
+        store = GCSObjectStore(bucket_name)
+    elif backend == "local":
+        if not local_dir:
+            raise ValueError("LOCAL_STORAGE_DIR is required for the local storage backend")
+        store = LocalDirObjectStore(local_dir)
+    elif backend == "memory":
+        store = MemoryObjectStore()
+    else:
+        raise ValueError(f"Unknown storage backend: {backend!r} (expected one of {', '.join(BACKENDS)})")
+    if parallel_threshold is not None:
+        store.parallel_threshold = parallel_threshold
+    if chunk_size is not None:
+        store.chunk_size = max(1, chunk_size)
+    if max_concurrency is not None:
+        store.max_concurrency = max_concurrency
+    return store
@@ -0,0 +1,77 @@
+"""
+LLMによる商品提案のプロンプト作成とキャッシュ。
+
+/suggest エンドポイントと、全ユーザーの提案を事前に生成するバッチ (precompute_suggestions.py) で共有する。
+どちらも同じ手順でプロンプトとキャッシュキーを作るので、バッチで生成した提案は
+履歴・モデル・季節が変わらない限り /suggest からそのまま返される。
+"""
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import llm_interface
+import models
+import profiling
+
+# LLMの提案をキャッシュする時間 (秒)。0 でキャッシュを無効化
+SUGGESTION_CACHE_TTL_SECONDS = int(os.getenv("SUGGESTION_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# LLMに渡す購入履歴の形式。summary: 商品ごとの集計表 (全履歴), rows: 直近の購入履歴を1行ずつ (従来の形式)
+SUGGESTION_HISTORY_FORMAT = os.getenv("SUGGESTION_HISTORY_FORMAT", "summary")
+# プロンプトに含める「そろそろ買う時期の商品」の最大数
+SUGGESTION_DUE_ITEMS = int(os.getenv("SUGGESTION_DUE_ITEMS", "10"))
+
+
+def _format_prompt(build, *args, **kwargs) -> str:
+    """プロンプトを整形する (プロファイリング中は prompt フェーズとして計測する)"""
+    if profiling.PROFILING_ENABLED:
+        with profiling.phase("prompt"):
+            return build(*args, **kwargs)
+    return build(*args, **kwargs)
+
+
+async def build_prompt(db: AsyncSession, user_id: int) -> tuple[str, str, str]:
+    """
+    ユーザーの購入履歴からLLMに渡すプロンプトを作成する。
+    戻り値: (プロンプト, 季節, キャッシュキー)
+    """
+    if SUGGESTION_HISTORY_FORMAT == "rows":
+        # 購入履歴を取得 (SQLの結果から組み立てた辞書のリスト。Pydanticモデルを経由せずにそのままプロンプトに使う)
+        history = await crud.get_purchase_history(db, user_id=user_id)
+
+        # LLMへのプロンプトを作成
+        prompt = _format_prompt(llm_interface.build_user_prompt, user_id, history)
+    else:
+        # 全履歴を商品ごとに集計し、トークン数の上限内の表にしてプロンプトを作成
+        summary = await crud.get_purchase_history_summary(db, user_id=user_id)
+        # 購入周期から見てそろそろ買う時期の商品も伝える
+        due_items = await crud.get_due_items(db, user_id, limit=SUGGESTION_DUE_ITEMS)
+        prompt = _format_prompt(llm_interface.build_summary_prompt, user_id, summary, due_items=due_items)
+
+    # 履歴・モデル・季節 (summary 形式では、そろそろ買う時期の商品も) のいずれかが変われば別のキーになる
+    season = llm_interface.get_current_season()
+    cache_key = llm_interface.suggestion_cache_key(prompt, season)
+    return prompt, season, cache_key
+
+
+async def get_cached(db: AsyncSession, user_id: int, cache_key: str) -> models.SuggestionCache | None:
+    """キーが一致し、有効期限内のキャッシュ済み提案を返す (キャッシュ無効時・なければ None)"""
+    if SUGGESTION_CACHE_TTL_SECONDS <= 0:
+        return None
+    return await crud.get_cached_suggestion(
+        db, user_id=user_id, cache_key=cache_key, max_age_seconds=SUGGESTION_CACHE_TTL_SECONDS
+    )
+
+
+async def save(db: AsyncSession, user_id: int, cache_key: str, season: str, suggestion_text: str) -> bool:
+    """
+    提案をキャッシュに保存する (書き込み用のセッションを渡すこと)。
+    キャッシュ無効時・テーブルがない (マイグレーション未適用の) DBでは保存せず False を返す
+    """
+    if SUGGESTION_CACHE_TTL_SECONDS <= 0:
+        return False
+    provider, model_name = llm_interface.get_model_info()
+    return await crud.save_cached_suggestion(
+        db, user_id=user_id, cache_key=cache_key, provider=provider,
+        model=model_name, season=season, suggestions_text=suggestion_text,
+    )
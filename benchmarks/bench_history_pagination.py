@@ -0,0 +1,97 @@
+"""
+購入履歴ページネーションのベンチマーク。
+
+1ユーザーに大量の購入履歴がある状態で、skip (OFFSET) とカーソル (キーセット) の
+それぞれについて、ページの深さごとに1ページ取得にかかる時間を計測する。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_history_pagination.py --purchases 200000 --limit 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+_tmp_root = tempfile.mkdtemp(prefix="bench_history_")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_tmp_root, "bucket"))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import database
+import models
+
+
+def create_seed_db(path: str, purchases: int, products: int = 500) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, name) VALUES (1, 'user1')")
+    conn.executemany(
+        "INSERT INTO products (id, name, category) VALUES (?, ?, ?)",
+        [(i, f"product{i}", f"category{i % 10}") for i in range(1, products + 1)],
+    )
+    rng = random.Random(0)
+    start = date(2000, 1, 1)
+    conn.executemany(
+        "INSERT INTO purchase_history (user_id, product_id, purchase_date) VALUES (1, ?, ?)",
+        [(rng.randint(1, products), (start + timedelta(days=rng.randint(0, 9000))).isoformat()) for _ in range(purchases)],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def main(args) -> None:
+    db_path = os.path.join(_tmp_root, "history.db")
+    create_seed_db(db_path, args.purchases)
+    _, reader = database.create_engines(db_path)
+    Session = async_sessionmaker(bind=reader, expire_on_commit=False)
+
+    depths = [d for d in (0, 10, 100, 1000, 3000) if d * args.limit < args.purchases]
+    results = []
+    async with Session() as db:
+        await crud.get_purchase_history_page(db, user_id=1, limit=args.limit) # ウォームアップ
+        # カーソル方式は先頭から順にたどり、計測対象の深さで1ページの取得時間を測る
+        cursor = None
+        page = 0
+        cursor_timings = {}
+        while page <= depths[-1]:
+            t0 = time.perf_counter()
+            _, cursor = await crud.get_purchase_history_page(db, user_id=1, limit=args.limit, cursor=cursor)
+            elapsed = time.perf_counter() - t0
+            if page in depths:
+                cursor_timings[page] = elapsed
+            page += 1
+
+        for depth in depths:
+            t0 = time.perf_counter()
+            await crud.get_purchase_history_page(db, user_id=1, limit=args.limit, skip=depth * args.limit)
+            offset_elapsed = time.perf_counter() - t0
+            results.append({
+                "page": depth,
+                "offset_ms": round(offset_elapsed * 1000, 2),
+                "cursor_ms": round(cursor_timings[depth] * 1000, 2),
+            })
+    await reader.dispose()
+    print(json.dumps(results, indent=2))
+    shutil.rmtree(_tmp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
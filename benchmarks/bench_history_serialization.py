@@ -0,0 +1,188 @@
+"""
+/history のレスポンス作成 (行の組み立てとJSONエンコード) のベンチマーク。
+
+1ページ1000行の /history/{user_id} について、
+    legacy: 行ごとに schemas.PurchaseHistory を作り、response_model で検証してエンコード (FastAPI の TypeAdapter.dump_json)
+    rows:   SQLの結果から辞書を組み立て、検証せずに orjson でエンコード (現在の /history)
+のそれぞれで、リクエスト全体のレイテンシ、行の組み立てとエンコードにかかった時間、
+1リクエストで確保したメモリ (tracemalloc のピーク) を比較する。両者のレスポンスが同じJSONであることも確認する。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_history_serialization.py --purchases 5000 --limit 1000 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+_tmp_root = tempfile.mkdtemp(prefix="bench_serialization_")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_tmp_root, "bucket"))
+# database は /tmp/{DB_FILE_NAME} を使うので、ベンチマーク専用のファイル名にする
+os.environ["DB_FILE_NAME"] = f"bench_serialization_{os.getpid()}.db"
+os.environ["LLM_PROVIDER"] = "fake"
+
+import fastapi.routing
+import httpx
+from fastapi import Depends
+from sqlalchemy import create_engine
+
+import crud
+import database
+import main
+import models
+import schemas
+import serialization
+
+
+def create_seed_db(path: str, purchases: int, products: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, name) VALUES (1, 'user1')")
+    conn.executemany(
+        "INSERT INTO products (id, name, category, typical_price) VALUES (?, ?, ?, ?)",
+        [(i, f"商品{i}", f"カテゴリ{i % 10}", 100.0 + i) for i in range(1, products + 1)],
+    )
+    rng = random.Random(0)
+    start = date(2020, 1, 1)
+    conn.executemany(
+        "INSERT INTO purchase_history (user_id, product_id, purchase_date) VALUES (1, ?, ?)",
+        [(rng.randint(1, products), (start + timedelta(days=rng.randint(0, 1800))).isoformat()) for _ in range(purchases)],
+    )
+    conn.commit()
+    conn.close()
+
+
+class Timer:
+    """関数をラップして、呼び出しにかかった時間を合計する"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def wrap(self, func, is_async: bool):
+        async def async_wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - t0
+
+        def sync_wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - t0
+
+        return async_wrapper if is_async else sync_wrapper
+
+
+legacy_timer = Timer()
+rows_timer = Timer()
+
+
+@main.app.get("/bench/legacy_history/{user_id}", response_model=list[schemas.PurchaseHistory])
+async def legacy_history(user_id: int, limit: int = 100, db=Depends(database.get_read_db)):
+    """変更前の /history: 行ごとに schemas.PurchaseHistory を作り、response_model で検証・エンコードする"""
+    rows = await crud.get_purchase_history(db, user_id=user_id, limit=limit)
+    t0 = time.perf_counter()
+    history = [
+        schemas.PurchaseHistory(
+            id=row["id"],
+            user_id=row["user_id"],
+            product_id=row["product_id"],
+            purchase_date=row["purchase_date"],
+            product=crud.product_cache.get(row["product_id"]),
+        )
+        for row in rows
+    ]
+    legacy_timer.seconds += time.perf_counter() - t0
+    return history
+
+
+def percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    pick = lambda pct: round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 3)
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99)}
+
+
+async def measure(client, url: str, requests: int, timer: Timer) -> dict:
+    await client.get(url) # ウォームアップ
+    timings = []
+    timer.seconds = 0.0
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        response = await client.get(url)
+        timings.append(time.perf_counter() - t0)
+        response.raise_for_status()
+    serialize_ms = timer.seconds / requests * 1000
+
+    # 確保したメモリは別に測る (tracemalloc はレイテンシを大きく増やすため)
+    peaks = []
+    for _ in range(min(requests, 20)):
+        tracemalloc.start()
+        response = await client.get(url)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        **percentiles(timings),
+        "serialize_ms": round(serialize_ms, 3),
+        "peak_alloc_kib": round(sorted(peaks)[len(peaks) // 2] / 1024, 1),
+        "response_bytes": len(response.content),
+        "body": response.content,
+    }
+
+
+async def run(args) -> dict:
+    create_seed_db(database.LOCAL_DB_PATH, args.purchases, args.products)
+    results = {"purchases": args.purchases, "limit": args.limit, "requests": args.requests}
+
+    # legacy: 行ごとのモデルの作成 (legacy_history 内で計測) と response_model の検証・エンコード (serialize_response)
+    fastapi.routing.serialize_response = legacy_timer.wrap(fastapi.routing.serialize_response, is_async=True)
+    # rows: 辞書の組み立て (serialization.purchase_history_rows) と orjson でのエンコード (ORJSONResponse.render)
+    serialization.purchase_history_rows = rows_timer.wrap(serialization.purchase_history_rows, is_async=False)
+    serialization.ORJSONResponse.render = rows_timer.wrap(serialization.ORJSONResponse.render, is_async=False)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        legacy = await measure(client, f"/bench/legacy_history/1?limit={args.limit}", args.requests, legacy_timer)
+        rows = await measure(client, f"/history/1?limit={args.limit}", args.requests, rows_timer)
+    same_json = json.loads(legacy.pop("body")) == json.loads(rows.pop("body"))
+    results["legacy"] = legacy
+    results["rows"] = rows
+    results["same_json"] = same_json
+    await database.dispose_engines_async()
+    return results
+
+
+def main_cli(args) -> None:
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for suffix in ("", "-wal", "-shm", ".source.json"):
+            if os.path.exists(database.LOCAL_DB_PATH + suffix):
+                os.remove(database.LOCAL_DB_PATH + suffix)
+        shutil.rmtree(_tmp_root, ignore_errors=True)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    main_cli(parser.parse_args())
@@ -0,0 +1,109 @@
+"""
+LLM クライアントの呼び出しオーバーヘッドのベンチマーク。
+
+OpenAI 互換の Chat Completions API を返すローカルのスタブサーバーを立て、
+次の2通りで同じプロンプトを繰り返し送り、1回あたりの時間と新規TCP接続数を比較する。
+
+    per_call: 呼び出しごとにチャットモデルとチェーンを作り直す (従来の generate_suggestions)
+    service:  llm_interface.LLMService を1度だけ作成し、チェーンと接続プールを使い回す
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_llm_client.py --calls 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+# llm_interface は import 時に設定を読むので先に設定する
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive を有効にする
+    disable_nagle_algorithm = True # ヘッダーと本文の別送で遅延ACK待ちにならないようにする
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        body = json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "## 【提案商品】\n- 牛乳\n- 卵"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def summarize(timings: list[float], connections: int) -> dict:
+    timings = sorted(timings)
+    pick = lambda pct: round(timings[min(len(timings) - 1, int(len(timings) * pct / 100))] * 1000, 3)
+    return {
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "new_connections": connections,
+    }
+
+
+async def main(args) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    import llm_interface
+
+    llm_interface.LLM_BASE_URL = os.environ["LLM_BASE_URL"]
+    prompt = llm_interface.build_user_prompt(1, [{"product": {"name": "牛乳"}, "purchase_date": "2025-01-01"}])
+
+    async def per_call():
+        chain = llm_interface.build_chain(llm_interface.get_llm("openai", "stub-model"))
+        return await chain.ainvoke({"user_history_prompt": prompt})
+
+    service = llm_interface.LLMService("openai", "stub-model")
+    results = {"calls": args.calls}
+    for mode, call in (("per_call", per_call), ("service", lambda: service.agenerate(prompt))):
+        await call() # ウォームアップ
+        StubHandler.connections = 0
+        timings = []
+        for _ in range(args.calls):
+            t0 = time.perf_counter()
+            await call()
+            timings.append(time.perf_counter() - t0)
+        results[mode] = summarize(timings, StubHandler.connections)
+    await service.aclose()
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
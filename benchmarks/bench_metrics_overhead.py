@@ -0,0 +1,149 @@
+"""
+メトリクス (metrics.py) の記録によるオーバーヘッドのベンチマーク。
+
+METRICS_ENABLED=false / true のそれぞれでアプリを起動し (設定はインポート時に読むので別プロセスで実行する)、
+    health:  GET /  (SQLなし。ミドルウェアだけのコスト)
+    history: GET /history/{user_id}?limit=20  (SQL文の計測を含む)
+のレイテンシを比較する。あわせて、1回の記録 (Histogram.observe) のコストと、
+スクレイプ (metrics.render) にかかる時間を測る。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_metrics_overhead.py --requests 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+
+def percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    pick = lambda pct: round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 4)
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99)}
+
+
+def run_child(args) -> dict:
+    """1つの設定 (METRICS_ENABLED) でリクエストを送り、レイテンシを返す"""
+    import asyncio
+    import random
+    import shutil
+    import sqlite3
+    import tempfile
+    from datetime import date, timedelta
+
+    tmp_root = tempfile.mkdtemp(prefix="bench_metrics_")
+    os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(tmp_root, "bucket"))
+    # database は /tmp/{DB_FILE_NAME} を使うので、ベンチマーク専用のファイル名にする
+    os.environ["DB_FILE_NAME"] = f"bench_metrics_{os.getpid()}.db"
+    os.environ["LLM_PROVIDER"] = "fake"
+
+    import httpx
+    from sqlalchemy import create_engine
+
+    import database
+    import main
+    import metrics
+    import models
+
+    engine = create_engine(f"sqlite:///{database.LOCAL_DB_PATH}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(database.LOCAL_DB_PATH)
+    conn.execute("INSERT INTO users (id, name) VALUES (1, 'user1')")
+    conn.executemany("INSERT INTO products (id, name, category) VALUES (?, ?, 'c')", [(i, f"p{i}") for i in range(1, 101)])
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO purchase_history (user_id, product_id, purchase_date) VALUES (1, ?, ?)",
+        [(rng.randint(1, 100), (date(2024, 1, 1) + timedelta(days=rng.randint(0, 365))).isoformat()) for _ in range(500)],
+    )
+    conn.commit()
+    conn.close()
+
+    async def measure(client, url: str) -> dict:
+        for _ in range(50): # ウォームアップ
+            await client.get(url)
+        timings = []
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            response = await client.get(url)
+            timings.append(time.perf_counter() - t0)
+            response.raise_for_status()
+        return percentiles(timings)
+
+    async def run() -> dict:
+        results = {"metrics_enabled": metrics.METRICS_ENABLED}
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                results["health"] = await measure(client, "/")
+                results["history"] = await measure(client, "/history/1?limit=20")
+        return results
+
+    try:
+        return asyncio.run(run())
+    finally:
+        for suffix in ("", "-wal", "-shm", ".source.json"):
+            if os.path.exists(database.LOCAL_DB_PATH + suffix):
+                os.remove(database.LOCAL_DB_PATH + suffix)
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+def measure_primitives(observations: int) -> dict:
+    """1回の記録とスクレイプ (テキストへの整形) のコスト"""
+    import metrics
+
+    histogram = metrics.Histogram("bench_seconds", "benchmark", ("route",))
+    child = histogram.labels("/bench")
+    t0 = time.perf_counter()
+    for i in range(observations):
+        child.observe(i * 1e-6)
+    observe_ns = (time.perf_counter() - t0) / observations * 1e9
+    t0 = time.perf_counter()
+    for i in range(observations):
+        histogram.labels("/bench").observe(i * 1e-6)
+    labels_observe_ns = (time.perf_counter() - t0) / observations * 1e9
+
+    # 30ルート x 3ステータス程度の系列がある状態でのスクレイプ
+    for route in range(30):
+        for status in ("200", "404", "500"):
+            metrics.HTTP_REQUEST_SECONDS.labels("GET", f"/route{route}").observe(0.01)
+            metrics.HTTP_REQUESTS.labels("GET", f"/route{route}", status).inc()
+    t0 = time.perf_counter()
+    text = metrics.render()
+    render_ms = (time.perf_counter() - t0) * 1000
+    return {
+        "observe_ns": round(observe_ns, 1),
+        "labels_and_observe_ns": round(labels_observe_ns, 1),
+        "render_ms": round(render_ms, 3),
+        "render_bytes": len(text),
+    }
+
+
+def main_cli(args) -> None:
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+    results = {"requests": args.requests}
+    for enabled in ("false", "true"):
+        env = {**os.environ, "METRICS_ENABLED": enabled}
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", "--requests", str(args.requests)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        results["enabled" if enabled == "true" else "disabled"] = json.loads(output.strip().splitlines()[-1])
+    results["primitives"] = measure_primitives(args.observations)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--observations", type=int, default=200000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    main_cli(parser.parse_args())
@@ -0,0 +1,103 @@
+"""
+商品検索 (/products/search) のベンチマーク。
+
+日本語の商品名を持つ大量の商品を作成し、FTS5 (trigram) と従来の LIKE '%q%' 検索の
+レイテンシ (p50/p95/p99) を比較する。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_search.py --products 100000 --queries 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+_tmp_root = tempfile.mkdtemp(prefix="bench_search_")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_tmp_root, "bucket"))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import database
+import models
+import search_index
+
+BRANDS = ["明治", "森永", "雪印", "キッコーマン", "日清", "味の素", "カゴメ", "ハウス", "エスビー", "ニッスイ", "Pasco", "トップバリュ"]
+ADJECTIVES = ["おいしい", "国産", "特選", "減塩", "濃厚", "低脂肪", "有機", "北海道産", "徳用", "朝の", "やわらか", "新鮮"]
+FOODS = [
+    "牛乳", "ヨーグルト", "チーズ", "バター", "食パン", "ロールパン", "たまご", "豆腐", "納豆", "醤油", "味噌", "ケチャップ",
+    "マヨネーズ", "カレールウ", "うどん", "そば", "パスタ", "鶏むね肉", "豚こま肉", "牛ひき肉", "鮭切り身", "さば缶",
+    "キャベツ", "にんじん", "たまねぎ", "じゃがいも", "トマト", "きゅうり", "ほうれん草", "バナナ", "りんご", "みかん",
+]
+
+
+def product_name(rng: random.Random) -> str:
+    return f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)}{rng.choice(FOODS)} {rng.randint(100, 999)}g"
+
+
+def create_seed_db(path: str, products: int, rng: random.Random) -> list[str]:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    names = [product_name(rng) for _ in range(products)]
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO products (name) VALUES (?)", [(n,) for n in names])
+    conn.commit()
+    conn.close()
+    search_index.rebuild(path)
+    return names
+
+
+def percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    pick = lambda pct: round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 2)
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99)}
+
+
+async def main(args) -> None:
+    rng = random.Random(0)
+    db_path = os.path.join(_tmp_root, "search.db")
+    names = create_seed_db(db_path, args.products, rng)
+    # 入力途中の文字列を想定し、商品名の一部 (3〜5文字) をクエリにする
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(names).replace(" ", "")
+        length = rng.randint(3, 5)
+        start = rng.randint(0, max(0, len(name) - length))
+        queries.append(name[start:start + length])
+
+    _, reader = database.create_engines(db_path)
+    Session = async_sessionmaker(bind=reader, expire_on_commit=False)
+    results = {"products": args.products, "queries": args.queries}
+    async with Session() as db:
+        for mode in ("like", "fts"):
+            # crud は FTS テーブルの有無をキャッシュしているので、それを差し替えて検索方式を切り替える
+            crud._fts_tables = set() if mode == "like" else {"products_fts", "users_fts"}
+            await crud.search_products_by_name(db, query=queries[0]) # ウォームアップ
+            timings = []
+            for q in queries:
+                t0 = time.perf_counter()
+                await crud.search_products_by_name(db, query=q)
+                timings.append(time.perf_counter() - t0)
+            results[mode] = percentiles(timings)
+    await reader.dispose()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    shutil.rmtree(_tmp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,151 @@
+"""
+SQLite エンジンプロファイルのベンチマーク。
+
+書き込みを流し続けている間に、購入履歴の読み取り (/history 相当のクエリ) が
+1秒あたり何回できるかを default プロファイルと tuned プロファイルで比較する。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_sqlite_profile.py --duration 5 --readers 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+# ベンチマークが GCS に触れないよう、database のインポート前にローカルストレージを指定しておく
+_tmp_root = tempfile.mkdtemp(prefix="bench_sqlite_")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_tmp_root, "bucket"))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import database
+import models
+import schemas
+
+
+def create_seed_db(path: str, users: int, products: int, purchases: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (id, name) VALUES (?, ?)", [(i, f"user{i}") for i in range(1, users + 1)])
+    conn.executemany(
+        "INSERT INTO products (id, name, category) VALUES (?, ?, ?)",
+        [(i, f"product{i}", f"category{i % 10}") for i in range(1, products + 1)],
+    )
+    start = date(2020, 1, 1)
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO purchase_history (user_id, product_id, purchase_date) VALUES (?, ?, ?)",
+        [
+            (rng.randint(1, users), rng.randint(1, products), (start + timedelta(days=rng.randint(0, 1500))).isoformat())
+            for _ in range(purchases)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def percentile_ms(values: list[float], pct: int) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 2)
+
+
+async def run_profile(profile: str, db_path: str, args) -> dict:
+    writer_engine, reader_engine = database.create_engines(db_path, profile=profile)
+    WriteSession = async_sessionmaker(bind=writer_engine, expire_on_commit=False)
+    ReadSession = async_sessionmaker(bind=reader_engine, expire_on_commit=False)
+    # WALへの切り替えなどを先に済ませる
+    async with writer_engine.connect() as conn:
+        await conn.exec_driver_sql("SELECT 1")
+
+    deadline = time.perf_counter() + args.duration
+    reads = 0
+    writes = 0
+    read_errors = 0
+    read_latencies = []
+    write_latencies = []
+
+    async def writer():
+        nonlocal writes
+        rng = random.Random(1)
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            async with WriteSession() as db:
+                await crud.create_purchase_history(db, schemas.PurchaseHistoryCreate(
+                    user_id=rng.randint(1, args.users),
+                    product_id=rng.randint(1, args.products),
+                    purchase_date=date.today(),
+                ))
+            write_latencies.append(time.perf_counter() - t0)
+            writes += 1
+
+    async def reader(seed: int):
+        nonlocal reads, read_errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                async with ReadSession() as db:
+                    await crud.get_purchase_history(db, user_id=rng.randint(1, args.users), limit=args.limit)
+                read_latencies.append(time.perf_counter() - t0)
+                reads += 1
+            except Exception:
+                read_errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(writer(), *(reader(i) for i in range(args.readers)))
+    elapsed = time.perf_counter() - started
+    await reader_engine.dispose()
+    if writer_engine is not reader_engine:
+        await writer_engine.dispose()
+    return {
+        "profile": profile,
+        "reads_per_sec": round(reads / elapsed, 1),
+        "writes_per_sec": round(writes / elapsed, 1),
+        "read_p50_ms": percentile_ms(read_latencies, 50),
+        "read_p95_ms": percentile_ms(read_latencies, 95),
+        "write_p50_ms": percentile_ms(write_latencies, 50),
+        "write_p95_ms": percentile_ms(write_latencies, 95),
+        "read_errors": read_errors,
+        "elapsed_sec": round(elapsed, 2),
+    }
+
+
+async def main(args) -> None:
+    seed_path = os.path.join(_tmp_root, "seed.db")
+    create_seed_db(seed_path, args.users, args.products, args.purchases)
+    results = []
+    for profile in ("default", "tuned"):
+        # プロファイルごとに同じ初期状態のDBを使う (WALはDBファイルに記録されるため)
+        db_path = os.path.join(_tmp_root, f"{profile}.db")
+        shutil.copyfile(seed_path, db_path)
+        results.append(await run_profile(profile, db_path, args))
+    print(json.dumps(results, indent=2))
+    shutil.rmtree(_tmp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=5.0, help="プロファイルごとの計測秒数")
+    parser.add_argument("--readers", type=int, default=8, help="並行して読み取るタスク数")
+    parser.add_argument("--limit", type=int, default=20, help="1回の読み取りで取得する履歴の件数")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--purchases", type=int, default=50_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,186 @@
+"""
+コールドスタートのベンチマーク (STARTUP_MODE=eager / fast の比較と、インポート時間の内訳)。
+
+起動モードごとに新しいプロセスでアプリを起動し、次を測る (--runs 回の中央値):
+    import_s:       import main にかかった時間
+    serving_s:      プロセス開始からリクエストを受け付けるまで (lifespan の起動処理が終わるまで)
+    health_s:       プロセス開始から GET / が返るまで
+    db_ready_s:     プロセス開始から GET /history/{user_id} (DBを使うルート) が返るまで
+    first_llm_s:    DBの準備後、最初の提案でLLMクライアントを作るのにかかった時間 (プロバイダーのSDKの読み込みを含む)
+DBは synthetic_data.py で作り、GCS の代わりのローカルバケットから起動時にダウンロードさせる。
+バケットには --latency-ms (リクエストごと) と --bandwidth-mbps (MB/秒) の遅延を入れて、GCS からの転送を模擬する。
+
+あわせて python -X importtime で import main の内訳 (main が直接インポートするモジュールごとの累積時間と、
+トップレベルのパッケージごとの合計時間) を出す。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --purchases 1000000 --bandwidth-mbps 50 --runs 5
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROCESS_STARTED = time.perf_counter()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+
+def run_child(args) -> dict:
+    """1回分の起動を計測する (新しいプロセスで実行される)"""
+    import asyncio
+
+    t0 = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - t0
+
+    import httpx
+
+    import database
+    import llm_interface
+    import storage
+
+    class ThrottledStore(storage.LocalDirObjectStore):
+        """GCS の代わりに、リクエストごとの遅延と帯域の制限を入れたローカルバケット"""
+
+        def _wait(self, size: int = 0) -> None:
+            time.sleep(args.latency_ms / 1000 + size / (args.bandwidth_mbps * 1024 * 1024))
+
+        def stat(self, name):
+            self._wait()
+            return super().stat(name)
+
+        def download_to_filename(self, name, path, generation=None):
+            info = super().download_to_filename(name, path, generation)
+            self._wait(info.size)
+            return info
+
+        def download_range(self, name, generation, path, start, end):
+            super().download_range(name, generation, path, start, end)
+            self._wait(end - start)
+
+    database._object_store = ThrottledStore(os.environ["LOCAL_STORAGE_DIR"])
+    database._object_store_initialized = True
+
+    async def run() -> dict:
+        results = {"import_s": import_s}
+        async with main.app.router.lifespan_context(main.app):
+            results["serving_s"] = time.perf_counter() - PROCESS_STARTED
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                (await client.get("/")).raise_for_status()
+                results["health_s"] = time.perf_counter() - PROCESS_STARTED
+                (await client.get("/history/1?limit=20")).raise_for_status()
+                results["db_ready_s"] = time.perf_counter() - PROCESS_STARTED
+                t0 = time.perf_counter()
+                await llm_interface.aget_llm_service()
+                results["first_llm_s"] = time.perf_counter() - t0
+        return results
+
+    try:
+        return asyncio.run(run())
+    finally:
+        for suffix in ("", "-wal", "-shm", ".source.json"):
+            if os.path.exists(database.LOCAL_DB_PATH + suffix):
+                os.remove(database.LOCAL_DB_PATH + suffix)
+
+
+def import_breakdown(env: dict, top: int) -> dict:
+    """python -X importtime の結果から、import main の内訳を集計する"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=backend_dir, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            rows.append((int(match.group(1)), int(match.group(2)), len(match.group(3)), match.group(4)))
+    # 子モジュールは親より先に (1段深く) 出力されるので、main の行の直前にある、
+    # main と同じ深さの行 (main より前に読み込まれた site など) より後ろが main の読み込みで増えたもの
+    main_index = next(i for i, row in enumerate(rows) if row[3] == "main")
+    main_depth = rows[main_index][2]
+    start = main_index
+    while start > 0 and rows[start - 1][2] > main_depth:
+        start -= 1
+    children = [row for row in rows[start:main_index] if row[2] == main_depth + 2]
+    by_package: dict[str, int] = {}
+    for self_us, _, _, name in rows[start:main_index + 1]:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    return {
+        "total_ms": round(rows[main_index][1] / 1000, 1),
+        "main_imports_ms": {name: round(cumulative / 1000, 1) for _, cumulative, _, name in sorted(children, key=lambda r: -r[1])[:top]},
+        "packages_ms": {name: round(us / 1000, 1) for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]},
+    }
+
+
+def main_cli(args) -> None:
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+    import synthetic_data
+
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        data_dir = os.path.join(work_dir, "data")
+        counts = synthetic_data.generate_csvs(data_dir, args.users, args.products, args.purchases, seed=0)
+        seed_db = os.path.join(work_dir, "seed.db")
+        synthetic_data.build_database(seed_db, data_dir)
+        bucket = os.path.join(work_dir, "bucket")
+        db_file_name = f"bench_startup_{os.getpid()}.db"
+        os.makedirs(bucket, exist_ok=True)
+        shutil.copyfile(seed_db, os.path.join(bucket, db_file_name)) # 以前の形式のDBファイルとして置く
+        env = {
+            **os.environ,
+            "LOCAL_STORAGE_DIR": bucket,
+            "DB_FILE_NAME": db_file_name,
+            "LLM_PROVIDER": args.provider,
+            # クライアントの作成だけを測る (APIは呼ばない)
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-bench-startup"),
+            "ANTHROPIC_API_KEY": os.environ.get("ANTHROPIC_API_KEY", "sk-ant-bench-startup"),
+        }
+        results = {
+            "rows": counts,
+            "db_bytes": os.path.getsize(seed_db),
+            "provider": args.provider,
+            "latency_ms": args.latency_ms,
+            "bandwidth_mbps": args.bandwidth_mbps,
+            "runs": args.runs,
+        }
+        for mode in ("eager", "fast"):
+            samples = []
+            for _ in range(args.runs):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", "--latency-ms", str(args.latency_ms), "--bandwidth-mbps", str(args.bandwidth_mbps)],
+                    env={**env, "STARTUP_MODE": mode}, check=True, capture_output=True, text=True,
+                ).stdout
+                samples.append(json.loads(output.strip().splitlines()[-1]))
+            results[mode] = {key: round(statistics.median(s[key] for s in samples), 3) for key in samples[0]}
+        results["import_breakdown"] = import_breakdown(env, args.top)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--purchases", type=int, default=100000)
+    parser.add_argument("--provider", default="openai", choices=("openai", "anthropic", "fake"))
+    parser.add_argument("--latency-ms", type=float, default=30, help="simulated storage latency per request")
+    parser.add_argument("--bandwidth-mbps", type=float, default=100, help="simulated storage bandwidth (MB/s)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12, help="entries in each import-time list")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    main_cli(parser.parse_args())
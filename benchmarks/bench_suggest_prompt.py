@@ -0,0 +1,140 @@
+"""
+/suggest のプロンプト形式のベンチマーク。
+
+購入履歴の多いユーザーについて、従来の形式 (直近100件を1行ずつ: rows) と
+商品ごとの集計表 (summary) のそれぞれで、プロンプトのトークン数 (llm_interface.estimate_tokens による概算) と
+/suggest/{user_id} のエンドツーエンドのレイテンシを比較する。
+LLM は待ち時間0の偽モデル (fake) を使うので、レイテンシはDBの読み込みとプロンプト作成にかかる時間になる。
+実際のLLMではこれに、プロンプトのトークン数に応じた処理時間と料金が加わる。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_suggest_prompt.py --purchases 5000 --requests 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+_tmp_root = tempfile.mkdtemp(prefix="bench_prompt_")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_tmp_root, "bucket"))
+# database は /tmp/{DB_FILE_NAME} を使うので、ベンチマーク専用のファイル名にする
+os.environ["DB_FILE_NAME"] = f"bench_prompt_{os.getpid()}.db"
+os.environ["SUGGESTION_CACHE_TTL_SECONDS"] = "0"
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["FAKE_LLM_FIRST_TOKEN_DELAY_SECONDS"] = "0"
+os.environ["FAKE_LLM_TOKEN_DELAY_SECONDS"] = "0"
+
+import httpx
+from sqlalchemy import create_engine
+
+import database
+import llm_interface
+import main
+import models
+import suggestions
+
+CATEGORIES = {
+    "乳製品": ["牛乳", "ヨーグルト", "チーズ", "バター"],
+    "パン": ["食パン", "ロールパン", "クロワッサン"],
+    "卵・豆腐": ["たまご", "木綿豆腐", "絹豆腐", "納豆"],
+    "肉": ["鶏むね肉", "鶏もも肉", "豚こま肉", "牛ひき肉", "ベーコン", "ウインナー"],
+    "魚": ["鮭切り身", "さば缶", "ツナ缶", "しらす"],
+    "野菜": ["キャベツ", "にんじん", "たまねぎ", "じゃがいも", "トマト", "きゅうり", "ほうれん草", "ブロッコリー", "もやし", "ねぎ"],
+    "果物": ["バナナ", "りんご", "みかん", "キウイ"],
+    "調味料": ["醤油", "味噌", "ケチャップ", "マヨネーズ", "めんつゆ"],
+    "主食": ["米 5kg", "うどん", "パスタ", "そば"],
+}
+
+
+def create_seed_db(path: str, purchases: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, name) VALUES (1, 'user1')")
+    products = [(name, category) for category, names in CATEGORIES.items() for name in names]
+    conn.executemany("INSERT INTO products (name, category) VALUES (?, ?)", products)
+    # 商品ごとに決まった間隔 (3〜30日) で繰り返し購入する
+    rng = random.Random(0)
+    intervals = {product_id: rng.randint(3, 30) for product_id in range(1, len(products) + 1)}
+    end = date(2025, 1, 1)
+    rows = []
+    while len(rows) < purchases:
+        product_id = rng.randint(1, len(products))
+        rows.append((product_id, end - timedelta(days=intervals[product_id] * rng.randint(0, 200))))
+    conn.executemany(
+        "INSERT INTO purchase_history (user_id, product_id, purchase_date) VALUES (1, ?, ?)",
+        [(product_id, d.isoformat()) for product_id, d in rows],
+    )
+    conn.commit()
+    conn.close()
+
+
+def percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    pick = lambda pct: round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 2)
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99)}
+
+
+async def run(args) -> dict:
+    create_seed_db(database.LOCAL_DB_PATH, args.purchases)
+    prompts = []
+    generate = llm_interface.agenerate_suggestions
+
+    async def recording_generate(user_prompt: str) -> str:
+        prompts.append(user_prompt)
+        return await generate(user_prompt)
+
+    llm_interface.agenerate_suggestions = recording_generate
+    results = {"purchases": args.purchases, "requests": args.requests}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for history_format in ("rows", "summary"):
+            suggestions.SUGGESTION_HISTORY_FORMAT = history_format
+            response = await client.get("/suggest/1") # ウォームアップ
+            response.raise_for_status()
+            timings = []
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                response = await client.get("/suggest/1")
+                timings.append(time.perf_counter() - t0)
+                response.raise_for_status()
+            prompt = prompts[-1]
+            results[history_format] = {
+                "prompt_chars": len(prompt),
+                "prompt_tokens": llm_interface.estimate_tokens(prompt),
+                "total_input_tokens": llm_interface.estimate_tokens(prompt + llm_interface.SYSTEM_TEMPLATE),
+                "history_rows_covered": args.purchases if history_format == "summary" else min(args.purchases, 100),
+                **percentiles(timings),
+            }
+    await database.dispose_engines_async()
+    return results
+
+
+def main_cli(args) -> None:
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for suffix in ("", "-wal", "-shm", ".source.json"):
+            if os.path.exists(database.LOCAL_DB_PATH + suffix):
+                os.remove(database.LOCAL_DB_PATH + suffix)
+        shutil.rmtree(_tmp_root, ignore_errors=True)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=100)
+    main_cli(parser.parse_args())
@@ -0,0 +1,326 @@
+"""
+全エンドポイントの負荷ベンチマーク (コミット間の比較用)。
+
+synthetic_data.py で作った合成データのDBを、ローカルディレクトリのバケット (LocalDirObjectStore。--storage memory ならメモリ。GCS の代わり) に
+置いてからアプリを起動し (起動時のダウンロードも含めて計測する)、LLMは fake_llm の偽モデル
+(最初のトークンまでの時間とトークンの生成速度を指定できる) に差し替えて、
+エンドポイントごとに --concurrency 本の非同期クライアントから同時にリクエストを送る。
+
+結果 (スループット、p50/p95/p99 のレイテンシ、ステータスコードの内訳) は --output-dir に
+<日時>_<コミット>.json と同じ名前の .csv で書き出す。同じ引数 (--seed を含む) で実行すれば同じデータ・同じリクエストになる。
+2つの結果を比べるには --compare を使う。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_suite.py                                   # 既定の規模 (2000ユーザー、10万件の購入履歴)
+    python benchmarks/bench_suite.py --purchases 1000000 --users 20000 --concurrency 16
+    python benchmarks/bench_suite.py --scenarios history,purchase --requests 1000
+    python benchmarks/bench_suite.py --compare benchmarks/results/A.json benchmarks/results/B.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.join(current_dir, "..")
+backend_dir = os.path.join(root_dir, "backend")
+sys.path.append(backend_dir)
+
+DEFAULT_OUTPUT_DIR = os.path.join(current_dir, "results")
+
+
+class Scenario:
+    """1つのエンドポイントへの負荷。make_request(rng, ctx) が (メソッド, URL, JSONボディ) を返す"""
+
+    def __init__(self, name: str, route: str, make_request, expected_status=(200,), llm: bool = False):
+        self.name = name
+        self.route = route
+        self.make_request = make_request
+        self.expected_status = expected_status
+        self.llm = llm # LLMを呼ぶシナリオ (リクエスト数は --llm-requests)
+
+
+def _user(rng, ctx) -> int:
+    return rng.randint(1, ctx["users"])
+
+
+def _product(rng, ctx) -> int:
+    return rng.randint(1, ctx["products"])
+
+
+def _unique(ctx, prefix: str) -> str:
+    ctx["serial"] += 1
+    return f"{prefix}-{ctx['run_id']}-{ctx['serial']}"
+
+
+def _purchase(rng, ctx) -> dict:
+    purchase_date = ctx["end_date"] - timedelta(days=rng.randint(0, 30))
+    return {"user_id": _user(rng, ctx), "product_id": _product(rng, ctx), "purchase_date": purchase_date.isoformat()}
+
+
+SEARCH_TERMS = ["牛乳", "にんじん", "ヨーグルト", "鶏むね肉", "冷凍", "国産", "大容量", "パン"]
+
+SCENARIOS = [
+    Scenario("health", "/", lambda rng, ctx: ("GET", "/", None)),
+    Scenario("persistence_stats", "/persistence/stats", lambda rng, ctx: ("GET", "/persistence/stats", None)),
+    Scenario("cache_stats", "/cache/stats", lambda rng, ctx: ("GET", "/cache/stats", None)),
+    Scenario("metrics", "/metrics", lambda rng, ctx: ("GET", "/metrics", None), expected_status=(200, 404)),
+    Scenario("profiles", "/profiles", lambda rng, ctx: ("GET", "/profiles", None), expected_status=(200, 404)),
+    Scenario("profile_download", "/profiles/{name}", lambda rng, ctx: ("GET", "/profiles/missing.prof", None), expected_status=(404,)),
+    Scenario("history", "/history/{user_id}", lambda rng, ctx: ("GET", f"/history/{_user(rng, ctx)}?limit=100", None)),
+    Scenario("export_user", "/export/purchases", lambda rng, ctx: ("GET", f"/export/purchases?format=ndjson&user_id={_user(rng, ctx)}", None)),
+    Scenario("users_search", "/users/search", lambda rng, ctx: ("GET", f"/users/search?q=user{rng.randint(1, 999)}", None)),
+    Scenario("products_search", "/products/search", lambda rng, ctx: ("GET", f"/products/search?q={rng.choice(SEARCH_TERMS)}", None)),
+    Scenario("recommend", "/recommend/{user_id}", lambda rng, ctx: ("GET", f"/recommend/{_user(rng, ctx)}", None)),
+    Scenario("due", "/due/{user_id}", lambda rng, ctx: ("GET", f"/due/{_user(rng, ctx)}?as_of={ctx['end_date'] + timedelta(days=3)}", None)),
+    Scenario("create_user", "/users/", lambda rng, ctx: ("POST", "/users/", {"name": _unique(ctx, "bench-user")})),
+    Scenario("create_product", "/products/", lambda rng, ctx: ("POST", "/products/", {"name": _unique(ctx, "bench-product"), "category": "ベンチマーク"})),
+    Scenario("purchase", "/purchase/", lambda rng, ctx: ("POST", "/purchase/", _purchase(rng, ctx))),
+    Scenario("purchase_batch", "/purchases/batch", lambda rng, ctx: ("POST", "/purchases/batch", [_purchase(rng, ctx) for _ in range(20)])),
+    Scenario("suggest", "/suggest/{user_id}", lambda rng, ctx: ("GET", f"/suggest/{_user(rng, ctx)}", None), llm=True),
+    Scenario("suggest_stream", "/suggest/{user_id}/stream", lambda rng, ctx: ("GET", f"/suggest/{_user(rng, ctx)}/stream", None), llm=True),
+]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    values = sorted(values)
+    pick = lambda pct: round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 3)
+    return {
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "p99_ms": pick(99),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, seed: int, ctx: dict) -> dict:
+    """requests 件のリクエストを concurrency 本のワーカーで送り、レイテンシとステータスコードを集計する"""
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    errors: Counter = Counter()
+    remaining = requests
+
+    async def worker(index: int) -> None:
+        nonlocal remaining
+        rng = random.Random(f"{seed}-{scenario.name}-{index}")
+        while remaining > 0:
+            remaining -= 1
+            method, url, body = scenario.make_request(rng, ctx)
+            t0 = time.perf_counter()
+            try:
+                # ストリーミングレスポンスも最後まで読み終えるまでを計測する
+                async with client.stream(method, url, json=body) as response:
+                    await response.aread()
+                latencies.append(time.perf_counter() - t0)
+                statuses[response.status_code] += 1
+            except Exception as e:
+                errors[type(e).__name__] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    unexpected = sum(count for status, count in statuses.items() if status not in scenario.expected_status)
+    return {
+        "route": scenario.route,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        **percentiles(latencies),
+        "status": {str(status): count for status, count in sorted(statuses.items())},
+        "unexpected_status": unexpected,
+        "errors": dict(errors),
+    }
+
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        return subprocess.run(["git", *args], cwd=root_dir, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def prepare_data(args, work_dir: str) -> tuple[str, dict]:
+    """合成データのCSVとDBを作る (--data-dir にCSVがあればそれを使う)"""
+    import synthetic_data
+
+    data_dir = args.data_dir or os.path.join(work_dir, "data")
+    if args.data_dir and os.path.exists(os.path.join(args.data_dir, "purchase_history.csv")):
+        counts = None # 既存のCSVを使う
+    else:
+        counts = synthetic_data.generate_csvs(data_dir, args.users, args.products, args.purchases, seed=args.seed)
+    db_path = os.path.join(work_dir, "seed.db")
+    synthetic_data.build_database(db_path, data_dir)
+    return db_path, counts
+
+
+async def run_suite(args, scenarios: list[Scenario], seed_db_path: str) -> dict:
+    import httpx
+
+    import database
+    import main
+
+    # GCS の代わりのバケット (ローカルディレクトリまたはメモリ) に、以前の形式のDBファイルとして置く (起動時にダウンロードされる)
+    database.get_object_store().upload_from_filename(database.DB_FILE_NAME, seed_db_path)
+    ctx = {
+        "users": args.users,
+        "products": args.products,
+        "end_date": args.end_date,
+        "run_id": f"{int(time.time())}-{os.getpid()}",
+        "serial": 0,
+    }
+    results = {}
+    started = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        startup_s = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            for scenario in scenarios:
+                requests = args.llm_requests if scenario.llm else args.requests
+                # ウォームアップ (計測に含めない)
+                await run_scenario(client, scenario, min(requests, args.warmup), args.concurrency, args.seed + 1, ctx)
+                results[scenario.name] = await run_scenario(client, scenario, requests, args.concurrency, args.seed, ctx)
+                print(
+                    f"{scenario.name:18s} {results[scenario.name]['throughput_rps']:>9} req/s  "
+                    f"p50 {results[scenario.name]['p50_ms']} ms  p99 {results[scenario.name]['p99_ms']} ms",
+                    file=sys.stderr,
+                )
+    shutdown_s = time.perf_counter() - started - startup_s - sum(r["elapsed_s"] for r in results.values())
+    return {"startup_s": round(startup_s, 3), "shutdown_and_warmup_s": round(shutdown_s, 3), "scenarios": results}
+
+
+def uncovered_routes(scenarios: list[Scenario]) -> list[str]:
+    """アプリのルートのうち、どのシナリオも送っていないもの"""
+    import main
+    from fastapi.routing import APIRoute
+
+    covered = {scenario.route for scenario in scenarios}
+    return sorted(route.path for route in main.app.routes if isinstance(route, APIRoute) and route.path not in covered)
+
+
+def write_results(results: dict, output_dir: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    commit = results["meta"]["git"]["commit"] or "nogit"
+    base = os.path.join(output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit}")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    columns = ["scenario", "route", "requests", "concurrency", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "max_ms", "unexpected_status"]
+    with open(base + ".csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["commit", *columns])
+        for name, result in results["scenarios"].items():
+            writer.writerow([commit, name, *(result[column] for column in columns[1:])])
+    return base + ".json"
+
+
+def compare(base_path: str, new_path: str) -> None:
+    """2つの結果ファイルのスループットとレイテンシを比べる (比は new / base)"""
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"base: {base['meta']['git']['commit']} ({base_path})\nnew:  {new['meta']['git']['commit']} ({new_path})")
+    print(f"{'scenario':18s} {'rps base':>10} {'rps new':>10} {'ratio':>6}   {'p50 ratio':>9} {'p95 ratio':>9} {'p99 ratio':>9}")
+    ratio = lambda a, b: f"{b / a:.2f}" if a and b else "-"
+    for name, new_result in new["scenarios"].items():
+        base_result = base["scenarios"].get(name)
+        if base_result is None:
+            print(f"{name:18s} (not in base)")
+            continue
+        print(
+            f"{name:18s} {base_result['throughput_rps'] or 0:>10.1f} {new_result['throughput_rps'] or 0:>10.1f} "
+            f"{ratio(base_result['throughput_rps'], new_result['throughput_rps']):>6}   "
+            f"{ratio(base_result['p50_ms'], new_result['p50_ms']):>9} "
+            f"{ratio(base_result['p95_ms'], new_result['p95_ms']):>9} "
+            f"{ratio(base_result['p99_ms'], new_result['p99_ms']):>9}"
+        )
+
+
+def main_cli(args) -> None:
+    if args.compare:
+        compare(*args.compare)
+        return
+    scenarios = SCENARIOS
+    if args.scenarios:
+        names = args.scenarios.split(",")
+        unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    # backend のモジュールは設定をインポート時に読むので、インポートの前に環境変数を設定する
+    os.environ["LOCAL_STORAGE_DIR"] = os.path.join(work_dir, "bucket")
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["DB_FILE_NAME"] = f"bench_suite_{os.getpid()}.db" # database は /tmp/{DB_FILE_NAME} を使う
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_FIRST_TOKEN_DELAY_SECONDS"] = str(args.llm_first_token_seconds)
+    os.environ["FAKE_LLM_TOKEN_DELAY_SECONDS"] = str(1 / args.llm_tokens_per_second)
+    if not args.suggestion_cache:
+        os.environ["SUGGESTION_CACHE_TTL_SECONDS"] = "0" # 毎回LLMを呼ぶ
+    try:
+        t0 = time.perf_counter()
+        seed_db_path, counts = prepare_data(args, work_dir)
+        data_s = time.perf_counter() - t0
+        import database
+
+        try:
+            results = asyncio.run(run_suite(args, scenarios, seed_db_path))
+        finally:
+            for suffix in ("", "-wal", "-shm", ".source.json"):
+                if os.path.exists(database.LOCAL_DB_PATH + suffix):
+                    os.remove(database.LOCAL_DB_PATH + suffix)
+        results["meta"] = {
+            "git": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: str(value) if isinstance(value, date) else value for key, value in vars(args).items()},
+            "data": {"rows": counts, "prepare_s": round(data_s, 3)},
+            "uncovered_routes": uncovered_routes(scenarios),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    path = write_results(results, args.output_dir)
+    print(f"Results written to {path} (and .csv)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import synthetic_data
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--purchases", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="use (or write) the synthetic CSVs here instead of a temporary directory")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=synthetic_data.DEFAULT_END_DATE,
+                        help="latest purchase date of the data (used for new purchases and /due)")
+    parser.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(s.name for s in SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--llm-requests", type=int, default=32, help="measured requests per LLM scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-first-token-seconds", type=float, default=0.2, help="fake LLM latency until the first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200, help="fake LLM streaming rate")
+    parser.add_argument("--storage", choices=("local", "memory"), default="local", help="stand-in for the GCS bucket")
+    parser.add_argument("--suggestion-cache", action="store_true", help="keep the suggestion cache on (default: every /suggest calls the LLM)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files instead of running")
+    main_cli(parser.parse_args())
@@ -0,0 +1,137 @@
+"""
+購入履歴の登録 (POST /purchase/ の処理) のベンチマーク。
+
+従来の手順 (ユーザー・商品の存在確認 → ORM で add → commit → refresh → 関連の refresh) と、
+現在の crud.create_purchase_history (存在確認を含めた1つの INSERT ... SELECT ... RETURNING、
+商品はキャッシュから取得) で、1秒あたりの登録件数と1件あたりのSQL文の数を比較する。
+どちらも tuned プロファイルの書き込み用エンジン (接続1本) を使い、複数のタスクから同時に登録する。
+
+使い方 (プロジェクトルートから):
+    python benchmarks/bench_write_path.py --purchases 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, "..", "backend")
+sys.path.append(backend_dir)
+
+# ベンチマークが GCS に触れないよう、database のインポート前にローカルストレージを指定しておく
+_tmp_root = tempfile.mkdtemp(prefix="bench_write_")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_tmp_root, "bucket"))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import database
+import models
+import schemas
+from product_cache import product_cache
+
+
+def create_seed_db(path: str, users: int, products: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (id, name) VALUES (?, ?)", [(i, f"user{i}") for i in range(1, users + 1)])
+    conn.executemany(
+        "INSERT INTO products (id, name, category) VALUES (?, ?, ?)",
+        [(i, f"product{i}", f"category{i % 10}") for i in range(1, products + 1)],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def legacy_create_purchase(db, purchase: schemas.PurchaseHistoryCreate):
+    """変更前の POST /purchase/ と crud.create_purchase_history の手順"""
+    if await crud.get_user(db, user_id=purchase.user_id) is None:
+        raise LookupError("User not found")
+    if await crud.get_product_cached(db, product_id=purchase.product_id) is None:
+        raise LookupError("Product not found")
+    db_purchase = models.PurchaseHistory(**purchase.model_dump())
+    db.add(db_purchase)
+    await db.commit()
+    await db.refresh(db_purchase)
+    await db.refresh(db_purchase, attribute_names=['product', 'owner'])
+    return schemas.PurchaseHistory.model_validate(db_purchase)
+
+
+async def current_create_purchase(db, purchase: schemas.PurchaseHistoryCreate):
+    new_purchase = await crud.create_purchase_history(db, purchase)
+    if new_purchase is None:
+        raise LookupError("User or product not found")
+    return new_purchase
+
+
+async def measure(create, Session, purchases: list[schemas.PurchaseHistoryCreate], concurrency: int) -> dict:
+    queue = list(reversed(purchases))
+
+    async def worker():
+        while queue:
+            purchase = queue.pop()
+            async with Session() as db:
+                await create(db, purchase)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {"seconds": round(elapsed, 3), "inserts_per_sec": round(len(purchases) / elapsed, 1)}
+
+
+async def run(args) -> dict:
+    db_path = os.path.join(_tmp_root, "bench.db")
+    create_seed_db(db_path, args.users, args.products)
+    writer, reader = database.create_engines(db_path, profile="tuned")
+    Session = async_sessionmaker(bind=writer, expire_on_commit=False)
+    statements = []
+    event.listen(writer.sync_engine, "before_cursor_execute", lambda *a: statements.append(1))
+
+    rng = random.Random(0)
+    start = date(2024, 1, 1)
+    results = {"purchases": args.purchases, "concurrency": args.concurrency}
+    for name, create in (("legacy", legacy_create_purchase), ("returning", current_create_purchase)):
+        purchases = [
+            schemas.PurchaseHistoryCreate(
+                user_id=rng.randint(1, args.users),
+                product_id=rng.randint(1, args.products),
+                purchase_date=start + timedelta(days=rng.randint(0, 365)),
+            )
+            for _ in range(args.purchases)
+        ]
+        product_cache.clear()
+        await measure(create, Session, purchases[:50], args.concurrency) # ウォームアップ (商品キャッシュも温まる)
+        statements.clear()
+        results[name] = await measure(create, Session, purchases, args.concurrency)
+        results[name]["statements_per_insert"] = round(len(statements) / len(purchases), 2)
+    results["speedup"] = round(results["returning"]["inserts_per_sec"] / results["legacy"]["inserts_per_sec"], 2)
+    await writer.dispose()
+    await reader.dispose()
+    return results
+
+
+def main(args) -> None:
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(_tmp_root, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--purchases", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    main(parser.parse_args())
@@ -0,0 +1,205 @@
+"""
+ベンチマーク用の合成データ (ユーザー・商品・購入履歴) を作る。
+
+import_data.py が読み込む形式 (ヘッダーなし) の users.csv / products.csv / purchase_history.csv を書き出し、
+必要なら import_data.py の一括インポートでSQLiteのDBも作る。同じ引数 (seed) なら常に同じデータになる。
+
+購入履歴は実際の買い物に近い形にする:
+    - ユーザーごとに、週に何回買い物に行くか (0.7〜2.5回) と、よく行く曜日 (週末が多い) がある
+    - ユーザーごとに定番の商品 (5〜25品) があり、商品カテゴリの購入周期 (牛乳は数日、調味料は1〜2か月など)
+      にユーザーごとのばらつきを掛けた間隔で買い直す
+    - 買い物のたびに、人気のある商品から数品を衝動買いする
+    - 商品の人気・ユーザーの購入件数は偏らせる (一部の商品・ユーザーに集中する)
+
+使い方 (プロジェクトルートから):
+    python benchmarks/synthetic_data.py --out-dir data_export --users 20000 --products 2000 --purchases 1000000
+    python benchmarks/synthetic_data.py --out-dir /tmp/synth --db /tmp/synth/shopping_app.db   # DBも作る
+    python import_data.py --bulk --data-dir data_export                                       # 書き出したCSVを読み込む
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.join(current_dir, "..")
+backend_dir = os.path.join(root_dir, "backend")
+sys.path.append(backend_dir)
+
+DEFAULT_END_DATE = date(2025, 6, 30) # 実行日によってデータが変わらないよう、最終購入日は固定する
+
+# カテゴリ -> (購入周期の目安 (日), 商品名, 価格の目安)
+CATALOG = {
+    "野菜": (7, ["にんじん", "たまねぎ", "じゃがいも", "キャベツ", "ほうれん草", "トマト", "きゅうり", "ブロッコリー", "大根", "ねぎ"], 150),
+    "果物": (7, ["バナナ", "りんご", "みかん", "いちご", "ぶどう", "キウイ"], 300),
+    "肉": (7, ["鶏むね肉", "鶏もも肉", "豚こま切れ肉", "牛ひき肉", "ベーコン", "ウインナー"], 400),
+    "魚": (10, ["鮭切り身", "さば", "まぐろ刺身", "しらす", "えび", "あじ"], 450),
+    "乳製品": (5, ["牛乳", "ヨーグルト", "チーズ", "バター", "生クリーム"], 250),
+    "卵・大豆製品": (7, ["卵", "木綿豆腐", "絹ごし豆腐", "納豆", "油揚げ"], 150),
+    "パン・米・麺": (14, ["食パン", "米", "うどん", "パスタ", "そば", "ロールパン"], 300),
+    "調味料": (45, ["醤油", "味噌", "マヨネーズ", "ケチャップ", "砂糖", "塩", "みりん"], 350),
+    "飲料": (10, ["緑茶", "コーヒー", "炭酸水", "オレンジジュース", "麦茶"], 200),
+    "お菓子": (14, ["ポテトチップス", "チョコレート", "クッキー", "せんべい", "グミ"], 180),
+    "冷凍食品": (21, ["冷凍餃子", "冷凍うどん", "アイスクリーム", "冷凍ブロッコリー", "冷凍チャーハン"], 350),
+}
+VARIANTS = ["", " 徳用", " 国産", " 有機", " 小分け", " 大容量", " 特選"]
+SEASONAL = {"いちご": "冬", "みかん": "冬", "ぶどう": "秋", "アイスクリーム": "夏", "麦茶": "夏", "きゅうり": "夏", "トマト": "夏", "大根": "冬"}
+# 曜日 (月=0) ごとの、よく買い物に行く曜日として選ばれる重み (週末が多い)
+WEEKDAY_WEIGHTS = [1.0, 0.8, 1.0, 0.9, 1.2, 2.2, 2.0]
+
+
+def _write_rows(path: str, rows) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def generate_products(count: int, rng: random.Random) -> list[dict]:
+    """商品マスタ (カテゴリ・名前・価格・季節)。同じ商品名にはバリエーション (徳用・国産など) を付けて区別する"""
+    items = [(category, name) for category, (_, names, _) in CATALOG.items() for name in names]
+    products = []
+    for product_id in range(1, count + 1):
+        category, name = items[(product_id - 1) % len(items)]
+        round_index = (product_id - 1) // len(items)
+        variant = VARIANTS[round_index % len(VARIANTS)]
+        suffix = f" {round_index // len(VARIANTS) + 1}" if round_index >= len(VARIANTS) else ""
+        price = CATALOG[category][2] * math.exp(rng.gauss(0, 0.3))
+        products.append({
+            "id": product_id,
+            "name": f"{name}{variant}{suffix}",
+            "category": category,
+            "typical_price": round(price),
+            "seasonality": SEASONAL.get(name, "通年"),
+        })
+    return products
+
+
+def _purchase_budgets(users: int, purchases: int, rng: random.Random) -> list[int]:
+    """ユーザーごとの購入件数 (合計が purchases になるよう、対数正規分布の重みで配分する)"""
+    weights = [math.exp(rng.gauss(0, 0.8)) for _ in range(users)]
+    total = sum(weights)
+    budgets = [int(purchases * w / total) for w in weights]
+    # 切り捨てた分 (users 件未満) を無作為に選んだユーザーに1件ずつ足す
+    for i in rng.sample(range(users), purchases - sum(budgets)):
+        budgets[i] += 1
+    return budgets
+
+
+def _user_purchases(budget: int, products: list[dict], popularity: list[float], end_date: date, rng: random.Random):
+    """1人分の購入 (product_id, 購入日) を古い順に返す。最終購入日から過去へ向かって買い物を生成する"""
+    if budget <= 0:
+        return []
+    trips_per_week = rng.uniform(0.7, 2.5)
+    preferred_weekday = rng.choices(range(7), weights=WEEKDAY_WEIGHTS)[0]
+    staple_count = rng.randint(5, 25)
+    staples = {}
+    for product_index in rng.choices(range(len(products)), weights=popularity, k=staple_count * 2):
+        if len(staples) >= staple_count:
+            break
+        interval = CATALOG[products[product_index]["category"]][0] * math.exp(rng.gauss(0, 0.3))
+        staples[product_index] = max(3.0, interval)
+    # 定番の商品ごとに、次に (過去へ向かって) 買う日
+    next_due = {product_index: end_date - timedelta(days=rng.uniform(0, interval)) for product_index, interval in staples.items()}
+
+    purchases = []
+    day = end_date - timedelta(days=rng.randint(0, 3))
+    while len(purchases) < budget:
+        basket = [product_index for product_index, due in next_due.items() if day <= due]
+        for product_index in basket:
+            next_due[product_index] = day - timedelta(days=staples[product_index] * math.exp(rng.gauss(0, 0.2)))
+        # 衝動買い (人気のある商品ほど選ばれやすい)
+        basket.extend(rng.choices(range(len(products)), weights=popularity, k=rng.choice((0, 0, 1, 1, 2, 3))))
+        if not basket:
+            basket = [rng.choices(range(len(products)), weights=popularity)[0]]
+        for product_index in dict.fromkeys(basket):
+            if len(purchases) >= budget:
+                break
+            purchases.append((products[product_index]["id"], day))
+        # 次の (過去の) 買い物の日。週1回程度の人は、よく行く曜日に寄せる
+        gap = max(1, round(7 / trips_per_week * math.exp(rng.gauss(0, 0.25))))
+        day -= timedelta(days=gap)
+        if trips_per_week < 1.3 and rng.random() < 0.7:
+            day -= timedelta(days=(day.weekday() - preferred_weekday) % 7)
+    purchases.reverse()
+    return purchases
+
+
+def generate_csvs(out_dir: str, users: int, products: int, purchases: int, seed: int = 0,
+                  end_date: date = DEFAULT_END_DATE) -> dict:
+    """CSVを書き出し、書き出した行数を返す"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    product_rows = generate_products(products, rng)
+    # 商品の人気 (Zipf 分布に近い偏り。人気の順番は商品IDと無関係にする)
+    ranks = list(range(1, products + 1))
+    rng.shuffle(ranks)
+    popularity = [1 / rank ** 0.9 for rank in ranks]
+
+    def user_rows():
+        for user_id in range(1, users + 1):
+            preferences = json.dumps({"likes": [rng.choice(product_rows)["name"]]}, ensure_ascii=False) if rng.random() < 0.1 else ""
+            yield user_id, f"user{user_id}", preferences
+
+    def purchase_rows():
+        history_id = 0
+        for user_id, budget in enumerate(_purchase_budgets(users, purchases, rng), start=1):
+            for product_id, purchase_date in _user_purchases(budget, product_rows, popularity, end_date, rng):
+                history_id += 1
+                yield history_id, user_id, product_id, purchase_date.isoformat()
+
+    return {
+        "users": _write_rows(os.path.join(out_dir, "users.csv"), user_rows()),
+        "products": _write_rows(
+            os.path.join(out_dir, "products.csv"),
+            ((p["id"], p["name"], p["category"], p["typical_price"], p["seasonality"]) for p in product_rows),
+        ),
+        "purchase_history": _write_rows(os.path.join(out_dir, "purchase_history.csv"), purchase_rows()),
+    }
+
+
+def build_database(db_path: str, data_dir: str) -> None:
+    """空のDBにテーブルを作り、CSVを import_data.py の一括インポートで読み込み、全文検索インデックスを作る"""
+    sys.path.append(root_dir)
+    # models は database をインポートするので、GCS に触れないようローカルストレージを指定しておく
+    os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(db_path)), "bucket"))
+    from sqlalchemy import create_engine
+
+    import models
+    import search_index
+    with contextlib.redirect_stdout(io.StringIO()):
+        import import_data
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    models.Base.metadata.create_all(engine)
+    engine.dispose()
+    with contextlib.redirect_stdout(io.StringIO()): # 進捗の表示を抑える
+        import_data.bulk_import(db_path, data_dir=data_dir, report_interval=3600)
+    search_index.rebuild(db_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out-dir", required=True, help="directory for users.csv, products.csv and purchase_history.csv")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--purchases", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=DEFAULT_END_DATE, help="date of the latest purchases (YYYY-MM-DD)")
+    parser.add_argument("--db", help="also build a SQLite DB from the CSVs at this path (must not exist)")
+    args = parser.parse_args()
+    counts = generate_csvs(args.out_dir, args.users, args.products, args.purchases, seed=args.seed, end_date=args.end_date)
+    if args.db:
+        if os.path.exists(args.db):
+            parser.error(f"{args.db} already exists")
+        build_database(args.db, args.out_dir)
+    print(json.dumps({"out_dir": args.out_dir, "db": args.db, "rows": counts}, ensure_ascii=False))
@@ -0,0 +1,71 @@
+"""
+リモートのDB (STORAGE_BUCKET、または LOCAL_STORAGE_DIR) をダウンロードする・手元のDBを公開する。
+
+サーバーはマニフェスト (<DB_FILE_NAME>.manifest.json) が指すスナップショットから起動するので、
+マニフェストができた後は、DBファイルをバケットへ直接コピーしても (gsutil cp など) 読み込まれない。
+作り直したDBやマイグレーションを適用したDBは、このスクリプトで公開する。
+環境変数 (STORAGE_BUCKET, DB_FILE_NAME, STORAGE_BACKEND, DB_PERSISTENCE_MODE など) はサーバーと同じものを指定すること。
+
+使い方 (プロジェクトルートから):
+    python db_snapshot.py download work.db                  # 現在のDB (ベース + 変更セグメント) を work.db に書き出す
+    python db_snapshot.py publish backend/shopping_app.db   # import_data.py で作り直したDBを公開する
+    python db_snapshot.py publish work.db --keep-segments   # download したDBに変更を加えて公開する
+
+公開はマニフェストの条件付きの書き込みで行うので、その間に他のインスタンスがアップロードしていれば失敗する (再実行すればよい)。
+稼働中のインスタンスは古いDBのまま (公開したDBを上書きしないよう、以降の変更はアップロードしない) なので、
+公開後に再起動する (新しいリビジョンをデプロイする) こと。
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+# backendディレクトリを直接インポートパスに追加
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, 'backend')
+sys.path.append(backend_dir)
+
+import database
+
+
+async def download(args) -> bool:
+    if os.path.exists(args.db):
+        print(f"Error: '{args.db}' already exists.", file=sys.stderr)
+        return False
+    database.set_local_db_path(args.db)
+    if not await database.download_db_file_async():
+        return False
+    if not os.path.exists(args.db):
+        print("Error: No remote DB found.", file=sys.stderr)
+        return False
+    # ダウンロード元の記録はサーバーの起動時にだけ使う
+    if os.path.exists(database.LOCAL_SOURCE_PATH):
+        os.remove(database.LOCAL_SOURCE_PATH)
+    print(f"Downloaded the remote DB to {args.db}")
+    return True
+
+
+async def publish(args) -> bool:
+    if not await database.publish_db_file_async(args.db, keep_segments=args.keep_segments):
+        return False
+    print(f"Published {args.db} as {database.get_object_store().describe(database.remote_snapshot_name)}")
+    print("Restart the running instances (deploy a new revision) to serve the published DB.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    download_parser = subparsers.add_parser("download", help="download the current remote DB")
+    download_parser.add_argument("db", help="output SQLite DB file (must not exist)")
+    download_parser.set_defaults(func=download)
+    publish_parser = subparsers.add_parser("publish", help="publish a local DB as the new remote base")
+    publish_parser.add_argument("db", help="SQLite DB file to publish")
+    publish_parser.add_argument(
+        "--keep-segments", action="store_true",
+        help="keep change segments newer than the DB (use for a DB obtained with 'download'); by default all are deleted",
+    )
+    publish_parser.set_defaults(func=publish)
+    args = parser.parse_args()
+    if not asyncio.run(args.func(args)):
+        sys.exit(1)
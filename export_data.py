@@ -0,0 +1,68 @@
+"""
+購入履歴 (商品名・カテゴリ付き) を NDJSON / CSV / Parquet のファイルにエクスポートする。
+
+GET /export/purchases と同じ形式で、件数によらず一定のメモリで書き出す。
+出力したファイルは import_data.py --export-file でそのまま読み込める。
+
+使い方 (プロジェクトルートから):
+    python export_data.py --format csv --output purchases.csv
+    python export_data.py --format parquet --output user1.parquet --user-id 1 --start-date 2025-01-01
+    python export_data.py --format ndjson --output - | head   # 標準出力へ
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+# backendディレクトリを直接インポートパスに追加
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, 'backend')
+sys.path.append(backend_dir)
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import database
+import export
+
+
+async def main(args) -> None:
+    if not os.path.exists(args.db):
+        print(f"Error: Database file '{args.db}' not found.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        encoder = export.get_encoder(args.format)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    statement = export.export_statement(user_id=args.user_id, start_date=args.start_date, end_date=args.end_date)
+
+    writer, reader = database.create_engines(args.db)
+    ReadSession = async_sessionmaker(bind=reader, expire_on_commit=False)
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    written = 0
+    t0 = time.perf_counter()
+    try:
+        async with ReadSession() as db:
+            async for chunk in export.export_chunks(db, encoder, statement, chunk_rows=args.chunk_rows):
+                output.write(chunk)
+                written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        await writer.dispose()
+        await reader.dispose()
+    print(f"Exported {written} bytes ({args.format}) to {args.output} in {time.perf_counter() - t0:.1f}s.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="backend/shopping_app.db", help="SQLite DB file (default: backend/shopping_app.db)")
+    parser.add_argument("--format", choices=list(export.EXPORT_ENCODERS), default="ndjson")
+    parser.add_argument("--output", required=True, help="output file ('-' for stdout)")
+    parser.add_argument("--user-id", type=int, help="export only this user's purchases")
+    parser.add_argument("--start-date", type=date.fromisoformat, help="first purchase date to include (YYYY-MM-DD)")
+    parser.add_argument("--end-date", type=date.fromisoformat, help="last purchase date to include (YYYY-MM-DD)")
+    parser.add_argument("--chunk-rows", type=int, default=export.EXPORT_CHUNK_ROWS, help="rows fetched and encoded per chunk")
+    asyncio.run(main(parser.parse_args()))
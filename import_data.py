@@ -1,10 +1,30 @@
+"""
+Cloud SQL からエクスポートしたCSV (users.csv, products.csv, purchase_history.csv) をSQLiteのDBにインポートする。
+
+使い方 (プロジェクトルートから):
+    python import_data.py                       # 1行ずつ merge する (従来の方法、少量のデータ向け)
+    python import_data.py --bulk --workers 2    # 一括インポート (数百万行向け)
+    python import_data.py --export-file purchases.parquet   # export_data.py で書き出したファイルを読み込む
+
+--bulk では、CSVを chunk-size 行ずつ読み込み、INSERT ... ON CONFLICT DO UPDATE を executemany で
+まとめて実行し、チャンクごとにコミットする。読み込みの間は二次インデックスを削除しておき、最後に作り直す。
+チャンクごとの進捗をチェックポイントファイルに書き出すので、途中で失敗しても同じコマンドを再実行すれば続きから再開する。
+--export-file も同じ方法で購入履歴を読み込み、DBにない商品はファイルの商品名・カテゴリで作成する。
+エクスポートにはユーザーが含まれないので、DBにないユーザーの購入履歴は読み込まずに警告する (先に users.csv をインポートしておく)。
+"""
+import argparse
 import os
 import sys
 import csv
+import itertools
 import json
-from sqlalchemy import create_engine
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import date, datetime
 # backendディレクトリを直接インポートパスに追加
 current_dir = os.path.dirname(os.path.abspath(__file__))
 backend_dir = os.path.join(current_dir, 'backend')
@@ -36,10 +56,10 @@ USERS_CSV = f'{DATA_DIR}/users.csv'
 PRODUCTS_CSV = f'{DATA_DIR}/products.csv'
 PURCHASE_HISTORY_CSV = f'{DATA_DIR}/purchase_history.csv'
 
-def import_users(db_session):
+def import_users(db_session, path=USERS_CSV):
     print("Importing users...")
     try:
-        with open(USERS_CSV, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             reader = csv.reader(f)
             # gcloud sql export csv はデフォルトでヘッダーなし
             # next(reader) # ヘッダー行をスキップしない
@@ -61,16 +81,16 @@ def import_users(db_session):
         db_session.commit()
         print(f"{count} users imported.")
     except FileNotFoundError:
-        print(f"Error: {USERS_CSV} not found. Please export data first.")
+        print(f"Error: {path} not found. Please export data first.")
     except Exception as e:
         print(f"Error importing users: {e}")
         db_session.rollback()
         raise # エラーを再送出して処理を中断
 
-def import_products(db_session):
+def import_products(db_session, path=PRODUCTS_CSV):
     print("Importing products...")
     try:
-        with open(PRODUCTS_CSV, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             reader = csv.reader(f)
             # next(reader) # ヘッダー行をスキップしない
             count = 0
@@ -93,16 +113,16 @@ def import_products(db_session):
         db_session.commit()
         print(f"{count} products imported.")
     except FileNotFoundError:
-        print(f"Error: {PRODUCTS_CSV} not found. Please export data first.")
+        print(f"Error: {path} not found. Please export data first.")
     except Exception as e:
         print(f"Error importing products: {e}")
         db_session.rollback()
         raise
 
-def import_purchase_history(db_session):
+def import_purchase_history(db_session, path=PURCHASE_HISTORY_CSV):
     print("Importing purchase history...")
     try:
-        with open(PURCHASE_HISTORY_CSV, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             reader = csv.reader(f)
             # next(reader) # ヘッダー行をスキップしない
             count = 0
@@ -129,30 +149,451 @@ def import_purchase_history(db_session):
         db_session.commit()
         print(f"{count} purchase history records imported.")
     except FileNotFoundError:
-        print(f"Error: {PURCHASE_HISTORY_CSV} not found. Please export data first.")
+        print(f"Error: {path} not found. Please export data first.")
     except Exception as e:
         print(f"Error importing purchase history: {e}")
         db_session.rollback()
         raise
 
+
+# --- 一括インポート (--bulk) ---
+# インポートする順 (外部キー制約のため、UserとProductを先にインポート)
+BULK_TABLES = ["users", "products", "purchase_history"]
+BULK_CSV_FILES = {"users": "users.csv", "products": "products.csv", "purchase_history": "purchase_history.csv"}
+
+
+def _parse_user_row(row, warnings):
+    if len(row) != 3:
+        warnings.append(f"Warning: Skipping invalid user row: {row}")
+        return None
+    user_id, name, preferences_str = row
+    try:
+        # 空文字列や 'null' 文字列の場合を考慮
+        preferences = json.loads(preferences_str) if preferences_str and preferences_str.lower() != 'null' else None
+    except json.JSONDecodeError:
+        warnings.append(f"Warning: Could not parse preferences for user {user_id}: {preferences_str}")
+        preferences = None
+    return {"id": int(user_id), "name": name, "preferences": preferences}
+
+
+def _parse_product_row(row, warnings):
+    if len(row) != 5:
+        warnings.append(f"Warning: Skipping invalid product row: {row}")
+        return None
+    product_id, name, category, typical_price_str, seasonality = row
+    return {
+        "id": int(product_id),
+        "name": name,
+        "category": category,
+        "typical_price": float(typical_price_str) if typical_price_str else None,
+        "seasonality": seasonality,
+    }
+
+
+def _parse_purchase_history_row(row, warnings):
+    if len(row) != 4:
+        warnings.append(f"Warning: Skipping invalid purchase history row: {row}")
+        return None
+    history_id, user_id, product_id, purchase_date_str = row
+    try:
+        purchase_date = date.fromisoformat(purchase_date_str)
+    except ValueError:
+        warnings.append(f"Warning: Could not parse date for history {history_id}: {purchase_date_str}")
+        return None # 日付が無効な場合はスキップ
+    return {"id": int(history_id), "user_id": int(user_id), "product_id": int(product_id), "purchase_date": purchase_date}
+
+
+def _parse_export_record(record, warnings):
+    """export_data.py / GET /export/purchases の1行 (NDJSONは行の文字列、CSV・Parquetは辞書)"""
+    if isinstance(record, str):
+        record = json.loads(record)
+    purchase_date = record["purchase_date"]
+    if not isinstance(purchase_date, date):
+        purchase_date = date.fromisoformat(purchase_date)
+    return {
+        "id": int(record["id"]),
+        "user_id": int(record["user_id"]),
+        "product_id": int(record["product_id"]),
+        "purchase_date": purchase_date,
+        # CSVでは空の値が空文字列になる
+        "product_name": record.get("product_name") or None,
+        "product_category": record.get("product_category") or None,
+    }
+
+
+BULK_ROW_PARSERS = {
+    "users": _parse_user_row,
+    "products": _parse_product_row,
+    "purchase_history": _parse_purchase_history_row,
+    "purchase_export": _parse_export_record,
+}
+
+
+def parse_chunk(parser_name, rows):
+    """読み込んだ行のチャンクを、INSERT に渡す辞書のリストに変換する (ワーカープロセスでも実行する)"""
+    parse_row = BULK_ROW_PARSERS[parser_name]
+    parsed = []
+    warnings = []
+    for row in rows:
+        try:
+            values = parse_row(row, warnings)
+        except (KeyError, TypeError, ValueError) as e:
+            warnings.append(f"Warning: Skipping invalid {parser_name} row: {row} ({e!r})")
+            continue
+        if values is not None:
+            parsed.append(values)
+    return parsed, warnings
+
+
+def _parsed_chunks(parser_name, raw_chunks, executor, max_pending):
+    """
+    (チャンクの行数, parse_chunk の結果) を読み込み順に返す。
+    ワーカープロセスを使う場合も、先読みするチャンクは max_pending 個までにしてメモリを抑える
+    """
+    if executor is None:
+        for raw in raw_chunks:
+            yield len(raw), parse_chunk(parser_name, raw)
+        return
+    pending = deque()
+    for raw in raw_chunks:
+        pending.append((len(raw), executor.submit(parse_chunk, parser_name, raw)))
+        if len(pending) >= max_pending:
+            count, future = pending.popleft()
+            yield count, future.result()
+    while pending:
+        count, future = pending.popleft()
+        yield count, future.result()
+
+
+class Checkpoint:
+    """
+    一括インポートの進捗 (テーブルごとに読み込み済みのCSVの行数と、削除した二次インデックスの定義)。
+    チャンクをコミットするたびに書き出すので、再実行するとコミット済みの行を読み飛ばして続きから再開する
+    """
+
+    def __init__(self, path, db_path, source):
+        """source: 読み込むCSVのディレクトリ、またはエクスポートファイル"""
+        self.path = path
+        self.data = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("db") != os.path.abspath(db_path) or data.get("source") != os.path.abspath(source):
+                raise ValueError(f"Checkpoint {path} was written for another database or input. "
+                                 "Remove it (or use --restart) to start over.")
+            self.data = data
+        self.resumed = self.data is not None
+        if self.data is None:
+            self.data = {"db": os.path.abspath(db_path), "source": os.path.abspath(source), "tables": {}, "dropped_indexes": {}}
+
+    def table(self, table_name):
+        return self.data["tables"].setdefault(table_name, {"records": 0, "rows": 0, "skipped": 0, "done": False})
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def drop_secondary_indexes(engine, table_names, checkpoint):
+    """
+    読み込むテーブルの二次インデックスを削除する (定義は先にチェックポイントへ保存し、再開時も作り直せるようにする)。
+    一意インデックスは制約を兼ねるので残す
+    """
+    dropped = checkpoint.data["dropped_indexes"]
+    placeholders = ", ".join(f":t{i}" for i in range(len(table_names)))
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})"),
+            {f"t{i}": name for i, name in enumerate(table_names)},
+        )
+        for name, sql in result:
+            if not sql.lstrip().upper().startswith("CREATE UNIQUE"):
+                dropped[name] = sql
+    checkpoint.save()
+    with engine.begin() as conn:
+        for name in dropped:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+    return list(dropped)
+
+
+def rebuild_indexes(engine, checkpoint):
+    """drop_secondary_indexes で削除したインデックスを作り直す"""
+    dropped = checkpoint.data["dropped_indexes"]
+    with engine.begin() as conn:
+        existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        for name, sql in dropped.items():
+            if name not in existing:
+                conn.execute(text(sql))
+    dropped.clear()
+    checkpoint.save()
+
+
+def _csv_records(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        # gcloud sql export csv はデフォルトでヘッダーなし
+        yield from csv.reader(f)
+
+
+EXPORT_FILE_FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".parquet": "parquet"}
+
+
+def _export_file_records(path, file_format, batch_size):
+    """エクスポートファイルの行を順に返す (NDJSONは行の文字列のまま返し、parse_chunk で解析する)"""
+    if file_format == "ndjson":
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line
+    elif file_format == "csv":
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f) # 1行目は列名
+    elif file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Importing Parquet files requires pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"Unsupported export file format: {file_format}")
+
+
+def _upsert_statement(table):
+    """既存IDがあれば更新、なければ挿入する (merge と同じ結果)"""
+    statement = sqlite_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={column.name: statement.excluded[column.name] for column in table.columns if column.name != "id"},
+    )
+
+
+def _upsert_writer(table):
+    """行をそのまま upsert する登録関数 (登録しなかった行はないので 0 を返す)"""
+    statement = _upsert_statement(table)
+
+    def write(conn, rows):
+        conn.execute(statement, rows)
+        return 0
+
+    return write
+
+
+def _export_rows_writer():
+    """
+    エクスポートファイルの行を登録する関数。商品は存在しない場合だけ名前・カテゴリで作成する (既存の商品は変更しない)。
+    エクスポートにはユーザーが含まれないので、DBにないユーザー (と、DBになく名前もない商品) の行は登録せずに警告し、
+    登録しなかった行数を返す (先に users.csv をインポートしておくこと)
+    """
+    users_table = Base.metadata.tables["users"]
+    products_table = Base.metadata.tables["products"]
+    insert_products = sqlite_insert(products_table).on_conflict_do_nothing(index_elements=[products_table.c.id])
+    upsert_purchases = _upsert_statement(Base.metadata.tables["purchase_history"])
+    # DBにあるユーザー・商品のID (最初のチャンクで読み込み、作成した商品を追加していく)
+    known = {}
+
+    def write(conn, rows):
+        if not known:
+            known["users"] = set(conn.execute(select(users_table.c.id)).scalars())
+            known["products"] = set(conn.execute(select(products_table.c.id)).scalars())
+        products = {
+            row["product_id"]: {"id": row["product_id"], "name": row["product_name"], "category": row["product_category"]}
+            for row in rows if row["product_name"] is not None and row["product_id"] not in known["products"]
+        }
+        if products:
+            conn.execute(insert_products, list(products.values()))
+            known["products"].update(products)
+        valid = [row for row in rows if row["user_id"] in known["users"] and row["product_id"] in known["products"]]
+        if len(valid) < len(rows):
+            missing = []
+            for label, column in (("users", "user_id"), ("products", "product_id")):
+                ids = sorted({row[column] for row in rows} - known[label])
+                if ids:
+                    missing.append(f"{label} {', '.join(map(str, ids[:10]))}{f' and {len(ids) - 10} more' if len(ids) > 10 else ''}")
+            print(f"Warning: Skipping {len(rows) - len(valid)} purchase rows that refer to missing {' and '.join(missing)}."
+                  + (" Import users.csv first." if missing[0].startswith("users") else ""))
+        if valid:
+            conn.execute(upsert_purchases, [
+                {"id": row["id"], "user_id": row["user_id"], "product_id": row["product_id"], "purchase_date": row["purchase_date"]}
+                for row in valid
+            ])
+        return len(rows) - len(valid)
+
+    return write
+
+
+def bulk_import_table(engine, table_name, source, records, parser_name, write, checkpoint,
+                      chunk_size, executor, max_pending, report_interval):
+    """records を chunk-size 行ずつ解析し、write でまとめて登録する (チャンクごとにコミット)。write は登録しなかった行数を返す"""
+    state = checkpoint.table(table_name)
+    if state["done"]:
+        print(f"[{table_name}] already imported ({state['rows']} rows), skipping.")
+        return
+
+    print(f"Importing {table_name} from {source}" + (f" (resuming after {state['records']} records)" if state["records"] else "") + "...")
+    started_at = time.perf_counter()
+    last_report = started_at
+    imported = 0
+    # コミット済みの行は読み飛ばす
+    records = itertools.islice(records, state["records"], None)
+    raw_chunks = iter(lambda: list(itertools.islice(records, chunk_size)), [])
+    for count, (rows, warnings) in _parsed_chunks(parser_name, raw_chunks, executor, max_pending):
+        for warning in warnings:
+            print(warning)
+        not_written = 0
+        if rows:
+            with engine.begin() as conn:
+                not_written = write(conn, rows) # executemany
+        state["records"] += count
+        state["rows"] += len(rows) - not_written
+        state["skipped"] += count - len(rows) + not_written
+        checkpoint.save()
+        imported += len(rows) - not_written
+        now = time.perf_counter()
+        if now - last_report >= report_interval:
+            print(f"[{table_name}] {state['rows']} rows ({imported / (now - started_at):.0f} rows/s)")
+            last_report = now
+    state["done"] = True
+    checkpoint.save()
+    elapsed = time.perf_counter() - started_at
+    print(f"{state['rows']} {table_name} rows imported ({state['skipped']} skipped) "
+          f"in {elapsed:.1f}s ({imported / elapsed if elapsed > 0 else 0:.0f} rows/s).")
+
+
+def bulk_import(db_path, data_dir=None, export_file=None, export_format=None, chunk_size=50000, workers=0,
+                checkpoint_path=None, restart=False, rebuild_indexes_after=True, report_interval=5.0):
+    """
+    --bulk モードの本体。data_dir のCSV (users, products, purchase_history)、
+    または export_data.py で書き出したファイル (export_file) を読み込む
+    """
+    source = export_file or data_dir
+    checkpoint_path = checkpoint_path or db_path + ".import-checkpoint.json"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path, db_path, source)
+    if checkpoint.resumed:
+        print(f"Resuming from checkpoint: {checkpoint_path}")
+
+    bulk_engine = create_engine(f"sqlite:///{db_path}", echo=False)
+
+    @event.listens_for(bulk_engine, "connect")
+    def set_bulk_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA cache_size=-262144") # 256MiB (インデックスの作り直しでのソート用)
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        # 存在しないユーザー・商品を参照する行をエラーにする (SQLiteは既定で外部キー制約を検査しない)
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    # (テーブル名, 読み込み元, 行のイテレータ, 解析関数名, 登録関数)
+    jobs = []
+    if export_file:
+        export_format = export_format or EXPORT_FILE_FORMATS.get(os.path.splitext(export_file)[1].lower())
+        if export_format is None:
+            raise ValueError(f"Cannot tell the format of {export_file}; pass --export-format.")
+        records = _export_file_records(export_file, export_format, chunk_size)
+        jobs.append(("purchase_history", export_file, records, "purchase_export", _export_rows_writer()))
+    else:
+        for table_name in BULK_TABLES:
+            path = os.path.join(data_dir, BULK_CSV_FILES[table_name])
+            if not os.path.exists(path):
+                print(f"Warning: {path} not found, skipping {table_name}.")
+                continue
+            jobs.append((table_name, path, _csv_records(path), table_name, _upsert_writer(Base.metadata.tables[table_name])))
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    try:
+        if rebuild_indexes_after:
+            dropped = drop_secondary_indexes(bulk_engine, [job[0] for job in jobs], checkpoint)
+            if dropped:
+                print(f"Dropped secondary indexes for the load: {', '.join(dropped)}")
+        for table_name, job_source, records, parser_name, write in jobs:
+            bulk_import_table(
+                bulk_engine, table_name, job_source, records, parser_name, write, checkpoint, chunk_size, executor,
+                max_pending=2 * max(workers, 1), report_interval=report_interval,
+            )
+        if checkpoint.data["dropped_indexes"]:
+            print("Rebuilding indexes...")
+            t0 = time.perf_counter()
+            rebuild_indexes(bulk_engine, checkpoint)
+            print(f"Indexes rebuilt in {time.perf_counter() - t0:.1f}s.")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        bulk_engine.dispose()
+    # すべて完了したらチェックポイントは不要
+    checkpoint.remove()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="backend/shopping_app.db", help="SQLite DB file (default: backend/shopping_app.db)")
+    parser.add_argument("--data-dir", default=DATA_DIR, help=f"directory with the exported CSV files (default: {DATA_DIR})")
+    parser.add_argument("--bulk", action="store_true", help="stream the CSVs in chunks with batched upserts (for large imports)")
+    parser.add_argument("--export-file", help="import a file written by export_data.py / GET /export/purchases (implies --bulk)")
+    parser.add_argument("--export-format", choices=["ndjson", "csv", "parquet"], help="format of --export-file (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows per batch/commit in --bulk mode")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes for parsing in --bulk mode (0: parse in this process)")
+    parser.add_argument("--checkpoint", help="checkpoint file for --bulk mode (default: <db>.import-checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start over")
+    parser.add_argument("--keep-indexes", action="store_true", help="do not drop and rebuild secondary indexes in --bulk mode")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between progress lines in --bulk mode")
+    args = parser.parse_args()
+
+    if args.export_file:
+        args.bulk = True
+        if not os.path.exists(args.export_file):
+            print(f"Error: Export file '{args.export_file}' not found.")
+            exit(1)
     # データエクスポートディレクトリが存在するか確認
-    if not os.path.exists(DATA_DIR):
-        print(f"Error: Data export directory '{DATA_DIR}' not found.")
+    elif not os.path.exists(args.data_dir):
+        print(f"Error: Data export directory '{args.data_dir}' not found.")
         print("Please run the gcloud export commands first and place CSV files in this directory.")
         exit(1)
 
+    if args.bulk:
+        # このスクリプト実行前に alembic upgrade head でDBファイルが作成されている前提
+        if not os.path.exists(args.db):
+            print(f"Error: Database file '{args.db}' not found. Run 'alembic upgrade head' first.")
+            exit(1)
+        try:
+            print("Starting bulk data import...")
+            t0 = time.perf_counter()
+            bulk_import(
+                args.db, data_dir=args.data_dir, export_file=args.export_file, export_format=args.export_format,
+                chunk_size=args.chunk_size, workers=args.workers,
+                checkpoint_path=args.checkpoint, restart=args.restart,
+                rebuild_indexes_after=not args.keep_indexes, report_interval=args.report_interval,
+            )
+            print(f"\nData import completed successfully in {time.perf_counter() - t0:.1f}s!")
+            print(f"Data imported into: {args.db}")
+            print(f"Next step: Publish it to your Cloud Storage bucket with 'python db_snapshot.py publish {args.db}'.")
+        except Exception as e:
+            print(f"\nAn error occurred during data import: {e}")
+            print("Import process stopped. Run the same command again to resume from the checkpoint.")
+            exit(1)
+        exit(0)
+
+    if args.db != "backend/shopping_app.db":
+        engine = create_engine(f"sqlite:///{args.db}", echo=False)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        DATABASE_URL = f"sqlite:///{args.db}"
+
     db = SessionLocal()
     try:
         print("Starting data import...")
         # 外部キー制約のため、UserとProductを先にインポート
-        import_users(db)
-        import_products(db)
-        import_purchase_history(db)
+        import_users(db, os.path.join(args.data_dir, 'users.csv'))
+        import_products(db, os.path.join(args.data_dir, 'products.csv'))
+        import_purchase_history(db, os.path.join(args.data_dir, 'purchase_history.csv'))
         print("\nData import completed successfully!")
         print(f"Data imported into: {DATABASE_URL}")
         print("Please verify the data using a tool like DB Browser for SQLite.")
-        print(f"Next step: Upload '{os.path.basename(DATABASE_URL)}' to your Cloud Storage bucket.")
+        print(f"Next step: Publish it to your Cloud Storage bucket with 'python db_snapshot.py publish {args.db}'.")
     except Exception as e:
         print(f"\nAn error occurred during data import: {e}")
         print("Import process stopped.")
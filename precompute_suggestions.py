@@ -0,0 +1,225 @@
+"""
+全ユーザーの商品提案をLLMで事前に生成し、提案キャッシュ (suggestion_cache テーブル) に保存するバッチ。
+
+/suggest と同じ手順でプロンプトとキャッシュキーを作るので、ここで生成した提案は
+履歴・モデル・季節が変わらず有効期限 (SUGGESTION_CACHE_TTL_SECONDS) 内であれば、/suggest からすぐに返される。
+有効なキャッシュがあるユーザーはスキップするため、途中で止めても再実行すれば続きから生成する。
+
+--db ではローカルのDBファイルに保存するだけで、Cloud Run のサーバーが使うDBには反映されない。
+本番のキャッシュを温めるには --service で稼働中のサービスの URL を指定する: DBには書き込まず、
+ユーザーごとに GET /suggest/{user_id} を呼び出して、サービス自身に提案を生成・キャッシュさせる
+(サービスのDBへの書き込みとして、通常どおりアップロードされる。サービスの LLM_PROVIDER / LLM_MODEL で生成される)。
+対象のユーザーは --users か --db のDBから読む (本番のユーザー一覧は db_snapshot.py download で取得できる)。
+サービスの SUGGESTION_LLM_TIMEOUT_SECONDS 内に生成が終わらなかったユーザーは、サービスが生成を続けて後からキャッシュする。
+
+使い方 (プロジェクトルートから):
+    python precompute_suggestions.py --db backend/shopping_app.db --concurrency 4
+    python db_snapshot.py download work.db   # 本番のユーザー一覧を取得する
+    python precompute_suggestions.py --db work.db --service https://SERVICE_URL --concurrency 4
+    python precompute_suggestions.py --llm-provider fake   # APIを呼ばずに偽のLLMで動作確認する
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# backendディレクトリを直接インポートパスに追加
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.join(current_dir, 'backend')
+sys.path.append(backend_dir)
+
+import httpx
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import database
+import llm_interface
+import models
+import suggestions
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.generated = 0
+        self.skipped = 0 # 有効なキャッシュがあった
+        self.pending = 0 # --service: 時間内に生成が終わらなかった (サービスが生成を続ける)
+        self.failed = 0
+        self.llm_seconds = 0.0
+        self.started_at = time.perf_counter()
+
+    @property
+    def done(self) -> int:
+        return self.generated + self.skipped + self.pending + self.failed
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{self.done}/{self.total} users "
+            f"(generated {self.generated}, skipped {self.skipped}, pending {self.pending}, failed {self.failed}) "
+            f"in {elapsed:.1f}s, {rate:.2f} users/s"
+        )
+
+
+async def precompute_user(user_id: int, ReadSession, WriteSession, force: bool, progress: Progress) -> None:
+    try:
+        async with ReadSession() as db:
+            prompt, season, cache_key = await suggestions.build_prompt(db, user_id)
+            if not force and await suggestions.get_cached(db, user_id, cache_key) is not None:
+                progress.skipped += 1
+                return
+        t0 = time.perf_counter()
+        suggestion_text = await llm_interface.agenerate_suggestions(user_prompt=prompt)
+        progress.llm_seconds += time.perf_counter() - t0
+        if not suggestion_text:
+            print(f"Warning: LLM returned no suggestions for user {user_id}.")
+            progress.failed += 1
+            return
+        # ユーザーごとにコミットするので、中断しても生成済みの提案は残る
+        async with WriteSession() as db:
+            await suggestions.save(db, user_id, cache_key, season, suggestion_text)
+        progress.generated += 1
+    except Exception as e:
+        print(f"Error precomputing suggestions for user {user_id}: {e}")
+        progress.failed += 1
+
+
+async def precompute_user_via_service(user_id: int, client: httpx.AsyncClient, progress: Progress) -> None:
+    try:
+        t0 = time.perf_counter()
+        response = await client.get(f"/suggest/{user_id}")
+        response.raise_for_status()
+        result = response.json()
+        if result.get("cached"):
+            progress.skipped += 1
+        elif result.get("fallback"):
+            progress.pending += 1
+        else:
+            progress.llm_seconds += time.perf_counter() - t0
+            progress.generated += 1
+    except Exception as e:
+        print(f"Error precomputing suggestions for user {user_id}: {e}")
+        progress.failed += 1
+
+
+async def report_progress(progress: Progress, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        print(f"[progress] {progress.line()}")
+
+
+async def load_user_ids(args, ReadSession) -> list[int]:
+    """--users のユーザー (指定がなければDBの全ユーザー)"""
+    if args.users:
+        return [int(user_id) for user_id in args.users.split(",")]
+    async with ReadSession() as db:
+        return list((await db.execute(select(models.User.id).order_by(models.User.id))).scalars())
+
+
+async def run_all(user_ids: list[int], worker, args) -> Progress:
+    """worker(user_id, progress) を最大 --concurrency 件ずつ並行に実行する"""
+    progress = Progress(total=len(user_ids))
+    reporter = asyncio.create_task(report_progress(progress, args.report_interval))
+    # 同時に実行するLLM呼び出しをセマフォで制限する (タスクも同時実行数分しか作らない)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+    for user_id in user_ids:
+        await semaphore.acquire()
+        task = asyncio.create_task(worker(user_id, progress))
+        task.add_done_callback(lambda _: semaphore.release())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    reporter.cancel()
+
+    print(f"\nDone: {progress.line()}")
+    if progress.generated:
+        print(f"Mean LLM latency: {progress.llm_seconds / progress.generated:.2f}s, "
+              f"throughput: {progress.generated / (time.perf_counter() - progress.started_at):.2f} suggestions/s")
+    return progress
+
+
+async def precompute_local(args) -> Progress:
+    """--db のDBの提案キャッシュに直接保存する"""
+    writer, reader = database.create_engines(args.db)
+    ReadSession = async_sessionmaker(bind=reader, expire_on_commit=False)
+    WriteSession = async_sessionmaker(bind=writer, expire_on_commit=False)
+    try:
+        async with ReadSession() as db:
+            if not await db.run_sync(lambda session: inspect(session.connection()).has_table(models.SuggestionCache.__tablename__)):
+                print(f"Error: Table suggestion_cache does not exist in '{args.db}'. Run 'alembic upgrade head' on the DB first.")
+                sys.exit(1)
+            # 「そろそろ買う時期の商品」をプロンプトに含めるため、購入周期の予測を構築しておく
+            count = await crud.load_purchase_models(db)
+        user_ids = await load_user_ids(args, ReadSession)
+        print(f"Loaded {count} purchases. Precomputing suggestions for {len(user_ids)} users "
+              f"(provider={llm_interface.get_model_info()[0]}, concurrency={args.concurrency})...")
+        return await run_all(
+            user_ids, lambda user_id, progress: precompute_user(user_id, ReadSession, WriteSession, args.force, progress), args
+        )
+    finally:
+        await writer.dispose()
+        await reader.dispose()
+
+
+async def precompute_via_service(args) -> Progress:
+    """稼働中のサービスの /suggest を呼び出して、サービスに提案を生成・キャッシュさせる"""
+    _, reader = database.create_engines(args.db)
+    try:
+        user_ids = await load_user_ids(args, async_sessionmaker(bind=reader, expire_on_commit=False))
+    finally:
+        await reader.dispose()
+    print(f"Precomputing suggestions for {len(user_ids)} users through {args.service} (concurrency={args.concurrency})...")
+    # サービス側のLLMのタイムアウト (SUGGESTION_LLM_TIMEOUT_SECONDS) より長く待つ
+    async with httpx.AsyncClient(base_url=args.service.rstrip("/"), timeout=args.request_timeout) as client:
+        return await run_all(user_ids, lambda user_id, progress: precompute_user_via_service(user_id, client, progress), args)
+
+
+async def main(args) -> None:
+    if args.service:
+        if args.force:
+            print("Error: --force cannot be used with --service (the service returns a fresh cached suggestion as is).")
+            sys.exit(1)
+        if not args.users and not os.path.exists(args.db):
+            print(f"Error: Database file '{args.db}' not found. Pass --users, or download the DB with 'python db_snapshot.py download {args.db}'.")
+            sys.exit(1)
+        progress = await precompute_via_service(args)
+        if progress.pending:
+            print(f"{progress.pending} users did not finish within the service's LLM timeout; "
+                  f"the service caches them when done (re-run to check).")
+        if progress.failed:
+            sys.exit(1)
+        return
+
+    if suggestions.SUGGESTION_CACHE_TTL_SECONDS <= 0:
+        print("Error: SUGGESTION_CACHE_TTL_SECONDS is 0 (suggestion cache disabled); nothing to precompute.")
+        sys.exit(1)
+    if not os.path.exists(args.db):
+        print(f"Error: Database file '{args.db}' not found.")
+        sys.exit(1)
+    if args.llm_provider:
+        llm_interface.LLM_PROVIDER = args.llm_provider
+
+    try:
+        await precompute_local(args)
+        print(f"Suggestions stored in the suggestion_cache table of: {args.db}")
+        print("(This file is local only. Use --service to precompute suggestions in the DB served by Cloud Run.)")
+    finally:
+        await llm_interface.close_llm_service()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="backend/shopping_app.db", help="local SQLite DB file (default: backend/shopping_app.db)")
+    parser.add_argument("--service", help="URL of the running service; precompute through its /suggest endpoint instead of writing to --db")
+    parser.add_argument("--request-timeout", type=float, default=120.0, help="with --service, seconds to wait for each /suggest response")
+    parser.add_argument("--concurrency", type=int, default=4, help="max concurrent LLM calls")
+    parser.add_argument("--users", help="comma-separated user ids (default: all users)")
+    parser.add_argument("--force", action="store_true", help="regenerate even if a fresh cached suggestion exists")
+    parser.add_argument("--llm-provider", help="override LLM_PROVIDER (e.g. 'fake' for testing)")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between progress lines")
+    asyncio.run(main(parser.parse_args()))